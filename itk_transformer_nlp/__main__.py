@@ -0,0 +1,41 @@
+"""Command line entry point of the scripts
+
+The arguments are parsed and validated before PyTorch, `transformers` and
+`datasets` are imported, so `--help` and argument errors are returned
+without the import overhead of several seconds. The script module is only
+imported if the arguments are valid.
+
+Usage:
+    python3 -m itk_transformer_nlp qa data/squad_sample.jsonl --batch-size 8
+    python3 -m itk_transformer_nlp cola --num-epochs 2
+    python3 -m itk_transformer_nlp download squad data/squad_sample.jsonl --sample-size 10
+"""
+
+from argparse import ArgumentParser, REMAINDER
+from importlib import import_module
+
+from itk_transformer_nlp.cli_args import get_qa_args, get_hucola_training_args, get_dataset_args
+
+#  The argument parser, the script module and its main function of each command
+COMMANDS = {
+    "qa": (get_qa_args, "itk_transformer_nlp.transformer_qa", "main"),
+    "cola": (get_hucola_training_args, "itk_transformer_nlp.encoder_cola", "main"),
+    "download": (get_dataset_args, "itk_transformer_nlp.download_dataset", "write_dataset")
+}
+
+
+def main() -> None:
+    """Main function"""
+    parser = ArgumentParser(prog="python3 -m itk_transformer_nlp",
+                            description="Run a script. Use `<command> --help` to get the arguments of a script")
+    parser.add_argument("command", choices=COMMANDS,
+                        help="`qa`: QA inference, `cola`: fine-tuning on HuCoLA, `download`: downloading a dataset")
+    parser.add_argument("args", nargs=REMAINDER, help="The arguments of the script")
+    command_args = parser.parse_args()
+    get_args, module_name, main_name = COMMANDS[command_args.command]
+    args = get_args(command_args.args, prog=f"{parser.prog} {command_args.command}")
+    getattr(import_module(module_name), main_name)(args)
+
+
+if __name__ == "__main__":
+    main()
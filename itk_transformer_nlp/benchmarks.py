@@ -0,0 +1,213 @@
+"""Offline micro-benchmarks of the QA and CoLA hot paths
+
+The benchmarks use the tiny randomly initialized models of `tiny_models.py`
+and synthetic data, so they do not download anything. Each function is
+timed with every combination of the specified batch sizes and sequence
+lengths, and the results are written in JSON format.
+
+Functions that contain unsolved exercises fail. Their errors are recorded
+in the results instead of their timings.
+
+Usage:
+    python3 -m itk_transformer_nlp.benchmarks --output benchmarks.json
+"""
+
+import json
+import platform
+import random
+import re
+import statistics
+import sys
+from argparse import ArgumentParser, Namespace
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+
+import torch
+import transformers
+import datasets
+from datasets import Dataset
+from transformers import get_scheduler
+
+from itk_transformer_nlp.cli_args import check_positive_int
+from itk_transformer_nlp.encoder_cola import tokenize_single_sent_dataset
+from itk_transformer_nlp.qa_spans import DEFAULT_TOP_K
+from itk_transformer_nlp.tiny_models import create_tiny_bart, create_tiny_bert
+from itk_transformer_nlp.transformer_qa import (
+    tokenize_dataset,
+    extract_answer,
+    decode_bart_input,
+    clean_decoded_batch,
+    get_predictions
+)
+
+_WORDS = ("the", "capital", "of", "england", "is", "london", "this", "sentence", "correct",
+          "not", "a", "river", "flows", "through", "city", "in", "year", "days", "there", "are")
+
+
+def time_function(func: Callable[[], Any], repeats: int, warmup: int = 1) -> Dict[str, float]:
+    """Time a function
+
+    Args:
+        func: The function to time. It is called without arguments
+        repeats: The number of timed calls
+        warmup: The number of calls before the timed calls. Defaults to `1`
+
+    Returns:
+        The median, the minimal and the mean wall time in seconds
+    """
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeats):
+        start_time = perf_counter()
+        func()
+        times.append(perf_counter() - start_time)
+    return {"median_s": statistics.median(times), "min_s": min(times), "mean_s": statistics.mean(times)}
+
+
+def get_synthetic_texts(num_texts: int, num_words: int, seed: int = 42) -> List[str]:
+    """Create texts of random words"""
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(_WORDS, k=num_words)) for _ in range(num_texts)]
+
+
+def run_benchmarks(
+        batch_sizes: List[int],
+        seq_lengths: List[int],
+        num_examples: int,
+        repeats: int,
+        model_dir: str
+) -> List[Dict[str, Any]]:
+    """Time the hot paths with every combination of batch sizes and sequence lengths
+
+    Args:
+        batch_sizes: The batch sizes
+        seq_lengths: The maximal sequence lengths in tokens
+        num_examples: The number of examples in the datasets
+        repeats: The number of timed calls of each function
+        model_dir: A directory where the tiny models are saved
+
+    Returns:
+        A list of results. Each result is a `dict` with the keys `name`, `batch_size`,
+        `seq_length`, `num_examples` and either the timings (see `time_function`) and
+        `examples_per_second` or `error`
+    """
+    bart_tokenizer, bart_model = create_tiny_bart(f"{model_dir}/bart")
+    bert_tokenizer, bert_model = create_tiny_bert(f"{model_dir}/bert")
+    qa_dataset = Dataset.from_dict({
+        "question": get_synthetic_texts(num_examples, 8, seed=1),
+        "context": get_synthetic_texts(num_examples, max(seq_lengths), seed=2)
+    })
+    cola_dataset = Dataset.from_dict({
+        "sentence": get_synthetic_texts(num_examples, max(seq_lengths) // 2, seed=3),
+        "labels": [i % 2 for i in range(num_examples)]
+    })
+    cleaning_pattern = re.compile(
+        "|".join([bart_tokenizer.cls_token, bart_tokenizer.pad_token, bart_tokenizer.sep_token]))
+    results = []
+    for batch_size in batch_sizes:
+        for seq_length in seq_lengths:
+            input_ids = torch.randint(4, len(bart_tokenizer), (batch_size, seq_length))
+            start_scores, end_scores = torch.randn(2, batch_size, seq_length)
+            cola_batch = next(iter(tokenize_single_sent_dataset(
+                cola_dataset, "sentence", "labels", bert_tokenizer, batch_size, seq_length)))
+            optimizer = torch.optim.AdamW(bert_model.parameters(), lr=1e-6, weight_decay=1e-6)
+            lr_scheduler = get_scheduler("linear", optimizer, num_warmup_steps=0,
+                                         num_training_steps=repeats + 1)
+            benchmarks = {
+                "tokenize_dataset": (num_examples, lambda: list(tokenize_dataset(
+                    qa_dataset, ("question", "context"), bart_tokenizer, batch_size, seq_length))),
+                "tokenize_dataset[dynamic_padding]": (num_examples, lambda: list(tokenize_dataset(
+                    qa_dataset, ("question", "context"), bart_tokenizer, batch_size, seq_length,
+                    dynamic_padding=True))),
+                "tokenize_single_sent_dataset": (num_examples, lambda: list(tokenize_single_sent_dataset(
+                    cola_dataset, "sentence", "labels", bert_tokenizer, batch_size, seq_length))),
+                "extract_answer": (batch_size, lambda: extract_answer(
+                    input_ids, start_scores, end_scores, bart_tokenizer.pad_token_id)),
+                "decode_bart_input+clean_decoded_batch": (batch_size, lambda: clean_decoded_batch(
+                    decode_bart_input(input_ids, bart_tokenizer), cleaning_pattern)),
+                "get_predictions": (num_examples, lambda: list(get_predictions(
+                    bart_model, tokenize_dataset(qa_dataset, ("question", "context"), bart_tokenizer,
+                                                 batch_size, seq_length, dynamic_padding=True),
+                    bart_tokenizer, span_top_k=DEFAULT_TOP_K))),
+                "fine_tune_for_classification[step]": (batch_size, lambda: run_training_step(
+                    bert_model, optimizer, lr_scheduler, cola_batch))
+            }
+            for name, (num_timed_examples, func) in benchmarks.items():
+                result = {"name": name, "batch_size": batch_size, "seq_length": seq_length,
+                          "num_examples": num_timed_examples}
+                try:
+                    result.update(time_function(func, repeats))
+                    result["examples_per_second"] = num_timed_examples / result["median_s"]
+                except Exception as error:  # pylint: disable=broad-except
+                    result["error"] = f"{type(error).__name__}: {error}"
+                results.append(result)
+    return results
+
+
+def run_training_step(
+        model: torch.nn.Module,
+        optimizer: torch.optim.Optimizer,
+        lr_scheduler: Any,
+        batch: Dict[str, torch.Tensor]
+) -> None:
+    """Run a single step of the training loop of `fine_tune_for_classification`.
+    The accuracy is not logged, as loading the metric would require a download
+    """
+    model.train()
+    outputs = model(**batch)
+    outputs.loss.backward()
+    optimizer.step()
+    lr_scheduler.step()
+    optimizer.zero_grad()
+
+
+def get_environment() -> Dict[str, Any]:
+    """Get the library versions and the hardware settings that the results depend on"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "datasets": datasets.__version__,
+        "num_threads": torch.get_num_threads()
+    }
+
+
+def get_benchmark_args() -> Namespace:
+    """Get command line arguments"""
+    parser = ArgumentParser(description="Offline micro-benchmarks of the QA and CoLA hot paths")
+    parser.add_argument("--batch-sizes", dest="batch_sizes", type=check_positive_int, nargs="+",
+                        default=[1, 8, 32], help="Batch sizes. Defaults to `[1, 8, 32]`")
+    parser.add_argument("--seq-lengths", dest="seq_lengths", type=check_positive_int, nargs="+",
+                        default=[64, 256], help="Maximal sequence lengths. Defaults to `[64, 256]`")
+    parser.add_argument("--num-examples", dest="num_examples", type=check_positive_int, default=64,
+                        help="The number of examples in the datasets. Defaults to 64")
+    parser.add_argument("--repeats", type=check_positive_int, default=5,
+                        help="The number of timed calls of each function. Defaults to 5")
+    parser.add_argument("--output", help="Optional. Path to the output JSON file. "
+                                         "If not specified, the results are printed")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Main function"""
+    args = get_benchmark_args()
+    datasets.disable_progress_bar()
+    #  Truncation warnings would be logged for every batch
+    transformers.logging.set_verbosity_error()
+    with TemporaryDirectory() as model_dir:
+        results = run_benchmarks(args.batch_sizes, args.seq_lengths, args.num_examples, args.repeats, model_dir)
+    report = json.dumps({"environment": get_environment(), "results": results}, indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(report + "\n")
+    print(f"{sum('error' in result for result in results)} of {len(results)} benchmarks failed",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
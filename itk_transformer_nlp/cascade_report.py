@@ -0,0 +1,64 @@
+"""Compare cascade QA inference with running the large QA model on every example
+
+The script calculates the SQuAD exact match and F1 scores and the throughput
+of the large model alone and of the cascade with each screening threshold on
+a SQuAD sample (e.g. the one downloaded with `download_dataset.py`), then
+prints the scores, the routing rates and the differences from the large
+model in JSON format. Lower thresholds route fewer examples to the large
+model, which is faster but may be less accurate.
+"""
+
+import json
+from argparse import ArgumentParser, Namespace
+from functools import partial
+
+from transformers import AutoModelForQuestionAnswering, BartForQuestionAnswering, BartTokenizer
+
+from itk_transformer_nlp.cli_args import check_float_interval, check_positive_int, DEFAULT_SCREENING_THRESHOLD
+from itk_transformer_nlp.qa_cascade import ScreeningCascade
+from itk_transformer_nlp.quantization_report import evaluate_on_squad
+from itk_transformer_nlp.transformer_qa import load_jsonl_dataset
+
+
+def get_cascade_report_args() -> Namespace:
+    """Get command line arguments"""
+    parser = ArgumentParser(description="Compare cascade QA inference with the large QA model")
+    parser.add_argument("dataset", type=load_jsonl_dataset,
+                        help="Path to the jsonlines SQuAD dataset file")
+    parser.add_argument("screening_model",
+                        help="The identifier or the path of the screening model. It should use the same "
+                             "tokenizer as the large model")
+    parser.add_argument("--model-name", dest="model_name", default="a-ware/bart-squadv2",
+                        help="The identifier of the large model. Defaults to `a-ware/bart-squadv2`")
+    parser.add_argument("--thresholds", nargs="+",
+                        type=partial(check_float_interval, interval=(0., 1.), interval_type="closed"),
+                        default=[DEFAULT_SCREENING_THRESHOLD],
+                        help=f"The screening thresholds to compare. Defaults to {DEFAULT_SCREENING_THRESHOLD}")
+    parser.add_argument("--max-seq-length", dest="max_seq_length", type=check_positive_int, default=256,
+                        help="Maximal sequence length in tokens. Defaults to 256")
+    parser.add_argument("--batch-size", dest="batch_size", type=check_positive_int, default=2,
+                        help="Batch size used to process data. Defaults to 2")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Main function: print an accuracy-delta and routing rate report in JSON format"""
+    args = get_cascade_report_args()
+    tokenizer = BartTokenizer.from_pretrained(args.model_name)
+    model = BartForQuestionAnswering.from_pretrained(args.model_name)
+    screening_model = AutoModelForQuestionAnswering.from_pretrained(args.screening_model)
+    report = {"large_model": evaluate_on_squad(model, args.dataset, tokenizer, args.batch_size, args.max_seq_length)}
+    for threshold in args.thresholds:
+        cascade = ScreeningCascade(screening_model, threshold)
+        scores = evaluate_on_squad(model, args.dataset, tokenizer, args.batch_size, args.max_seq_length,
+                                   cascade=cascade)
+        report[f"cascade_{threshold}"] = {
+            **scores,
+            "routing_rate": cascade.stats()["routing_rate"],
+            "delta": {key: scores[key] - report["large_model"][key] for key in report["large_model"]}
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
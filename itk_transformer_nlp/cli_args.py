@@ -0,0 +1,307 @@
+"""Command line arguments of the scripts
+
+Importing PyTorch, `transformers` and `datasets` takes several seconds.
+This module only depends on the standard library, so the arguments of the
+scripts can be parsed and validated before the heavy libraries are imported.
+The constants that the parsers use as default values are defined here as
+well, the modules that use them import them from here.
+
+Run the scripts through `python3 -m itk_transformer_nlp` (see `__main__.py`)
+to get argument errors and `--help` without the import overhead.
+"""
+
+from argparse import ArgumentParser, ArgumentTypeError, FileType, Namespace
+from functools import partial
+from pathlib import Path
+from typing import Literal, Optional, Sequence, Tuple, Union
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "itk_transformer_nlp"
+DEFAULT_MAX_ANSWER_LENGTH = 30
+DEFAULT_RETRIEVAL_TOP_K = 5
+DEFAULT_SCREENING_THRESHOLD = 0.5
+OUTPUT_FORMATS = ("jsonl", "parquet")
+COMPRESSIONS = ("gzip", "zstd")
+
+
+def check_positive_int(input_int: Union[str, int]) -> int:
+    """Check if `input_int` is a positive integer.
+    If it is, return it as an `int`. Raise `TypeError` otherwise
+    """
+    input_int = int(input_int)
+    if input_int <= 0:
+        raise ValueError(f"A positive integer is expected, got {input_int}")
+    return input_int
+
+
+def add_qa_inference_args(parser: ArgumentParser) -> ArgumentParser:
+    """Add the command line arguments that configure tokenization and the model to a parser"""
+    parser.add_argument("--max-seq-length", dest="max_seq_length", type=check_positive_int, default=256,
+                        help="Maximal sequence length in tokens. If a sequence is longer, "
+                             "it will be truncated. Defaults to 256")
+    parser.add_argument("--dynamic-padding", dest="dynamic_padding", action="store_true",
+                        help="Specify this flag to group examples of similar length into the same batch "
+                             "and pad each batch only to its longest sequence")
+    parser.add_argument("--doc-stride", dest="doc_stride", type=check_positive_int,
+                        help="Optional. If specified, long contexts will not be truncated but split into "
+                             "overlapping windows of at most `--max-seq-length` tokens. This is the number "
+                             "of context tokens shared by two consecutive windows")
+    parser.add_argument("--span-top-k", dest="span_top_k", type=check_positive_int,
+                        help="Optional. If specified, answer spans will be found by scoring this many "
+                             "of the best start and end positions jointly")
+    parser.add_argument("--max-answer-length", dest="max_answer_length", type=check_positive_int,
+                        default=DEFAULT_MAX_ANSWER_LENGTH,
+                        help="Maximal answer length in tokens, used together with `--span-top-k` or "
+                             f"`--doc-stride`. Defaults to {DEFAULT_MAX_ANSWER_LENGTH}")
+    parser.add_argument("--offset-mapping", dest="offset_mapping", action="store_true",
+                        help="Specify this flag to slice the answers from the original contexts using "
+                             "the token offsets instead of detokenizing the inputs. "
+                             "This requires a fast tokenizer")
+    parser.add_argument("--fast-tokenizer", dest="fast_tokenizer", action="store_true",
+                        help="Specify this flag to use the fast (Rust-based) tokenizer, `BartTokenizerFast`")
+    parser.add_argument("--mmap-model", dest="mmap_model", action="store_true",
+                        help="Specify this flag to convert the model to safetensors once and load its weights "
+                             "memory-mapped. This lowers the peak memory usage, and processes that load the "
+                             f"same model share its weights. The converted model is saved in `{DEFAULT_CACHE_DIR}`")
+    parser.add_argument("--device",
+                        help="Optional. The device to use, e.g. `cpu` or `cuda:0`. "
+                             "Defaults to the first GPU if there is any and to the CPU otherwise")
+    parser.add_argument("--num-threads", dest="num_threads", type=check_positive_int,
+                        help="Optional. The number of threads used by PyTorch for intra-op parallelism")
+    parser.add_argument("--bf16", action="store_true",
+                        help="Specify this flag to run the model with `bfloat16` autocast")
+    parser.add_argument("--prefetch", type=check_positive_int,
+                        help="Optional. If specified, this many batches are prepared in a background thread "
+                             "while the model runs, and the answers are decoded in another thread")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Specify this flag to call the model once before the actual inference")
+    parser.add_argument("--quantize", choices=["int8"],
+                        help="Optional. Specify `int8` to apply dynamic quantization to the linear layers "
+                             "of the model. The quantized model runs on the CPU")
+    parser.add_argument("--quantized-model-dir", dest="quantized_model_dir", default=DEFAULT_CACHE_DIR,
+                        help="Directory where the quantized weights are cached. "
+                             f"Defaults to `{DEFAULT_CACHE_DIR}`")
+    parser.add_argument("--onnx-model", dest="onnx_model",
+                        help="Optional. Path to the model exported with `onnx_backend.py`. If specified, "
+                             "it is run with ONNX Runtime on the CPU instead of the PyTorch model")
+    return parser
+
+
+def get_qa_args(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None) -> Namespace:
+    """Get and validate the command line arguments of `transformer_qa.py`
+
+    Args:
+        argv: Optional. The arguments to parse. Defaults to `sys.argv[1:]`
+        prog: Optional. The program name in the help message
+
+    Returns:
+        The parsed arguments
+    """
+    parser = ArgumentParser(prog=prog, description="Arguments for QA inference")
+    parser.add_argument("dataset", help="Path to the jsonlines dataset file")
+    parser.add_argument("--model-name", dest="model_name", default="a-ware/bart-squadv2",
+                        help="The model identifier or a directory with a model, e.g. one with a trimmed "
+                             "vocabulary (see `vocab_trimming.py`). Defaults to `a-ware/bart-squadv2`")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Read, tokenize and batch the dataset lazily instead of converting it to an "
+                             "Arrow cache first. Examples are not grouped by length in this case, and "
+                             "`--workers` and `--answer-cache` cannot be used")
+    parser.add_argument("--text-col-names", dest="text_col_names", nargs="+",
+                        default=["question", "context"],
+                        help="Names of the dataset columns that contain the text data. "
+                             "Defaults to `['question', 'context']`")
+    parser.add_argument("--grouped", action="store_true",
+                        help="Each line contains a context and a list of questions about it. Each context is "
+                             "tokenized only once and its questions are put into the same batch if possible. "
+                             "The ID column, if any, should contain a list of question IDs. This cannot be used "
+                             "with `--streaming`, `--doc-stride`, `--offset-mapping`, `--max-tokens` or "
+                             "`--answer-cache`")
+    parser.add_argument("--retrieval-index", dest="retrieval_index",
+                        help="Optional. A directory with a BM25 index of a passage corpus (see `qa_retrieval.py`). "
+                             "If specified, the dataset only needs a question column, the contexts are the "
+                             "best passages of each question and the best answer of them is returned. This "
+                             "cannot be used with `--streaming`, `--grouped` or `--answer-cache`")
+    parser.add_argument("--retrieval-top-k", dest="retrieval_top_k", type=check_positive_int,
+                        default=DEFAULT_RETRIEVAL_TOP_K,
+                        help="The number of passages retrieved for each question. "
+                             f"Defaults to {DEFAULT_RETRIEVAL_TOP_K}")
+    parser.add_argument("--batch-size", dest="batch_size", type=check_positive_int, default=2,
+                        help="Batch size used to process data. Defaults to 2")
+    parser.add_argument("--max-tokens", dest="max_tokens", type=check_positive_int,
+                        help="Optional. If specified, batches are not limited by `--batch-size` but by this "
+                             "number of tokens after padding. Examples are grouped by length if "
+                             "`--dynamic-padding` is also specified")
+    add_qa_inference_args(parser)
+    parser.add_argument("--screening-model", dest="screening_model",
+                        help="Optional. The identifier or the path of a small extractive QA model that uses the "
+                             "same tokenizer. If specified, it screens every example first, and only the "
+                             "examples below `--screening-threshold` or possibly unanswerable ones are run "
+                             "through the large model. The routing rate is printed to the standard error. "
+                             "This cannot be used with `--doc-stride`, `--offset-mapping` or `--workers`")
+    parser.add_argument("--screening-threshold", dest="screening_threshold",
+                        type=partial(check_float_interval, interval=(0., 1.), interval_type="closed"),
+                        default=DEFAULT_SCREENING_THRESHOLD,
+                        help="The confidence (the product of the largest start and end probabilities) below "
+                             "which examples are routed to the large model. Defaults to "
+                             f"{DEFAULT_SCREENING_THRESHOLD}")
+    parser.add_argument("--screening-position-offset", dest="screening_position_offset", type=int,
+                        choices=(0, 1),
+                        help="Optional. `1` if the screening model predicts the first and the last answer "
+                             "token, `0` if it predicts the tokens before them, as `bart-squadv2` does. "
+                             "If not specified, it is `0` for BART models and `1` for other models")
+    parser.add_argument("--workers", type=check_positive_int, default=1,
+                        help="The number of worker processes. If it is greater than 1, the dataset is split "
+                             "into contiguous shards that are processed in parallel on the CPU, and the threads "
+                             "(see `--num-threads`) are split evenly between the workers. Defaults to 1")
+    parser.add_argument("--output", dest="output",
+                        help="Optional. Path to an output file where a record with the example ID, the answer, "
+                             "its character offsets and its score is written for each example. Use `-` for the "
+                             "standard output. If not specified, the triplets are printed as plain text")
+    parser.add_argument("--output-format", dest="output_format", choices=OUTPUT_FORMATS, default="jsonl",
+                        help="The format of the output file. Defaults to `jsonl`")
+    parser.add_argument("--output-compression", dest="output_compression", choices=COMPRESSIONS,
+                        help="Optional. The compression of the output file")
+    parser.add_argument("--id-col", dest="id_col", default="id",
+                        help="The name of the dataset column that contains the example IDs. If the dataset "
+                             "does not contain it, the positions of the examples are used. Defaults to `id`")
+    parser.add_argument("--tokenization-cache", dest="tokenization_cache",
+                        help="Optional. A directory where tokenized datasets are cached, so that they are not "
+                             "tokenized again in later runs. It is used with `--dynamic-padding`, "
+                             "`--doc-stride` or `--offset-mapping`")
+    parser.add_argument("--timing", choices=["json", "prometheus"],
+                        help="Optional. If specified, the time of data loading, the forward pass, answer "
+                             "extraction and decoding and the throughput are reported in this format")
+    parser.add_argument("--timing-output", dest="timing_output",
+                        help="Optional. Path to the timing report. Defaults to the standard error")
+    parser.add_argument("--answer-cache", dest="answer_cache",
+                        help="Optional. Path to an SQLite database file where answers are cached. "
+                             "The answers of cached question-context pairs are not predicted again")
+    parser.add_argument("--answer-cache-size", dest="answer_cache_size", type=check_positive_int,
+                        default=100_000, help="The maximal number of cached answers. If the cache is full, "
+                                              "the least recently used answers are evicted. Defaults to 100000")
+    args = parser.parse_args(argv)
+    if args.streaming and (args.workers > 1 or args.answer_cache is not None):
+        parser.error("Streaming cannot be used together with several workers or the answer cache")
+    if args.timing is not None and args.workers > 1:
+        parser.error("Timing is not supported with several workers")
+    if args.onnx_model is not None and (args.quantize is not None or args.workers > 1):
+        parser.error("The ONNX model cannot be quantized or used by several workers")
+    if args.mmap_model and (args.quantize is not None or args.onnx_model is not None):
+        parser.error("Only the PyTorch model without quantization can be memory-mapped")
+    if args.grouped and (args.streaming or args.doc_stride is not None or args.offset_mapping
+                         or args.max_tokens is not None or args.answer_cache is not None):
+        parser.error("Grouped questions cannot be streamed, split into windows, sliced with offset mappings, "
+                     "batched by a token budget or cached")
+    if args.screening_model is not None and (args.doc_stride is not None or args.offset_mapping
+                                             or args.workers > 1):
+        parser.error("The screening model cannot be used with context windows, offset mappings or several workers")
+    if args.retrieval_index is not None and (args.streaming or args.grouped or args.answer_cache is not None):
+        parser.error("Retrieval cannot be used together with streaming, grouped questions or the answer cache")
+    return args
+
+
+def check_model_save_dir(model_dir: str) -> str:
+    """Check if the input is valid path for model saving"""
+    model_path = Path(model_dir)
+    if not model_path.parent.exists():
+        raise ArgumentTypeError(
+            f"Invalid path: parent directory of {model_dir} does not exist.")
+    if model_path.is_file():
+        raise ArgumentTypeError(
+            f"Invalid path: {model_dir} is a file.")
+    return model_dir
+
+
+def check_float_interval(
+        number: Union[str, float, int],
+        interval: Tuple[float, float],
+        interval_type: Literal["open", "closed", "left_closed", "right_closed"]
+) -> float:
+    """Check if a `float` is in a specified interval
+
+    Args:
+        number: The number to check.
+        interval: A tuple of two floats that define the interval start and end.
+        interval_type: One of `'open'`, `'closed'`, `'left_closed'`, `'right_closed'`.
+            It refers to whether the interval start and end value should be accepted.
+    """
+    number = float(number)
+    start, end = interval
+    if interval_type == "open":
+        is_correct = start < number < end
+    elif interval_type == "closed":
+        is_correct = start <= number <= end
+    elif interval_type == "left_closed":
+        is_correct = start <= number < end
+    elif interval_type == "right_closed":
+        is_correct = start < number <= end
+    else:
+        raise ValueError(f"Unknown interval type: {interval_type}")
+    if not is_correct:
+        raise ArgumentTypeError(f"{number} is not in the {interval_type} interval "
+                                f"between {start} and {end}")
+    return number
+
+
+def get_hucola_training_args(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None) -> Namespace:
+    """Get command line arguments of `encoder_cola.py`. See `get_qa_args` for `argv` and `prog`"""
+    parser = ArgumentParser(
+        prog=prog, description="Get command line arguments for fine-tuning huBERT on HuCoLA")
+    parser.add_argument("--batch-size", dest="batch_size", type=check_positive_int,
+                        default=8, help="Training batch size. Defaults to `8`.")
+    parser.add_argument("--max-tokens", dest="max_tokens", type=check_positive_int,
+                        help="Optional. If specified, batches are not limited by "
+                             "`--batch-size` but by this number of tokens after "
+                             "padding. The order of the examples is kept.")
+    parser.add_argument("--max-seq-length", dest="max_seq_length", type=check_positive_int,
+                        default=128, help="Maximum sequence length above which inputs "
+                                          "will be truncated. Defaults to `128`.")
+    parser.add_argument("--num-epochs", dest="num_epochs", type=check_positive_int,
+                        default=2, help="Number of training epochs. Defaults to `2`.")
+    parser.add_argument("--lr", type=partial(check_float_interval, interval=(0., 1.),
+                                             interval_type="open"), default=1e-6,
+                        help="Learning rate parameter, a `float` between 0 and 1. "
+                             "Defaults to `1e-6`.")
+    parser.add_argument("--weight-decay", dest="weight_decay", default=1e-6,
+                        type=partial(check_float_interval, interval=(0., 1.),
+                                     interval_type="left_closed"),
+                        help="Weight_decay parameter, a `float` between 0 and 1. "
+                             "Defaults to `1e-6`.")
+    parser.add_argument("--model-save-path", dest="model_save_path", type=check_model_save_dir,
+                        help="Optional. Path to a directory where the model will be saved. "
+                             "If not specified, the fine-tuned model will not be saved!")
+    parser.add_argument("--hucola-sent-col", dest="hucola_sent_col", default="Sent",
+                        help="Sentence column name in the `HuCoLA` dataset. Override the "
+                             "default value only if you made sure that the column name "
+                             "changed (it is not `'Sent'` anymore). Defaults to `'Sent'`.")
+    parser.add_argument("--hucola-label-col", dest="hucola_label_col", default="Label",
+                        help="Label column name in the `HuCoLA` dataset. Override the "
+                             "default value only if you made sure that the column name "
+                             "changed (it is not `'Label'` anymore). Defaults to `'Label'`.")
+    parser.add_argument("--fast-tokenizer", dest="fast_tokenizer", action="store_true",
+                        help="Specify this flag to use the fast (Rust-based) tokenizer, "
+                             "`BertTokenizerFast`.")
+    parser.add_argument("--mmap-model", dest="mmap_model", action="store_true",
+                        help="Specify this flag to convert the pre-trained model to "
+                             "safetensors once and load its weights memory-mapped, "
+                             "which lowers the peak memory usage.")
+    parser.add_argument("--tokenization-cache", dest="tokenization_cache",
+                        help="Optional. A directory where the tokenized datasets "
+                             "are cached, so that they are not tokenized again "
+                             "in later runs.")
+    return parser.parse_args(argv)
+
+
+def get_dataset_args(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None) -> Namespace:
+    """Get command line arguments of `download_dataset.py`. See `get_qa_args` for `argv` and `prog`"""
+    parser = ArgumentParser(prog=prog, description="Command line arguments for downloading a dataset")
+    parser.add_argument("dataset_name", help="Name of the dataset")
+    parser.add_argument("target_path", type=FileType("wb"), help="Path to the file where the dataset will be written")
+    parser.add_argument("--sub-dataset", dest="sub_dataset",
+                        help="Optional. Name of the sub-dataset, e.g. CoLA in GLUE")
+    parser.add_argument("--split", choices=["train", "validation", "test"], default="train",
+                        help="Dataset split to use, `train`, `validation` or `test`. Defaults to `train`")
+    parser.add_argument("--shuffle", action="store_true", help="Specify this flag if the dataset should be shuffled")
+    parser.add_argument("--sample-size", dest="sample_size", type=check_positive_int,
+                        help="Optional. Get only the first `--sample-size` elements of the dataset. "
+                             "This means random sampling if used together with the `--shuffle` flag")
+    return parser.parse_args(argv)
@@ -17,10 +17,8 @@ HuCoLA URL: https://huggingface.co/datasets/NYTK/HuCOLA
 huBERT URL: https://huggingface.co/SZTAKI-HLT/hubert-base-cc
 """
 
-from argparse import ArgumentParser, Namespace, ArgumentTypeError
-from pathlib import Path
-from typing import Tuple, Dict, Any, Optional, Union, Literal
-from functools import partial
+from argparse import Namespace
+from typing import Tuple, Dict, Any, Optional, Union
 
 from tqdm import tqdm
 import torch
@@ -31,91 +29,22 @@ from datasets import (
 )
 from transformers import (
     BertTokenizer,
-    PreTrainedTokenizer,
+    BertTokenizerFast,
+    PreTrainedTokenizerBase,
     BertForSequenceClassification,
     BatchEncoding,
     get_scheduler
 )
 from transformers.trainer_utils import SchedulerType
 
-from itk_transformer_nlp.transformer_qa import check_positive_int
-
-
-def check_model_save_dir(model_dir: str) -> str:
-    """Check if the input is valid path for model saving"""
-    model_path = Path(model_dir)
-    if not model_path.parent.exists():
-        raise ArgumentTypeError(
-            f"Invalid path: parent directory of {model_dir} does not exist.")
-    if model_path.is_file():
-        raise ArgumentTypeError(
-            f"Invalid path: {model_dir} is a file.")
-    return model_dir
-
-
-def check_float_interval(
-        number: Union[str, float, int],
-        interval: Tuple[float, float],
-        interval_type: Literal["open", "closed", "left_closed", "right_closed"]
-) -> float:
-    """Check if a `float` is in a specified interval
-
-    Args:
-        number: The number to check.
-        interval: A tuple of two floats that define the interval start and end.
-        interval_type: One of `'open'`, `'closed'`, `'left_closed'`, `'right_closed'`.
-            It refers to whether the interval start and end value should be accepted.
-    """
-    number = float(number)
-    start, end = interval
-    if interval_type == "open":
-        is_correct = start < number < end
-    elif interval_type == "closed":
-        is_correct = start <= number <= end
-    elif interval_type == "left_closed":
-        is_correct = start <= number < end
-    elif interval_type == "right_closed":
-        is_correct = start < number <= end
-    else:
-        raise ValueError(f"Unknown interval type: {interval_type}")
-    if not is_correct:
-        raise ArgumentTypeError(f"{number} is not in the {interval_type} interval "
-                                f"between {start} and {end}")
-    return number
-
-
-def get_hucola_training_args() -> Namespace:
-    """Get command line arguments"""
-    parser = ArgumentParser(
-        description="Get command line arguments for fine-tuning huBERT on HuCoLA")
-    parser.add_argument("--batch-size", dest="batch_size", type=check_positive_int,
-                        default=8, help="Training batch size. Defaults to `8`.")
-    parser.add_argument("--max-seq-length", dest="max_seq_length", type=check_positive_int,
-                        default=128, help="Maximum sequence length above which inputs "
-                                          "will be truncated. Defaults to `128`.")
-    parser.add_argument("--num-epochs", dest="num_epochs", type=check_positive_int,
-                        default=2, help="Number of training epochs. Defaults to `2`.")
-    parser.add_argument("--lr", type=partial(check_float_interval, interval=(0., 1.),
-                                             interval_type="open"), default=1e-6,
-                        help="Learning rate parameter, a `float` between 0 and 1. "
-                             "Defaults to `1e-6`.")
-    parser.add_argument("--weight-decay", dest="weight_decay", default=1e-6,
-                        type=partial(check_float_interval, interval=(0., 1.),
-                                     interval_type="left_closed"),
-                        help="Weight_decay parameter, a `float` between 0 and 1. "
-                             "Defaults to `1e-6`.")
-    parser.add_argument("--model-save-path", dest="model_save_path", type=check_model_save_dir,
-                        help="Optional. Path to a directory where the model will be saved. "
-                             "If not specified, the fine-tuned model will not be saved!")
-    parser.add_argument("--hucola-sent-col", dest="hucola_sent_col", default="Sent",
-                        help="Sentence column name in the `HuCoLA` dataset. Override the "
-                             "default value only if you made sure that the column name "
-                             "changed (it is not `'Sent'` anymore). Defaults to `'Sent'`.")
-    parser.add_argument("--hucola-label-col", dest="hucola_label_col", default="Label",
-                        help="Label column name in the `HuCoLA` dataset. Override the "
-                             "default value only if you made sure that the column name "
-                             "changed (it is not `'Label'` anymore). Defaults to `'Label'`.")
-    return parser.parse_args()
+from itk_transformer_nlp.cli_args import get_hucola_training_args
+from itk_transformer_nlp.tokenization_cache import TokenizationCache
+from itk_transformer_nlp.qa_batching import (
+    TokenBudgetBatchSampler,
+    DynamicPaddingCollator,
+    trim_padding
+)
+from itk_transformer_nlp.model_loading import load_mmap_model, report_peak_rss
 
 
 def rename_column(
@@ -153,9 +82,11 @@ def tokenize_single_sent_dataset(
         dataset: Dataset,
         text_col_name: str,
         label_col_name: str,
-        tokenizer: PreTrainedTokenizer,
+        tokenizer: PreTrainedTokenizerBase,
         batch_size: int,
         max_seq_length: Optional[int] = None,
+        tokenization_cache: Optional[TokenizationCache] = None,
+        max_tokens: Optional[int] = None
 ) -> DataLoader:
     """Tokenize a dataset
 
@@ -166,12 +97,19 @@ def tokenize_single_sent_dataset(
             `"attention_mask"` as those are the columns
             returned by the tokenizer.
         label_col_name: The dataset column that contains the labels
-        tokenizer: A pre-trained tokenizer
+        tokenizer: A pre-trained tokenizer. Both slow and fast tokenizers
+            are supported.
         batch_size: Batch size for tokenization
         max_seq_length: Optional. If the number of tokens in a sequence is
             `n` and `n` > `max_seq_length`, the sequence will be truncated.
             This means cutting off the last `n - max_seq_length` tokens.
             If not specified, truncation will not be applied.
+        tokenization_cache: Optional. If specified, the tokenized dataset
+            is loaded from this cache or saved to it.
+        max_tokens: Optional. If specified, the sequences are not padded
+            during tokenization, and the batches are limited by this number
+            of tokens after padding instead of `batch_size`. The order of
+            the examples is kept.
 
     Returns:
          The tokenized dataset as a `DataLoader`
@@ -184,13 +122,36 @@ def tokenize_single_sent_dataset(
     tokenizer_cols = tokenizer("Dummy text", return_token_type_ids=False).keys()
     if text_col_name in tokenizer_cols:
         raise KeyError(f"Invalid text column name: {text_col_name}")
-    tokenizer.model_max_length = max_seq_length
 
+    # The maximal length is passed to the tokenizer instead of setting
+    # `tokenizer.model_max_length`, so the tokenizer is not modified.
     def tok_func(example: Dict[str, Any]) -> BatchEncoding:
-        return tokenizer(example[text_col_name], padding=True, truncation=True,
-                         return_token_type_ids=False)
+        return tokenizer(example[text_col_name], padding=max_tokens is None,
+                         truncation=max_seq_length is not None,
+                         max_length=max_seq_length, return_token_type_ids=False)
 
-    dataset = dataset.map(tok_func, batched=True, batch_size=batch_size)
+    def map_func(data: Dataset) -> Dataset:
+        return data.map(tok_func, batched=True, batch_size=batch_size)
+
+    if tokenization_cache is None:
+        dataset = map_func(dataset)
+    else:
+        # Each batch is padded to its longest sequence,
+        # so the batch size is also a tokenization setting.
+        dataset = tokenization_cache.get_or_tokenize(
+            dataset, tokenizer, map_func, text_col_name=text_col_name,
+            batch_size=batch_size, max_seq_length=max_seq_length,
+            padding=max_tokens is None)
+    if max_tokens is not None:
+        # The batches are padded when they are collated.
+        batch_sampler = TokenBudgetBatchSampler(
+            [len(input_ids) for input_ids in dataset["input_ids"]],
+            max_tokens, sort_by_length=False)
+        dataset.set_format(
+            type="torch", columns=list(tokenizer_cols) + [label_col_name])
+        return DataLoader(
+            dataset, batch_sampler=batch_sampler,
+            collate_fn=DynamicPaddingCollator(tokenizer.pad_token_id))
     dataset.set_format(
         type="torch", columns=list(tokenizer_cols) + [label_col_name])
     return DataLoader(dataset, batch_size=batch_size)
@@ -224,6 +185,9 @@ def _get_loss_log_accuracy(
     Returns:
         The loss as a scalar tensor.
     """
+    # Columns that contain only padding tokens do not change the outputs,
+    # so they are removed before the batch is put on the device.
+    batch, _ = trim_padding(batch)
     batch = {k: v.to(device) for k, v in batch.items()}
     outputs = model(**batch)
     # We get logits from the model, but the metric object needs a concrete
@@ -412,11 +376,17 @@ def fine_tune_for_classification(
     return model.eval()
 
 
-def main() -> None:
-    """Main function"""
+def main(args: Optional[Namespace] = None) -> None:
+    """Main function
+
+    Args:
+        args: Optional. The arguments returned by `get_hucola_training_args`.
+            If not specified, the command line arguments are parsed
+    """
     model_name = "SZTAKI-HLT/hubert-base-cc"
     dataset_name = "NYTK/HuCOLA"
-    args = get_hucola_training_args()
+    if args is None:
+        args = get_hucola_training_args()
 
     # Load the Hungarian CoLA dataset.
     # This is a dataset for a binary classification task:
@@ -445,7 +415,12 @@ def main() -> None:
 
     # As we use a pre-trained model, a tokenizer must already exist.
     # We can simply download it from HuggingFace Hub.
-    tokenizer = BertTokenizer.from_pretrained(model_name)
+    # The fast tokenizer is implemented in Rust and produces the same output.
+    tokenizer_class = BertTokenizerFast if args.fast_tokenizer \
+        else BertTokenizer
+    tokenizer = tokenizer_class.from_pretrained(model_name)
+    tokenization_cache = TokenizationCache(args.tokenization_cache) \
+        if args.tokenization_cache is not None else None
     train_data_loader, val_data_loader = (tokenize_single_sent_dataset(
         dataset=dataset,
         text_col_name=args.hucola_sent_col,
@@ -453,15 +428,22 @@ def main() -> None:
         tokenizer=tokenizer,
         batch_size=args.batch_size,
         max_seq_length=args.max_seq_length,
+        tokenization_cache=tokenization_cache,
+        max_tokens=args.max_tokens
     ) for dataset in (train_dataset, val_dataset))
 
-    # Load the pre-trained model. The classifier head weights will be
-    # initialized randomly.
-    # Use a method of `BertForSequenceClassification` to load the model
-    # and set the number of classes to 2.
-    # Feel free to refer to
-    # https://huggingface.co/docs/transformers/main/en/main_classes/model
-    hu_model = None
+    with report_peak_rss():
+        if args.mmap_model:
+            hu_model = load_mmap_model(
+                BertForSequenceClassification, model_name, num_labels=2)
+        else:
+            # Load the pre-trained model. The classifier head weights will be
+            # initialized randomly.
+            # Use a method of `BertForSequenceClassification` to load the model
+            # and set the number of classes to 2.
+            # Feel free to refer to
+            # https://huggingface.co/docs/transformers/main/en/main_classes/model
+            hu_model = None
     # Fine-tune the model.
     # If everything is all right, both the training and the
     # validation accuracy should be larger than 80% by the
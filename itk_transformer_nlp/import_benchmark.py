@@ -0,0 +1,95 @@
+"""Import time benchmark of the scripts
+
+Each measurement runs a new Python interpreter, so the modules are not
+cached. The script measures how long it takes to import the modules of
+the package and to print the help message of each command of
+`python3 -m itk_transformer_nlp`, and it reports which heavy libraries
+are imported by each module.
+
+Usage:
+    python3 -m itk_transformer_nlp.import_benchmark --output import_times.json
+"""
+
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser, Namespace
+from typing import Any, Dict, List, Sequence
+
+from itk_transformer_nlp.benchmarks import time_function
+from itk_transformer_nlp.cli_args import check_positive_int
+
+HEAVY_MODULES = ("torch", "transformers", "datasets", "pyarrow")
+DEFAULT_MODULES = ("itk_transformer_nlp.cli_args", "itk_transformer_nlp.__main__",
+                   "itk_transformer_nlp.download_dataset", "itk_transformer_nlp.transformer_qa",
+                   "itk_transformer_nlp.encoder_cola")
+DEFAULT_COMMANDS = ("qa", "cola", "download")
+
+
+def get_imported_heavy_modules(module_name: str) -> List[str]:
+    """Get the heavy libraries (see `HEAVY_MODULES`) that are imported together with a module"""
+    code = (f"import sys, json, {module_name}; "
+            f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))")
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def run_import_benchmarks(
+        module_names: Sequence[str] = DEFAULT_MODULES,
+        commands: Sequence[str] = DEFAULT_COMMANDS,
+        repeats: int = 3
+) -> List[Dict[str, Any]]:
+    """Time the imports of modules and the help messages of commands in new interpreters
+
+    Args:
+        module_names: The modules to import. Defaults to `DEFAULT_MODULES`
+        commands: The commands of `python3 -m itk_transformer_nlp`. Defaults to `DEFAULT_COMMANDS`
+        repeats: The number of timed runs of each measurement. Defaults to `3`
+
+    Returns:
+        A list of results. Each result is a `dict` with the keys `name`, the timings
+        (see `time_function`) and `heavy_modules` (only for imported modules)
+    """
+    results = []
+    for module_name in module_names:
+        result = {"name": f"import {module_name}"}
+        result.update(time_function(lambda: subprocess.run(
+            [sys.executable, "-c", f"import {module_name}"], check=True), repeats))
+        result["heavy_modules"] = get_imported_heavy_modules(module_name)
+        results.append(result)
+    for command in commands:
+        result = {"name": f"python3 -m itk_transformer_nlp {command} --help"}
+        result.update(time_function(lambda: subprocess.run(
+            [sys.executable, "-m", "itk_transformer_nlp", command, "--help"],
+            check=True, stdout=subprocess.DEVNULL), repeats))
+        results.append(result)
+    return results
+
+
+def get_import_benchmark_args() -> Namespace:
+    """Get command line arguments"""
+    parser = ArgumentParser(description="Import time benchmark of the scripts")
+    parser.add_argument("--modules", nargs="+", default=list(DEFAULT_MODULES),
+                        help="The modules to import. Defaults to the script modules and `cli_args`")
+    parser.add_argument("--commands", nargs="+", choices=DEFAULT_COMMANDS, default=list(DEFAULT_COMMANDS),
+                        help="The commands whose help message is printed. Defaults to all commands")
+    parser.add_argument("--repeats", type=check_positive_int, default=3,
+                        help="The number of timed runs of each measurement. Defaults to 3")
+    parser.add_argument("--output", help="Optional. Path to the output JSON file. "
+                                         "If not specified, the results are printed")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Main function"""
+    args = get_import_benchmark_args()
+    report = json.dumps(run_import_benchmarks(args.modules, args.commands, args.repeats), indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Write the solutions of a lab into its file or restore the exercises
+
+The solutions and the exercises of the labs are kept in the version history.
+The lab files have been extended since these versions were committed, and
+other modules import the new functions, so the files cannot simply be
+checked out. Instead, the lines that differ between the two versions (i.e.
+the solved or the blanked lines) are replaced in the current file. A changed
+block is found by its surrounding lines if possible, and by its own lines
+otherwise, ignoring the indentation, as the code may have been moved since.
+
+Usage:
+    python3 -m itk_transformer_nlp.lab_solutions itk_transformer_nlp/transformer_qa.py 43cf14c3 b69ae811
+"""
+
+import subprocess
+import sys
+from argparse import ArgumentParser, Namespace
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+#  The lines before the changed lines, the changed lines and the lines after them in the old version,
+#  and the lines that replace the changed lines
+Change = Tuple[List[str], List[str], List[str], List[str]]
+
+
+def get_changes(old_text: str, new_text: str) -> List[Change]:
+    """Get the changed blocks of lines between two versions of a file
+
+    Args:
+        old_text: The old version, e.g. the exercises
+        new_text: The new version, e.g. the solutions
+
+    Returns:
+        The changes with one line of context on both sides
+    """
+    old_lines, new_lines = old_text.splitlines(), new_text.splitlines()
+    return [(old_lines[max(i1 - 1, 0):i1], old_lines[i1:i2], old_lines[i2:i2 + 1], new_lines[j1:j2])
+            for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes()
+            if tag != "equal"]
+
+
+def _find_block(lines: Sequence[str], block: Sequence[str], start: int = 0) -> Optional[int]:
+    """Helper function to find a block of lines, ignoring the indentation. If the block
+    occurs several times, its first position after `start` is returned
+    """
+    stripped_lines = [line.strip() for line in lines]
+    stripped_block = [line.strip() for line in block]
+    positions = [i for i in range(len(lines) - len(block) + 1)
+                 if stripped_lines[i:i + len(block)] == stripped_block]
+    if len(positions) == 1:
+        return positions[0]
+    return next((position for position in positions if position >= start), None)
+
+
+def _get_indent(line: str) -> int:
+    """Helper function to get the indentation of a line"""
+    return len(line) - len(line.lstrip())
+
+
+def apply_change(lines: List[str], change: Change, start: int = 0) -> Tuple[List[str], int]:
+    """Replace the changed lines in a file whose code may have been moved or re-indented
+
+    Args:
+        lines: The lines of the current version of the file
+        change: A change returned by `get_changes`
+        start: If the changed lines occur several times, they are replaced at their first
+            position after this line index, e.g. after the previous change. Defaults to `0`
+
+    Returns:
+        The new lines of the file and the index of the line after the replaced lines.
+        A `ValueError` is raised if the changed lines are not found
+    """
+    before, old_block, after, new_block = change
+    #  Try the context on both sides first, then on one side, then the changed lines alone
+    for context_before, context_after in ((before, after), (before, []), ([], after), ([], [])):
+        block = context_before + old_block + context_after
+        if not block:
+            continue
+        position = _find_block(lines, block, start)
+        if position is not None:
+            break
+    else:
+        raise ValueError("The lines to replace are not found: " + " / ".join(line.strip() for line in old_block))
+    reference_lines = [(old_line, line) for old_line, line in zip(block, lines[position:position + len(block)])
+                       if old_line.strip()]
+    indent_diff = _get_indent(reference_lines[0][1]) - _get_indent(reference_lines[0][0]) \
+        if reference_lines else 0
+    new_lines = [" " * indent_diff + line if indent_diff >= 0 else line[min(-indent_diff, _get_indent(line)):]
+                 for line in new_block]
+    position += len(context_before)
+    return lines[:position] + new_lines + lines[position + len(old_block):], position + len(new_lines)
+
+
+def apply_changes(text: str, changes: Sequence[Change]) -> str:
+    """Apply all changes to the text of a file (see `apply_change`)"""
+    lines, start = text.splitlines(), 0
+    for change in changes:
+        lines, start = apply_change(lines, change, start)
+    return "\n".join(lines) + "\n"
+
+
+def get_file_version(path: str, revision: str) -> str:
+    """Get the content of a file at a revision of the git repository"""
+    return subprocess.run(["git", "show", f"{revision}:./{path}"], check=True, capture_output=True,
+                          text=True).stdout
+
+
+def get_lab_solutions_args() -> Namespace:
+    """Get command line arguments"""
+    parser = ArgumentParser(description="Replace the lines of a lab file that differ between two revisions")
+    parser.add_argument("path", help="Path to the lab file")
+    parser.add_argument("old_revision", help="The revision whose lines are replaced, e.g. the exercises")
+    parser.add_argument("new_revision", help="The revision whose lines are written, e.g. the solutions")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Main function"""
+    args = get_lab_solutions_args()
+    try:
+        changes = get_changes(get_file_version(args.path, args.old_revision),
+                              get_file_version(args.path, args.new_revision))
+    except subprocess.CalledProcessError as error:
+        sys.exit(f"ERROR: The lab file cannot be read from the version history. {error.stderr.strip()}")
+    path = Path(args.path)
+    try:
+        #  The file is only written if every change can be applied
+        path.write_text(apply_changes(path.read_text(encoding="utf-8"), changes), encoding="utf-8")
+    except ValueError as error:
+        sys.exit(f"ERROR: {error}")
+
+
+if __name__ == "__main__":
+    main()
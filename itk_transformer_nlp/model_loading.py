@@ -0,0 +1,166 @@
+"""Memory-mapped loading of pre-trained models
+
+Older versions of `from_pretrained` initialize the model, load the checkpoint
+into memory and copy it into the model, which briefly needs two copies of
+the weights. `load_mmap_model` converts a checkpoint to a single safetensors
+file once, then creates the parameters of the model on the meta device, i.e.
+without allocating memory, and assigns the tensors of the memory-mapped file
+to them. The weights are read from disk when they are first used, and
+processes that load the same file share its pages in the page cache.
+Writing a parameter (e.g. during fine-tuning) copies only the written pages.
+"""
+
+import resource
+import shutil
+import sys
+from contextlib import contextmanager
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, Generator, Optional, Type, TypeVar, Union
+
+import torch
+from safetensors.torch import load_file
+from transformers import AutoConfig, PreTrainedModel
+
+from itk_transformer_nlp.cli_args import DEFAULT_CACHE_DIR
+
+SAFETENSORS_FILE_NAME = "model.safetensors"
+WEIGHT_FILE_PATTERNS = ("*.safetensors", "*.bin", "*.onnx")
+ModelT = TypeVar("ModelT", bound=PreTrainedModel)
+
+
+def get_safetensors_dir(model_name: str, cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR) -> Path:
+    """Get the directory where the converted checkpoint and the configuration of a model are saved"""
+    return Path(cache_dir) / "safetensors" / model_name.replace("/", "--")
+
+
+def get_checkpoint_fingerprint(model_name: str) -> Optional[str]:
+    """Get a hash of a local checkpoint, i.e. of its configuration and the modification
+    time and size of its weight files. It changes when the checkpoint is saved again.
+    `None` is returned if `model_name` is not a local path (e.g. it is a model identifier)
+    """
+    path = Path(model_name)
+    if path.is_file():
+        config_path, weight_paths = None, [path]
+    elif path.is_dir():
+        config_path = path / "config.json"
+        weight_paths = sorted(weight_path for pattern in WEIGHT_FILE_PATTERNS for weight_path in path.glob(pattern))
+    else:
+        return None
+    fingerprint = sha256()
+    if config_path is not None and config_path.is_file():
+        fingerprint.update(config_path.read_bytes())
+    for weight_path in weight_paths:
+        stat = weight_path.stat()
+        fingerprint.update(f"{weight_path.name}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode("utf-8"))
+    return fingerprint.hexdigest()[:16]
+
+
+def get_peak_rss_mib() -> float:
+    """Get the peak resident set size of the current process in MiB"""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #  `ru_maxrss` is in bytes on macOS and in kilobytes elsewhere
+    return peak_rss / 1024 ** 2 if sys.platform == "darwin" else peak_rss / 1024
+
+
+@contextmanager
+def report_peak_rss(description: str = "loading the model") -> Generator[None, None, None]:
+    """Print the peak resident set size before and after the context to the standard error"""
+    peak_rss_before = get_peak_rss_mib()
+    yield
+    print(f"Peak RSS before and after {description}: {peak_rss_before:.0f} MiB, {get_peak_rss_mib():.0f} MiB",
+          file=sys.stderr)
+
+
+@contextmanager
+def _init_empty_weights() -> Generator[None, None, None]:
+    """Helper context manager to move the parameters of new modules to the meta device.
+    Buffers stay on the CPU, as non-persistent buffers are not saved in checkpoints
+    """
+    register_parameter = torch.nn.Module.register_parameter
+
+    def register_empty_parameter(
+            module: torch.nn.Module,
+            name: str,
+            param: Optional[torch.nn.Parameter]
+    ) -> None:
+        register_parameter(module, name, param)
+        if param is not None:
+            module._parameters[name] = torch.nn.Parameter(  # pylint: disable=protected-access
+                param.to("meta"), requires_grad=param.requires_grad)
+
+    torch.nn.Module.register_parameter = register_empty_parameter
+    try:
+        yield
+    finally:
+        torch.nn.Module.register_parameter = register_parameter
+
+
+def convert_to_safetensors(
+        model_class: Type[ModelT],
+        model_name: str,
+        cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR
+) -> Path:
+    """Save a model as a single safetensors file unless it is already converted
+
+    Args:
+        model_class: The model class, e.g. `BartForQuestionAnswering`
+        model_name: The model identifier or the path to the model directory
+        cache_dir: The directory where the converted models are saved. Defaults to `DEFAULT_CACHE_DIR`
+
+    Returns:
+        The directory of the converted model, see `get_safetensors_dir`
+    """
+    model_dir = get_safetensors_dir(model_name, cache_dir)
+    if (model_dir / SAFETENSORS_FILE_NAME).is_file():
+        return model_dir
+    model = model_class.from_pretrained(model_name, low_cpu_mem_usage=True)
+    #  The model is saved to a temporary directory first, so that an interrupted
+    #  conversion does not leave an incomplete checkpoint in the cache
+    temp_dir = model_dir.with_name(model_dir.name + ".tmp")
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    model.save_pretrained(str(temp_dir), safe_serialization=True, max_shard_size="1000GB")
+    shutil.rmtree(model_dir, ignore_errors=True)
+    temp_dir.rename(model_dir)
+    return model_dir
+
+
+def load_mmap_model(
+        model_class: Type[ModelT],
+        model_name: str,
+        cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR,
+        **config_kwargs: Any
+) -> ModelT:
+    """Load a model whose weights are memory-mapped from a safetensors file
+
+    Args:
+        model_class: The model class, e.g. `BartForQuestionAnswering`
+        model_name: The model identifier or the path to the model directory.
+            The checkpoint is converted at the first call, see `convert_to_safetensors`
+        cache_dir: The directory where the converted models are saved. Defaults to `DEFAULT_CACHE_DIR`
+        **config_kwargs: Configuration values to override, e.g. `num_labels`
+
+    Returns:
+        The model in evaluation mode
+    """
+    model_dir = convert_to_safetensors(model_class, model_name, cache_dir)
+    config = AutoConfig.from_pretrained(str(model_dir), **config_kwargs)
+    with _init_empty_weights():
+        model = model_class(config)
+    model_shapes = {key: value.shape for key, value in model.state_dict().items()}
+    #  Weights whose shape differs from the checkpoint (e.g. a classifier head with more classes) are initialized
+    state_dict = {key: value for key, value in load_file(str(model_dir / SAFETENSORS_FILE_NAME)).items()
+                  if model_shapes.get(key, value.shape) == value.shape}
+    model.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+    new_params = [name for name, param in model.named_parameters() if param.is_meta]
+    if new_params:
+        for module in model.modules():
+            for name, param in list(module.named_parameters(recurse=False)):
+                if param.is_meta:
+                    setattr(module, name, torch.nn.Parameter(
+                        torch.empty_like(param, device="cpu"), requires_grad=param.requires_grad))
+        for name in new_params:
+            module_name, _, _ = name.rpartition(".")
+            model._init_weights(model.get_submodule(module_name))  # pylint: disable=protected-access
+    return model.eval()
@@ -0,0 +1,142 @@
+"""ONNX Runtime backend of the QA model
+
+`BartForQuestionAnswering` can be exported to an ONNX graph whose batch and
+sequence axes are dynamic, and the graph can be run with the CPU execution
+provider of ONNX Runtime instead of eager PyTorch. ONNX Runtime fuses and
+folds operators of the graph, which usually makes CPU inference faster.
+
+`OnnxQAModel` is a backend that `get_predictions` accepts instead of the
+PyTorch model. Running it requires the `onnxruntime` package, exporting
+requires the `onnx` package.
+
+Usage:
+    python3 -m itk_transformer_nlp.onnx_backend bart_qa.onnx
+    python3 -m itk_transformer_nlp.transformer_qa data.jsonl --onnx-model bart_qa.onnx
+"""
+
+import inspect
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+import torch
+from transformers import BartForQuestionAnswering
+
+DEFAULT_OPSET_VERSION = 17
+INPUT_NAMES = ("input_ids", "attention_mask")
+OUTPUT_NAMES = ("start_logits", "end_logits")
+
+
+class _LogitsOutput(torch.nn.Module):
+    """A wrapper that returns only the start and end logits of a QA model"""
+
+    def __init__(self, model: BartForQuestionAnswering) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                          use_cache=False, return_dict=False)[:2]
+
+
+def export_onnx_model(
+        model: BartForQuestionAnswering,
+        output_path: Union[str, Path],
+        opset_version: int = DEFAULT_OPSET_VERSION
+) -> None:
+    """Export a QA model to ONNX
+
+    Args:
+        model: A BART model fine-tuned for QA
+        output_path: Path to the output `.onnx` file
+        opset_version: The ONNX opset version. Defaults to `DEFAULT_OPSET_VERSION`
+    """
+    #  The wrapper has to be in evaluation mode as well, otherwise dropout is traced
+    wrapper = _LogitsOutput(model).eval()
+    input_ids = torch.randint(model.config.vocab_size, (2, 16))
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES + OUTPUT_NAMES}
+    #  Newer PyTorch versions (>= 2.5) can export with TorchDynamo, here the TorchScript exporter is used
+    export_kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with torch.inference_mode():
+        torch.onnx.export(wrapper, (input_ids, torch.ones_like(input_ids)), str(output_path),
+                          input_names=list(INPUT_NAMES), output_names=list(OUTPUT_NAMES),
+                          dynamic_axes=dynamic_axes, opset_version=opset_version, **export_kwargs)
+
+
+class OnnxQAModel:
+    """A QA model exported to ONNX and run with ONNX Runtime on the CPU"""
+
+    def __init__(self, model_path: Union[str, Path], num_threads: Optional[int] = None) -> None:
+        """Create an inference session
+
+        Args:
+            model_path: Path to a model exported with `export_onnx_model`
+            num_threads: Optional. The number of threads used for intra-op parallelism.
+                By default, ONNX Runtime uses one thread per physical core
+        """
+        try:
+            import onnxruntime
+        except ImportError as error:
+            raise ImportError("The `onnxruntime` package is required for the ONNX backend") from error
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            session_options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            str(model_path), session_options, providers=["CPUExecutionProvider"])
+        self.input_names = tuple(model_input.name for model_input in self.session.get_inputs())
+
+    def __call__(self, model_inputs: Dict[str, torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Run the model
+
+        Args:
+            model_inputs: The input token IDs and the attention mask as
+                integer tensors of shape `(batch_size, sequence_length)`
+
+        Returns:
+            The start and end logits as `float32` tensors on the CPU
+        """
+        start_logits, end_logits = self.session.run(
+            list(OUTPUT_NAMES), {name: model_inputs[name].cpu().numpy() for name in self.input_names})
+        return torch.from_numpy(start_logits), torch.from_numpy(end_logits)
+
+
+def get_max_logit_difference(
+        model: BartForQuestionAnswering,
+        onnx_model: OnnxQAModel,
+        model_inputs: Dict[str, torch.Tensor]
+) -> float:
+    """Get the largest absolute difference between the logits of the PyTorch and the ONNX models"""
+    with torch.inference_mode():
+        outputs = model.eval()(**model_inputs, return_dict=False)[:2]
+    return max(float((torch_logits - onnx_logits).abs().max())
+               for torch_logits, onnx_logits in zip(outputs, onnx_model(model_inputs)))
+
+
+def get_export_args() -> Namespace:
+    """Get command line arguments"""
+    parser = ArgumentParser(description="Export the QA model to ONNX")
+    parser.add_argument("output", help="Path to the output `.onnx` file")
+    parser.add_argument("--model-name", dest="model_name", default="a-ware/bart-squadv2",
+                        help="The model identifier or the path to the model directory. "
+                             "Defaults to `a-ware/bart-squadv2`")
+    parser.add_argument("--opset-version", dest="opset_version", type=int, default=DEFAULT_OPSET_VERSION,
+                        help=f"The ONNX opset version. Defaults to {DEFAULT_OPSET_VERSION}")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Main function"""
+    args = get_export_args()
+    model = BartForQuestionAnswering.from_pretrained(args.model_name).eval()
+    export_onnx_model(model, args.output, args.opset_version)
+    #  A different shape than the one used for tracing, to check that the axes are dynamic
+    input_ids = torch.randint(model.config.vocab_size, (3, 24))
+    model_inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+    difference = get_max_logit_difference(model, OnnxQAModel(args.output), model_inputs)
+    print(f"Exported to {args.output}, maximal absolute logit difference: {difference:.3g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""Batching utilities for QA inference
+
+Padding every tokenization chunk to its longest sequence wastes a lot of
+computation on padding tokens. The tools in this module tokenize without
+padding, group examples of similar length into the same batch and pad
+each batch only when it is collated.
+
+As the examples are reordered by length, every example carries its
+original position in the column `EXAMPLE_IDX_COL`. The function
+`restore_order` can be used to put the outputs back in input order.
+
+Instead of a fixed number of examples, batches can also be limited by a
+token budget: the number of tokens in a batch after padding, i.e. the
+number of examples times the length of the longest one. This keeps the
+memory usage and the latency of the batches stable regardless of the
+length distribution of the data.
+
+Batches that were padded wider than their longest sequence (e.g. to the
+longest sequence of a larger tokenization chunk) can be trimmed before the
+forward pass with `trim_padding`, and the outputs of the model can be padded
+back to the original width with `restore_padding`.
+"""
+
+import random
+from typing import (
+    Dict, Any, Callable, Sequence, Generator, Iterable, Iterator,
+    List, Optional, Tuple, TypeVar, Union)
+
+import torch
+from torch.nn.utils.rnn import pad_sequence
+from torch.utils.data import DataLoader, Sampler, IterableDataset as TorchIterableDataset
+from datasets import Dataset, IterableDataset
+from transformers import PreTrainedTokenizerBase, BatchEncoding
+
+EXAMPLE_IDX_COL = "example_idx"
+LENGTH_COL = "length"
+#  Columns that can be used to carry the original texts through a `DataLoader`
+QUESTION_COL = "question"
+CONTEXT_COL = "context"
+
+T = TypeVar("T")
+
+
+class LengthBucketBatchSampler(Sampler):
+    """A batch sampler that groups examples of similar length
+
+    Examples are sorted by length and split into batches of
+    `batch_size` consecutive examples. This way each batch needs
+    as little padding as possible.
+    """
+
+    def __init__(
+            self,
+            lengths: Sequence[int],
+            batch_size: int,
+            shuffle: bool = False,
+            seed: int = 42
+    ) -> None:
+        """Initialize the sampler
+
+        Args:
+            lengths: The number of tokens in each example
+            batch_size: The maximal number of examples in a batch
+            shuffle: If `True`, the order of the batches (not the examples
+                within the batches) will be shuffled in every epoch. Defaults to `False`
+            seed: Random seed for shuffling. Defaults to `42`
+        """
+        order = sorted(range(len(lengths)), key=lengths.__getitem__)
+        self._batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+        self._shuffle = shuffle
+        self._seed = seed
+        self._epoch = 0
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batches = list(self._batches)
+        if self._shuffle:
+            random.Random(self._seed + self._epoch).shuffle(batches)
+            self._epoch += 1
+        return iter(batches)
+
+    def __len__(self) -> int:
+        return len(self._batches)
+
+
+def pack_by_token_budget(
+        items: Iterable[T],
+        get_length: Callable[[T], int],
+        max_tokens: int,
+        max_batch_size: Optional[int] = None
+) -> Generator[List[T], None, None]:
+    """Greedily pack consecutive items into batches whose padded size fits a token budget
+
+    Args:
+        items: The items to batch, e.g. example indices or examples
+        get_length: A function that returns the number of tokens of an item
+        max_tokens: The maximal number of tokens in a batch after padding, i.e. the number
+            of items times the length of the longest one. An item that is longer than this
+            forms a batch on its own
+        max_batch_size: Optional. The maximal number of items in a batch
+
+    Returns:
+        A generator of batches, i.e. lists of items, in the order of the items
+    """
+    batch, batch_max_length = [], 0
+    for item in items:
+        length = get_length(item)
+        new_max_length = max(batch_max_length, length)
+        if batch and ((len(batch) + 1) * new_max_length > max_tokens or len(batch) == max_batch_size):
+            yield batch
+            batch, new_max_length = [], length
+        batch.append(item)
+        batch_max_length = new_max_length
+    if batch:
+        yield batch
+
+
+class TokenBudgetBatchSampler(Sampler):
+    """A batch sampler that packs examples into batches of at most `max_tokens` tokens after padding
+
+    If `sort_by_length` is `True`, the examples are sorted by length first,
+    so that the batches need as little padding as possible.
+    """
+
+    def __init__(
+            self,
+            lengths: Sequence[int],
+            max_tokens: int,
+            max_batch_size: Optional[int] = None,
+            sort_by_length: bool = True
+    ) -> None:
+        """Initialize the sampler
+
+        Args:
+            lengths: The number of tokens in each example
+            max_tokens: The maximal number of tokens in a batch after padding
+            max_batch_size: Optional. The maximal number of examples in a batch
+            sort_by_length: If `True`, examples of similar length are packed into the
+                same batch. Otherwise, the original order is kept. Defaults to `True`
+        """
+        order = sorted(range(len(lengths)), key=lengths.__getitem__) if sort_by_length else range(len(lengths))
+        self._batches = list(pack_by_token_budget(order, lengths.__getitem__, max_tokens, max_batch_size))
+
+    def __iter__(self) -> Iterator[List[int]]:
+        return iter(self._batches)
+
+    def __len__(self) -> int:
+        return len(self._batches)
+
+
+class _TokenBudgetBatches(TorchIterableDataset):
+    """Helper class to pack the examples of an iterable dataset into token budget batches in order"""
+
+    def __init__(self, dataset: IterableDataset, input_ids_name: str, max_tokens: int) -> None:
+        self.dataset = dataset
+        self.input_ids_name = input_ids_name
+        self.max_tokens = max_tokens
+
+    def __iter__(self) -> Iterator[List[Dict[str, Any]]]:
+        return pack_by_token_budget(
+            self.dataset, lambda example: len(example[self.input_ids_name]), self.max_tokens)
+
+
+class DynamicPaddingCollator:
+    """Pad a list of examples to the longest sequence in the batch
+
+    Sequence features (e.g. `input_ids`) are right-padded, scalar features
+    (e.g. `EXAMPLE_IDX_COL`) are simply stacked. Features that are not tensors
+    (e.g. the original texts) are collected into lists.
+    """
+
+    def __init__(self, pad_token_id: int, input_ids_name: str = "input_ids") -> None:
+        """Initialize the collator
+
+        Args:
+            pad_token_id: The padding token ID used for the input IDs.
+                Every other sequence feature is padded with `0`
+            input_ids_name: The key that indicates input token IDs. Defaults to `input_ids`
+        """
+        self.pad_token_id = pad_token_id
+        self.input_ids_name = input_ids_name
+
+    def __call__(self, features: List[Dict[str, Any]]) -> Dict[str, Any]:
+        batch = {}
+        for key in features[0].keys():
+            values = [feature[key] for feature in features]
+            if not isinstance(values[0], torch.Tensor):
+                batch[key] = values
+            elif values[0].dim() == 0:
+                batch[key] = torch.stack(values)
+            else:
+                padding_value = self.pad_token_id if key == self.input_ids_name else 0
+                batch[key] = pad_sequence(values, batch_first=True, padding_value=padding_value)
+        return batch
+
+
+def get_column_names(dataset: Union[Dataset, IterableDataset]) -> List[str]:
+    """Get the column names of a dataset
+
+    The features of a streamed JSON file are only known after reading it, so the
+    column names of such an iterable dataset are taken from its first example.
+    """
+    if dataset.column_names is not None:
+        return list(dataset.column_names)
+    return list(next(iter(dataset), {}).keys())
+
+
+def tokenize_without_padding(
+        dataset: Union[Dataset, IterableDataset],
+        text_col_names: Sequence[str],
+        tokenizer: PreTrainedTokenizerBase,
+        batch_size: int,
+        max_seq_length: Optional[int] = None,
+        remove_columns: Optional[List[str]] = None
+) -> Dataset:
+    """Tokenize a dataset without padding. Add the columns `EXAMPLE_IDX_COL`
+    and `LENGTH_COL` that contain the example positions and the sequence lengths
+
+    Args:
+        dataset: The input data as a `datasets.Dataset` or a `datasets.IterableDataset` object
+        text_col_names: The dataset columns that contain the text data
+        tokenizer: A pre-trained tokenizer
+        batch_size: Batch size for tokenization
+        max_seq_length: Optional. If specified, sequences longer than this will be truncated
+        remove_columns: Optional. Dataset columns to remove after tokenization
+
+    Returns:
+        The tokenized dataset
+    """
+
+    def tok_func(example: Dict[str, Any], indices: List[int]) -> BatchEncoding:
+        text_cols = [example[text_col_name] for text_col_name in text_col_names]
+        encoding = tokenizer(*text_cols, truncation=max_seq_length is not None, max_length=max_seq_length)
+        encoding[EXAMPLE_IDX_COL] = indices
+        encoding[LENGTH_COL] = [len(input_ids) for input_ids in encoding["input_ids"]]
+        return encoding
+
+    return dataset.map(tok_func, batched=True, batch_size=batch_size,
+                       with_indices=True, remove_columns=remove_columns)
+
+
+def get_dynamic_padding_loader(
+        dataset: Union[Dataset, IterableDataset],
+        model_input_names: Sequence[str],
+        pad_token_id: int,
+        batch_size: int,
+        extra_cols: Sequence[str] = (EXAMPLE_IDX_COL,),
+        bucket_by_length: bool = True,
+        max_tokens: Optional[int] = None
+) -> DataLoader:
+    """Wrap a tokenized dataset that was not padded with a `DataLoader`
+    that builds dynamically padded batches
+
+    Args:
+        dataset: The tokenized dataset. It should contain the `LENGTH_COL` column
+            if `bucket_by_length` is `True`. If it is a `datasets.IterableDataset`,
+            the examples are batched in their original order
+        model_input_names: Names of the columns that will be passed to the model
+        pad_token_id: The padding token ID
+        batch_size: The maximal number of examples in a batch
+        extra_cols: Further columns to keep in the batches. Defaults to `(EXAMPLE_IDX_COL,)`
+        bucket_by_length: If `True`, examples of similar length will be grouped into the
+            same batch. Otherwise, the original order is kept. Defaults to `True`
+        max_tokens: Optional. If specified, the batches are not limited by `batch_size` but
+            by this number of tokens after padding (see `TokenBudgetBatchSampler`). The dataset
+            should contain the `LENGTH_COL` column unless it is a `datasets.IterableDataset`
+
+    Returns:
+        The data loader
+    """
+    collator = DynamicPaddingCollator(pad_token_id)
+    columns = list(model_input_names) + list(extra_cols)
+    if isinstance(dataset, IterableDataset):
+        #  Examples of an iterable dataset can only be read in order, so they cannot be grouped by length
+        dataset = dataset.select_columns(columns).with_format(type="torch")
+        if max_tokens is not None:
+            return DataLoader(_TokenBudgetBatches(dataset, collator.input_ids_name, max_tokens),
+                              batch_size=None, collate_fn=collator)
+        return DataLoader(dataset, batch_size=batch_size, collate_fn=collator)
+    batch_sampler = None
+    if max_tokens is not None:
+        batch_sampler = TokenBudgetBatchSampler(dataset[LENGTH_COL], max_tokens, sort_by_length=bucket_by_length)
+    elif bucket_by_length:
+        batch_sampler = LengthBucketBatchSampler(dataset[LENGTH_COL], batch_size)
+    dataset.set_format(type="torch", columns=columns)
+    if batch_sampler is not None:
+        return DataLoader(dataset, batch_sampler=batch_sampler, collate_fn=collator)
+    return DataLoader(dataset, batch_size=batch_size, collate_fn=collator)
+
+
+def trim_padding(
+        batch: Dict[str, Any],
+        attention_mask_name: str = "attention_mask"
+) -> Tuple[Dict[str, Any], int]:
+    """Remove the trailing columns that contain only padding tokens from the sequence features of a batch
+
+    The sequence features are the tensors whose first two dimensions are the same
+    as those of the attention mask. The sequences are expected to be right-padded
+
+    Args:
+        batch: A batch as a `dict`
+        attention_mask_name: The key of the attention mask. If the batch does not
+            contain it, the batch is not trimmed. Defaults to `attention_mask`
+
+    Returns:
+        The trimmed batch and the number of padding tokens that were removed
+    """
+    attention_mask = batch.get(attention_mask_name)
+    if attention_mask is None or attention_mask.dim() != 2:
+        return batch, 0
+    batch_size, seq_length = attention_mask.shape
+    is_used = attention_mask.any(dim=0)
+    #  The index after the last column that contains a non-padding token
+    max_length = seq_length - int(torch.argmax(is_used.flip(0).int())) if bool(is_used.any()) else 0
+    if max_length == seq_length:
+        return batch, 0
+    trimmed_batch = {
+        key: value[:, :max_length] if isinstance(value, torch.Tensor) and value.dim() >= 2
+        and value.shape[:2] == attention_mask.shape else value
+        for key, value in batch.items()
+    }
+    return trimmed_batch, batch_size * (seq_length - max_length)
+
+
+def restore_padding(
+        outputs: torch.Tensor,
+        seq_length: int,
+        padding_value: float = float("-inf")
+) -> torch.Tensor:
+    """Pad the outputs of a model that was run on a trimmed batch (see `trim_padding`)
+    back to the original sequence length, so that the positions match the untrimmed batch
+
+    Args:
+        outputs: A tensor of shape `(batch_size, trimmed_length, ...)`, e.g. the start logits
+        seq_length: The sequence length of the untrimmed batch
+        padding_value: The value of the restored positions. Defaults to `-inf`,
+            so that padding positions are never selected as answer positions
+
+    Returns:
+        A tensor of shape `(batch_size, seq_length, ...)`
+    """
+    num_trimmed = seq_length - outputs.shape[1]
+    if num_trimmed <= 0:
+        return outputs
+    padding = outputs.new_full((outputs.shape[0], num_trimmed) + tuple(outputs.shape[2:]), padding_value)
+    return torch.cat((outputs, padding), dim=1)
+
+
+def restore_order(indexed_items: Iterable[Tuple[int, T]]) -> Generator[T, None, None]:
+    """Yield items in the order of their indices
+
+    Items are yielded as soon as all items with smaller indices have been yielded.
+    Indices are expected to be the integers from `0` to `n - 1` without repetition.
+
+    Args:
+        indexed_items: An iterable of `(index, item)` pairs in arbitrary order
+
+    Returns:
+        A generator of the items in index order
+    """
+    buffer = {}
+    next_idx = 0
+    for idx, item in indexed_items:
+        buffer[idx] = item
+        while next_idx in buffer:
+            yield buffer.pop(next_idx)
+            next_idx += 1
+    for idx in sorted(buffer):
+        yield buffer[idx]
@@ -0,0 +1,138 @@
+"""A persistent cache of QA answers
+
+Answers are stored in an SQLite database. The key of an answer is a hash of
+the normalized question and context, the model identifier, the tokenizer
+identifier and the maximal sequence length. Examples whose answers are
+cached are neither tokenized nor passed to the model.
+
+The cache holds at most a fixed number of answers. If it is full, the least
+recently used answers are evicted.
+"""
+
+import sqlite3
+import unicodedata
+from hashlib import sha256
+from pathlib import Path
+from typing import Callable, Dict, Generator, Iterable, Optional, Sequence, Tuple, Union
+
+from datasets import Dataset
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a text for hashing: apply NFC normalization and collapse whitespaces"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class AnswerCache:
+    """A size-bounded LRU cache of QA answers stored in an SQLite database"""
+
+    def __init__(
+            self,
+            path: Union[str, Path],
+            model_id: str,
+            tokenizer_id: str,
+            max_seq_length: Optional[int],
+            max_entries: int = 100_000
+    ) -> None:
+        """Open or create a cache
+
+        Args:
+            path: Path to the SQLite database file
+            model_id: A string that identifies the model. It should also reflect every
+                other setting that affects the answers (e.g. quantization or decoding options)
+            tokenizer_id: A string that identifies the tokenizer
+            max_seq_length: The maximal sequence length used for tokenization
+            max_entries: The maximal number of cached answers. Defaults to `100000`
+        """
+        self._key_prefix = f"{model_id}\0{tokenizer_id}\0{max_seq_length}\0"
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(str(path))
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, answer TEXT, last_used INTEGER)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self._num_entries, last_used = self._connection.execute(
+            "SELECT COUNT(*), MAX(last_used) FROM answers").fetchone()
+        self._clock = last_used or 0
+
+    def __enter__(self) -> "AnswerCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def get_key(self, question: str, context: str) -> str:
+        """Get the cache key of a question-context pair"""
+        key_text = self._key_prefix + normalize_text(question) + "\0" + normalize_text(context)
+        return sha256(key_text.encode("utf-8")).hexdigest()
+
+    def get(self, question: str, context: str) -> Optional[str]:
+        """Get a cached answer. Return `None` if the answer is not cached"""
+        key = self.get_key(question, context)
+        row = self._connection.execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._clock += 1
+        self._connection.execute("UPDATE answers SET last_used = ? WHERE key = ?", (self._clock, key))
+        return row[0]
+
+    def put(self, question: str, context: str, answer: str) -> None:
+        """Cache an answer. Evict the least recently used answers if the cache is full"""
+        self._clock += 1
+        key = self.get_key(question, context)
+        if self._connection.execute("SELECT 1 FROM answers WHERE key = ?", (key,)).fetchone() is None:
+            self._num_entries += 1
+        self._connection.execute(
+            "INSERT OR REPLACE INTO answers (key, answer, last_used) VALUES (?, ?, ?)",
+            (key, answer, self._clock))
+        if self._num_entries > self.max_entries:
+            self._num_entries -= self._connection.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used LIMIT ?)",
+                (self._num_entries - self.max_entries,)).rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """Get the hit and miss counters and the number of cached answers"""
+        return {"hits": self.hits, "misses": self.misses, "entries": self._num_entries}
+
+    def close(self) -> None:
+        """Commit the changes and close the database"""
+        self._connection.commit()
+        self._connection.close()
+
+    def get_predictions(
+            self,
+            dataset: Dataset,
+            text_col_names: Sequence[str],
+            predict: Callable[[Dataset], Iterable[Tuple[str, ...]]]
+    ) -> Generator[Tuple[str, str, str], None, None]:
+        """Get `question - context - answer` triplets, using the cached answers where possible
+
+        Args:
+            dataset: The input data as a `datasets.Dataset` object
+            text_col_names: The names of the question and the context columns, in this order
+            predict: A function that takes the examples whose answers are not cached as a dataset
+                and returns the predicted triplets in the order of the examples, e.g. a function
+                that calls `tokenize_dataset` and `get_predictions`. The triplets may be followed
+                by further elements, e.g. prediction details
+
+        Returns:
+            A generator of triplets in the order of the examples. The questions and contexts are
+            the original texts in the case of cache hits and those returned by `predict` otherwise.
+            The outputs of `predict` are yielded as they are
+        """
+        question_col, context_col = text_col_names
+        questions, contexts = dataset[question_col], dataset[context_col]
+        cached_answers = [self.get(question, context) for question, context in zip(questions, contexts)]
+        miss_ids = [i for i, answer in enumerate(cached_answers) if answer is None]
+        predictions = iter(predict(dataset.select(miss_ids)) if miss_ids else ())
+        for question, context, answer in zip(questions, contexts, cached_answers):
+            if answer is not None:
+                yield question, context, answer
+                continue
+            triplet = next(predictions)
+            self.put(question, context, triplet[2])
+            yield triplet
+        self._connection.commit()
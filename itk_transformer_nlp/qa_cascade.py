@@ -0,0 +1,141 @@
+"""Cascade QA inference with a cheap screening model
+
+Many questions are either clearly answerable from the context or clearly
+unanswerable, and a small (e.g. distilled) extractive model finds the same
+answers as `bart-squadv2` for the clear cases. A `ScreeningCascade` runs the
+small model on every example first. The examples whose screening answer is
+not confident enough, or which the small model considers possibly
+unanswerable, are routed to the large model, and only these examples are run
+through it (see `get_predictions`).
+
+The confidence of an example is the product of the largest answer start
+and answer end probabilities of the screening model. An example is possibly
+unanswerable if the best start or end position is the first token, which is
+where SQuAD 2.0 models point for unanswerable questions, or if the best end
+precedes the best start.
+
+The screening model should use the same tokenizer as the large model. The
+answer scores of the screened examples are the scores of the screening model.
+
+`bart-squadv2` predicts the token before the first and the last answer token,
+while a standard extractive model (e.g. a distilled RoBERTa) predicts the
+first and the last answer token. The logits of such a screening model are
+shifted by one position (see `ScreeningCascade.align_logits`) before they are
+decoded like those of the large model. Routing uses the unshifted logits.
+"""
+
+from typing import Dict, Optional, Union
+
+import torch
+from transformers import PreTrainedModel
+
+from itk_transformer_nlp.cli_args import DEFAULT_SCREENING_THRESHOLD
+from itk_transformer_nlp.onnx_backend import OnnxQAModel
+
+
+def get_screening_confidence(start_logits: torch.Tensor, end_logits: torch.Tensor) -> torch.Tensor:
+    """Get the confidence of the best answer start and end positions
+
+    Args:
+        start_logits: Answer start logits, a tensor of shape `(batch_size, sequence_length)`
+        end_logits: Answer end logits, a tensor of shape `(batch_size, sequence_length)`
+
+    Returns:
+        The product of the largest start and end probabilities, a tensor of shape `(batch_size,)`
+    """
+    return (torch.amax(torch.softmax(start_logits.float(), dim=-1), dim=-1)
+            * torch.amax(torch.softmax(end_logits.float(), dim=-1), dim=-1))
+
+
+def get_position_offset(screening_model: Union[PreTrainedModel, OnnxQAModel]) -> int:
+    """Get the number of positions by which the predictions of a screening model follow those of
+    `bart-squadv2`. BART models (and exported ONNX models, which are BART models) are expected to
+    follow the convention of `bart-squadv2`, other models are expected to predict the exact positions
+
+    Args:
+        screening_model: A small extractive QA model or a backend that runs it
+
+    Returns:
+        `0` or `1`
+    """
+    if isinstance(screening_model, OnnxQAModel):
+        return 0
+    return int(getattr(getattr(screening_model, "config", None), "model_type", None) != "bart")
+
+
+def is_possibly_unanswerable(start_logits: torch.Tensor, end_logits: torch.Tensor) -> torch.Tensor:
+    """Check whether the best positions point to the first token or form an invalid span
+
+    Args:
+        start_logits: Answer start logits, a tensor of shape `(batch_size, sequence_length)`
+        end_logits: Answer end logits, a tensor of shape `(batch_size, sequence_length)`
+
+    Returns:
+        A Boolean tensor of shape `(batch_size,)`
+    """
+    starts, ends = torch.argmax(start_logits, dim=-1), torch.argmax(end_logits, dim=-1)
+    return (starts == 0) | (ends == 0) | (ends < starts)
+
+
+class ScreeningCascade:
+    """A screening model and the routing rule of a cascade, with routing counters"""
+
+    def __init__(
+            self,
+            screening_model: Union[PreTrainedModel, OnnxQAModel],
+            threshold: float = DEFAULT_SCREENING_THRESHOLD,
+            position_offset: Optional[int] = None
+    ) -> None:
+        """Initialize the cascade
+
+        Args:
+            screening_model: A small extractive QA model or a backend that runs it (see `get_predictions`)
+            threshold: Examples whose screening confidence is below this are routed to the
+                large model. `0` routes only the possibly unanswerable examples, `1` routes
+                every example. Defaults to `DEFAULT_SCREENING_THRESHOLD`
+            position_offset: Optional. `1` if the screening model predicts the first and the last
+                answer token, `0` if it predicts the tokens before them, as `bart-squadv2` does.
+                If not specified, it is inferred from the model, see `get_position_offset`
+        """
+        self.screening_model = screening_model
+        self.threshold = threshold
+        self.position_offset = get_position_offset(screening_model) if position_offset is None else position_offset
+        self.examples = 0
+        self.routed = 0
+
+    def route(self, start_logits: torch.Tensor, end_logits: torch.Tensor) -> torch.Tensor:
+        """Select the examples of a batch that are routed to the large model
+
+        Args:
+            start_logits: The answer start logits of the screening model
+            end_logits: The answer end logits of the screening model
+
+        Returns:
+            A Boolean tensor of shape `(batch_size,)` that is `True` for the routed examples
+        """
+        is_routed = ((get_screening_confidence(start_logits, end_logits) < self.threshold)
+                     | is_possibly_unanswerable(start_logits, end_logits))
+        self.examples += is_routed.shape[0]
+        self.routed += int(is_routed.sum())
+        return is_routed
+
+    def align_logits(self, logits: torch.Tensor) -> torch.Tensor:
+        """Shift the start or end logits of the screening model to the positions that `bart-squadv2` predicts
+
+        Args:
+            logits: A tensor of shape `(batch_size, sequence_length)`
+
+        Returns:
+            A new tensor of the same shape. Shifted logits that have no position are dropped,
+            and the freed last positions get `-inf` logits
+        """
+        if self.position_offset == 0:
+            return logits.clone()
+        aligned_logits = torch.full_like(logits, float("-inf"))
+        aligned_logits[:, :-self.position_offset] = logits[:, self.position_offset:]
+        return aligned_logits
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """Get the number of screened and routed examples and the routing rate"""
+        return {"examples": self.examples, "routed": self.routed,
+                "routing_rate": self.routed / self.examples if self.examples else 0.}
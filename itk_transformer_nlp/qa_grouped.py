@@ -0,0 +1,189 @@
+"""Shared-context QA: many questions over one passage
+
+If the same context is asked many questions, tokenizing the question-context
+pairs tokenizes the context again for every question, although it is usually
+much longer than the questions. In the grouped input format, each example
+contains a context and a list of questions. The contexts are tokenized once
+(`tokenize_contexts`), the questions are tokenized separately and stored as
+one example per question (`tokenize_questions`), and the token IDs of the
+question and the context are only concatenated when the batch is built
+(`SharedContextCollator`).
+
+The column `GROUP_IDX_COL` contains the position of the group of each question.
+`GroupBatchSampler` puts the questions of a group into the same batch, unless
+the group has more questions than the batch size. The questions are kept in
+their original order, so the outputs are in the order of the flattened groups.
+"""
+
+from typing import Dict, Any, Sequence, List, Iterator, Optional, Tuple
+
+import torch
+from datasets import Dataset
+from torch.utils.data import Sampler
+from transformers import PreTrainedTokenizerBase
+
+from itk_transformer_nlp.qa_batching import DynamicPaddingCollator
+
+QUESTION_IDS_COL = "question_ids"
+CONTEXT_IDS_COL = "context_ids"
+GROUP_IDX_COL = "group_idx"
+
+
+def tokenize_contexts(
+        dataset: Dataset,
+        context_col: str,
+        tokenizer: PreTrainedTokenizerBase,
+        batch_size: int
+) -> Dataset:
+    """Tokenize the contexts of a grouped dataset without special tokens
+
+    Args:
+        dataset: The grouped input data
+        context_col: The name of the context column
+        tokenizer: A pre-trained tokenizer
+        batch_size: Batch size for tokenization
+
+    Returns:
+        A dataset with a single column, `CONTEXT_IDS_COL`, with one row per group
+    """
+    return dataset.map(
+        lambda example: {CONTEXT_IDS_COL: tokenizer(example[context_col], add_special_tokens=False)["input_ids"]},
+        batched=True, batch_size=batch_size, remove_columns=dataset.column_names)
+
+
+def tokenize_questions(
+        dataset: Dataset,
+        question_col: str,
+        tokenizer: PreTrainedTokenizerBase,
+        batch_size: int
+) -> Dataset:
+    """Tokenize the questions of a grouped dataset without special tokens
+
+    Args:
+        dataset: The grouped input data. The question column should contain lists of questions
+        question_col: The name of the question column
+        tokenizer: A pre-trained tokenizer
+        batch_size: The number of groups whose questions are tokenized together
+
+    Returns:
+        A dataset with one row per question and the columns `QUESTION_IDS_COL` and `GROUP_IDX_COL`
+    """
+
+    def tok_func(example: Dict[str, Any], indices: List[int]) -> Dict[str, List[Any]]:
+        questions = [question for group in example[question_col] for question in group]
+        group_ids = [group_idx for group_idx, group in zip(indices, example[question_col]) for _ in group]
+        question_ids = tokenizer(questions, add_special_tokens=False)["input_ids"] if questions else []
+        return {QUESTION_IDS_COL: question_ids, GROUP_IDX_COL: group_ids}
+
+    return dataset.map(tok_func, batched=True, batch_size=batch_size, with_indices=True,
+                       remove_columns=dataset.column_names)
+
+
+class GroupBatchSampler(Sampler):
+    """A batch sampler that puts the questions of a group into the same batch
+
+    The questions are expected to be sorted by group. Consecutive groups are packed into
+    a batch as long as it has at most `batch_size` questions. Groups with more questions
+    are split into batches of `batch_size` questions. The order of the questions is kept.
+    """
+
+    def __init__(self, group_ids: Sequence[int], batch_size: int) -> None:
+        """Initialize the sampler
+
+        Args:
+            group_ids: The group index of each question
+            batch_size: The maximal number of questions in a batch
+        """
+        groups = []
+        for i, group_idx in enumerate(group_ids):
+            if i > 0 and group_idx == group_ids[i - 1]:
+                groups[-1].append(i)
+            else:
+                groups.append([i])
+        self._batches = []
+        batch = []
+        for group in groups:
+            if batch and len(batch) + len(group) > batch_size:
+                self._batches.append(batch)
+                batch = []
+            if len(group) > batch_size:
+                self._batches += [group[i:i + batch_size] for i in range(0, len(group), batch_size)]
+            else:
+                batch += group
+        if batch:
+            self._batches.append(batch)
+
+    def __iter__(self) -> Iterator[List[int]]:
+        return iter(self._batches)
+
+    def __len__(self) -> int:
+        return len(self._batches)
+
+
+class SharedContextCollator:
+    """Build the input sequences of a batch from the tokenized questions and their shared contexts
+
+    The pairs are truncated and joined with the special tokens as the tokenizer would do
+    with the question-context pairs, then the batch is padded to its longest sequence.
+    """
+
+    def __init__(
+            self,
+            context_ids: Sequence[List[int]],
+            tokenizer: PreTrainedTokenizerBase,
+            max_seq_length: Optional[int] = None
+    ) -> None:
+        """Initialize the collator
+
+        Args:
+            context_ids: The context token IDs of each group, see `tokenize_contexts`
+            tokenizer: The tokenizer that was used to tokenize the questions and the contexts
+            max_seq_length: Optional. If specified, the longer of the question and the context
+                is truncated until the sequence is not longer than this, see the `longest_first`
+                truncation strategy of the tokenizer
+        """
+        self.context_ids = context_ids
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self._num_special_tokens = tokenizer.num_special_tokens_to_add(pair=True)
+        self._padding_collator = DynamicPaddingCollator(tokenizer.pad_token_id)
+
+    def __call__(self, features: List[Dict[str, Any]]) -> Dict[str, Any]:
+        sequences = []
+        for feature in features:
+            question_ids = feature[QUESTION_IDS_COL]
+            context_ids = self.context_ids[feature[GROUP_IDX_COL]]
+            if self.max_seq_length is not None:
+                num_tokens_to_remove = (len(question_ids) + len(context_ids) + self._num_special_tokens
+                                        - self.max_seq_length)
+                if num_tokens_to_remove > 0:
+                    question_ids, context_ids = _truncate_longest_first(
+                        question_ids, context_ids, num_tokens_to_remove, self.tokenizer.is_fast)
+            input_ids = self.tokenizer.build_inputs_with_special_tokens(question_ids, context_ids)
+            sequences.append({"input_ids": torch.tensor(input_ids),
+                              "attention_mask": torch.ones(len(input_ids), dtype=torch.long)})
+        return self._padding_collator(sequences)
+
+
+def _truncate_longest_first(
+        question_ids: List[int],
+        context_ids: List[int],
+        num_tokens_to_remove: int,
+        is_fast: bool
+) -> Tuple[List[int], List[int]]:
+    """Helper function to truncate a question-context pair from the right as the tokenizers do with
+    the `longest_first` strategy. The longer sequence is truncated first. If both sequences are
+    truncated, the odd token is removed from the context by slow tokenizers and from the originally
+    shorter sequence (the question if they are equally long) by fast tokenizers
+    """
+    first_remove = min(abs(len(question_ids) - len(context_ids)), num_tokens_to_remove)
+    second_remove = num_tokens_to_remove - first_remove
+    if is_fast and len(question_ids) <= len(context_ids):
+        question_remove, context_remove = second_remove - second_remove // 2, second_remove // 2
+    else:
+        question_remove, context_remove = second_remove // 2, second_remove - second_remove // 2
+    if len(question_ids) > len(context_ids):
+        question_remove += first_remove
+    else:
+        context_remove += first_remove
+    return question_ids[:len(question_ids) - question_remove], context_ids[:len(context_ids) - context_remove]
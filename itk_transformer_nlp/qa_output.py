@@ -0,0 +1,144 @@
+"""Structured output of QA predictions
+
+`ResultWriter` writes one record per example as JSON lines or as a Parquet
+file. Each record contains the ID of the input example, the answer text,
+its character offsets in the context and its score (see `get_record` and
+the `return_details` argument of `get_predictions`). The records are
+buffered and written in chunks. JSON lines can be compressed with gzip
+or with zstd. The latter requires the `zstandard` package, Parquet files
+require the `pyarrow` package (both are in the `output` extra).
+"""
+
+import gzip
+import io
+import json
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from itk_transformer_nlp.cli_args import OUTPUT_FORMATS, COMPRESSIONS
+
+#  The fields of the records and their Arrow types
+RECORD_FIELDS = (("id", "string"), ("answer", "string"), ("answer_start", "int64"),
+                 ("answer_end", "int64"), ("score", "float64"))
+
+
+def get_record(example_id: Any, answer: str, details: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Create an output record
+
+    Args:
+        example_id: The ID of the input example. It is converted to a string
+        answer: The answer text
+        details: Optional. The details of the prediction with the keys `score`,
+            `answer_start` and `answer_end`. Missing values are set to `None`
+
+    Returns:
+        The record as a `dict` whose keys are the fields of `RECORD_FIELDS`
+    """
+    details = details or {}
+    return {"id": str(example_id), "answer": answer, "answer_start": details.get("answer_start"),
+            "answer_end": details.get("answer_end"), "score": details.get("score")}
+
+
+class ResultWriter:
+    """A buffered writer of QA prediction records"""
+
+    def __init__(
+            self,
+            path: Union[str, Path],
+            output_format: str = "jsonl",
+            compression: Optional[str] = None,
+            buffer_size: int = 1000
+    ) -> None:
+        """Open an output file
+
+        Args:
+            path: Path to the output file. If it is `-`, JSON lines are written to the standard output
+            output_format: `jsonl` or `parquet`. Defaults to `jsonl`
+            compression: Optional. `gzip` or `zstd`. Parquet files are compressed with
+                the specified codec, JSON lines are written to a compressed stream
+            buffer_size: The number of records that are collected before they are written.
+                This is also the row group size of Parquet files. Defaults to `1000`
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        if output_format == "parquet" and str(path) == "-":
+            raise ValueError("Parquet files cannot be written to the standard output")
+        #  `pyarrow` is imported here, so that a missing package is reported before any prediction
+        self._pyarrow_modules = _import_pyarrow() if output_format == "parquet" else None
+        self.output_format = output_format
+        self.buffer_size = buffer_size
+        self._buffer: List[Dict[str, Any]] = []
+        self._parquet_writer = None
+        self._path = path
+        self._compression = compression
+        self._stream = None if output_format == "parquet" else _open_text_stream(path, compression)
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """Add a record (see `get_record`) to the buffer and write the buffer if it is full"""
+        self._buffer.append(record)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered records"""
+        if not self._buffer:
+            return
+        if self.output_format == "parquet":
+            self._write_parquet()
+        else:
+            self._stream.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in self._buffer))
+            self._stream.flush()
+        self._buffer = []
+
+    def close(self) -> None:
+        """Write the remaining records and close the output file"""
+        self.flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        if self._stream is not None and self._stream is not sys.stdout:
+            self._stream.close()
+
+    def _write_parquet(self) -> None:
+        """Helper function to write the buffered records to the Parquet file"""
+        pa, pq = self._pyarrow_modules
+        schema = pa.schema([(name, getattr(pa, type_name)()) for name, type_name in RECORD_FIELDS])
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(str(self._path), schema, compression=self._compression or "none")
+        self._parquet_writer.write_table(pa.Table.from_pylist(self._buffer, schema=schema))
+
+
+def _import_pyarrow() -> Tuple[ModuleType, ModuleType]:
+    """Helper function to import `pyarrow` and its Parquet module"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError("The `pyarrow` package is required for Parquet output") from error
+    return pyarrow, pyarrow.parquet
+
+
+def _open_text_stream(path: Union[str, Path], compression: Optional[str]) -> io.TextIOBase:
+    """Helper function to open a text stream, optionally compressed"""
+    if str(path) == "-":
+        if compression is not None:
+            raise ValueError("Compressed output cannot be written to the standard output")
+        return sys.stdout
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as error:
+            raise ImportError("The `zstandard` package is required for zstd compression") from error
+        return zstandard.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
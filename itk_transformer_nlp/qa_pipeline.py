@@ -0,0 +1,101 @@
+"""Pipelined execution of the QA inference stages
+
+Loading batches (collation, and tokenization if the dataset is streamed),
+the forward pass and decoding the answers run one after the other by default,
+so the cores that the model does not use are idle during the Python-heavy
+stages. `prefetch` loads the next batches in a background thread while the
+current batch is run, and `map_in_background` decodes the previous batches in
+another thread. Both keep at most a fixed number of batches in a bounded
+buffer and return the results in the original order.
+
+PyTorch and the fast tokenizers release the GIL in their native code, which
+is where most of the time of the stages is spent.
+"""
+
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Generator, Iterable, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+_END = object()
+
+
+def prefetch(iterable: Iterable[T], buffer_size: int) -> Generator[T, None, None]:
+    """Iterate over an iterable in a background thread
+
+    Args:
+        iterable: The iterable, e.g. a `DataLoader`
+        buffer_size: The maximal number of items that are read ahead
+
+    Returns:
+        A generator of the items in their original order. Exceptions raised by
+        the iterable are re-raised. If the generator is closed early, the
+        background thread stops after reading at most one further item
+    """
+    buffer: "queue.Queue[Tuple[Any, Any]]" = queue.Queue(maxsize=buffer_size)
+    stopped = threading.Event()
+
+    def put(item: Tuple[Any, Any]) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except Exception as error:  # pylint: disable=broad-except
+            put((_END, error))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def map_in_background(func: Callable[[T], R], iterable: Iterable[T], buffer_size: int) -> Generator[R, None, None]:
+    """Apply a function to the items of an iterable in a background thread
+
+    The items are read in the calling thread, so the next item is produced while
+    the function runs on the previous ones. The function is called in a single
+    thread in the order of the items, so it may have state.
+
+    Args:
+        func: The function to apply
+        iterable: The iterable whose items are the arguments of the function
+        buffer_size: The maximal number of items that are read before the result
+            of the first one is returned
+
+    Returns:
+        A generator of the results in the order of the items
+    """
+    pending: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        try:
+            for item in iterable:
+                pending.append(executor.submit(func, item))
+                while len(pending) > buffer_size:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
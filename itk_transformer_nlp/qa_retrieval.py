@@ -0,0 +1,259 @@
+"""BM25 passage retrieval in front of the QA reader
+
+If the questions are asked about a collection of passages instead of a given
+context, running the reader on every passage is too slow. `BM25Index` is an
+in-process inverted index over a local passage corpus that scores the passages
+with BM25, so the reader only needs to be run on the `top_k` best passages of
+each question (see `retrieve_passages` and `select_best_answers`).
+
+The postings are stored in flat arrays: the passage indices and the term
+frequencies of term `i` are `passage_ids[term_offsets[i]:term_offsets[i + 1]]`
+and `term_freqs[term_offsets[i]:term_offsets[i + 1]]`. The index is saved as
+`.npy` files that are memory-mapped when the index is loaded, together with
+the vocabulary, the BM25 parameters and the passages as a `datasets.Dataset`.
+
+Usage:
+    python3 -m itk_transformer_nlp.qa_retrieval corpus.jsonl outputs/bm25_index --text-col text
+"""
+
+import json
+import re
+from argparse import ArgumentParser, Namespace
+from array import array
+from collections import Counter
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from datasets import Dataset, load_dataset, load_from_disk
+
+from itk_transformer_nlp.cli_args import DEFAULT_RETRIEVAL_TOP_K
+
+PASSAGE_ID_COL = "passage_id"
+PASSAGE_TEXT_COL = "text"
+QUESTION_IDX_COL = "question_idx"
+RETRIEVAL_SCORE_COL = "retrieval_score"
+ARRAY_NAMES = ("term_offsets", "passage_ids", "term_freqs", "passage_lengths")
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def get_terms(text: str) -> List[str]:
+    """Split a text into lowercase word terms"""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """An inverted index that scores passages with BM25"""
+
+    def __init__(
+            self,
+            vocabulary: Dict[str, int],
+            arrays: Dict[str, np.ndarray],
+            passages: Dataset,
+            k1: float = 1.2,
+            b: float = 0.75
+    ) -> None:
+        """Initialize the index. Use `build` or `load` to create an index
+
+        Args:
+            vocabulary: The indices of the terms
+            arrays: The arrays `ARRAY_NAMES`, see the module docstring
+            passages: The passages with the columns `PASSAGE_ID_COL` and `PASSAGE_TEXT_COL`
+            k1: The term frequency saturation parameter of BM25. Defaults to `1.2`
+            b: The length normalization parameter of BM25. Defaults to `0.75`
+        """
+        self.vocabulary = vocabulary
+        self.term_offsets, self.passage_ids, self.term_freqs, self.passage_lengths = (
+            arrays[name] for name in ARRAY_NAMES)
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        num_passages = len(self.passage_lengths)
+        self._doc_freqs = np.diff(self.term_offsets)
+        self._idf = np.log1p((num_passages - self._doc_freqs + 0.5) / (self._doc_freqs + 0.5)).astype(np.float32)
+        avg_length = float(np.mean(self.passage_lengths)) if num_passages else 0.
+        #  The length normalization of every passage, so that it is not computed for every query
+        self._length_norms = (k1 * (1 - b + b * np.asarray(self.passage_lengths) / max(avg_length, 1.))
+                              ).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.passage_lengths)
+
+    @classmethod
+    def build(cls, passages: Dataset, k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """Build an index
+
+        Args:
+            passages: The passages with the columns `PASSAGE_ID_COL` and `PASSAGE_TEXT_COL`
+            k1: The term frequency saturation parameter of BM25. Defaults to `1.2`
+            b: The length normalization parameter of BM25. Defaults to `0.75`
+
+        Returns:
+            The index
+        """
+        vocabulary = {}
+        term_ids, passage_ids, term_freqs = array("i"), array("i"), array("i")
+        passage_lengths = array("i")
+        for passage_idx, text in enumerate(passages[PASSAGE_TEXT_COL]):
+            terms = get_terms(text)
+            passage_lengths.append(len(terms))
+            for term, freq in Counter(terms).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                passage_ids.append(passage_idx)
+                term_freqs.append(freq)
+        term_ids = np.frombuffer(term_ids, dtype=np.int32)
+        #  A stable sort keeps the passages of each term in increasing order
+        order = np.argsort(term_ids, kind="stable")
+        term_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=term_offsets[1:])
+        arrays = {
+            "term_offsets": term_offsets,
+            "passage_ids": np.frombuffer(passage_ids, dtype=np.int32)[order],
+            "term_freqs": np.frombuffer(term_freqs, dtype=np.int32)[order],
+            "passage_lengths": np.frombuffer(passage_lengths, dtype=np.int32).copy()
+        }
+        return cls(vocabulary, arrays, passages, k1=k1, b=b)
+
+    def save(self, index_dir: Union[str, Path]) -> None:
+        """Save the index to a directory"""
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        for name, values in zip(ARRAY_NAMES, (self.term_offsets, self.passage_ids, self.term_freqs,
+                                              self.passage_lengths)):
+            np.save(index_dir / f"{name}.npy", values)
+        with open(index_dir / "vocabulary.json", "w", encoding="utf-8") as vocabulary_file:
+            json.dump(self.vocabulary, vocabulary_file, ensure_ascii=False)
+        with open(index_dir / "config.json", "w", encoding="utf-8") as config_file:
+            json.dump({"k1": self.k1, "b": self.b}, config_file)
+        self.passages.save_to_disk(str(index_dir / "passages"))
+
+    @classmethod
+    def load(cls, index_dir: Union[str, Path]) -> "BM25Index":
+        """Load an index saved with `save`. The arrays and the passages are memory-mapped"""
+        index_dir = Path(index_dir)
+        arrays = {name: np.load(index_dir / f"{name}.npy", mmap_mode="r") for name in ARRAY_NAMES}
+        with open(index_dir / "vocabulary.json", encoding="utf-8") as vocabulary_file:
+            vocabulary = json.load(vocabulary_file)
+        with open(index_dir / "config.json", encoding="utf-8") as config_file:
+            config = json.load(config_file)
+        return cls(vocabulary, arrays, load_from_disk(str(index_dir / "passages")), **config)
+
+    def search(self, query: str, top_k: int = DEFAULT_RETRIEVAL_TOP_K) -> List[Tuple[int, float]]:
+        """Find the passages with the highest BM25 scores
+
+        Only the postings of the query terms are read, and the scores are only
+        computed for the passages that contain at least one of them.
+
+        Args:
+            query: The query, e.g. a question
+            top_k: The maximal number of passages to return. Defaults to `DEFAULT_RETRIEVAL_TOP_K`
+
+        Returns:
+            The indices and the scores of the passages in descending order of the scores.
+            Passages that do not contain any query term are not returned
+        """
+        #  The terms are sorted, so that the scores are summed in the same order in every run
+        term_ids = sorted({self.vocabulary[term] for term in get_terms(query) if term in self.vocabulary})
+        if not term_ids:
+            return []
+        passage_ids = np.concatenate([self.passage_ids[self.term_offsets[i]:self.term_offsets[i + 1]]
+                                      for i in term_ids])
+        term_freqs = np.concatenate([self.term_freqs[self.term_offsets[i]:self.term_offsets[i + 1]]
+                                     for i in term_ids]).astype(np.float32)
+        idf = np.repeat(self._idf[term_ids], self._doc_freqs[term_ids])
+        term_scores = idf * term_freqs * (self.k1 + 1) / (term_freqs + self._length_norms[passage_ids])
+        candidates, candidate_ids = np.unique(passage_ids, return_inverse=True)
+        scores = np.bincount(candidate_ids, weights=term_scores)
+        best = np.argsort(-scores, kind="stable")[:top_k]
+        return [(int(candidates[i]), float(scores[i])) for i in best]
+
+
+def retrieve_passages(
+        dataset: Dataset,
+        index: BM25Index,
+        question_col: str = "question",
+        context_col: str = "context",
+        top_k: int = DEFAULT_RETRIEVAL_TOP_K
+) -> Dataset:
+    """Create a question-context pair for each of the best passages of each question
+
+    Args:
+        dataset: The questions
+        index: The passage index
+        question_col: The name of the question column. Defaults to `question`
+        context_col: The name of the column where the passages are put. Defaults to `context`
+        top_k: The maximal number of passages per question. Defaults to `DEFAULT_RETRIEVAL_TOP_K`
+
+    Returns:
+        A dataset with the columns `question_col`, `context_col`, `QUESTION_IDX_COL`, `PASSAGE_ID_COL`
+        and `RETRIEVAL_SCORE_COL`, in the order of the questions. If no passage contains any term of a
+        question, the first passage is used, so that every question has at least one pair. The index
+        must not be empty
+    """
+    if len(index) == 0:
+        raise ValueError("The passage index is empty")
+    pairs = {key: [] for key in (question_col, context_col, QUESTION_IDX_COL, PASSAGE_ID_COL, RETRIEVAL_SCORE_COL)}
+    for question_idx, question in enumerate(dataset[question_col]):
+        for passage_idx, score in index.search(question, top_k) or [(0, 0.)]:
+            passage = index.passages[passage_idx]
+            pairs[question_col].append(question)
+            pairs[context_col].append(passage[PASSAGE_TEXT_COL])
+            pairs[QUESTION_IDX_COL].append(question_idx)
+            pairs[PASSAGE_ID_COL].append(passage[PASSAGE_ID_COL])
+            pairs[RETRIEVAL_SCORE_COL].append(score)
+    return Dataset.from_dict(pairs)
+
+
+def select_best_answers(
+        predictions: Iterable[Tuple[Any, ...]],
+        question_ids: Iterable[int]
+) -> Generator[Tuple[Any, ...], None, None]:
+    """Select the best answer of each question from the answers found in its passages
+
+    Args:
+        predictions: The `question - context - answer` triplets of the pairs returned by
+            `retrieve_passages`, each followed by the details (see `get_predictions`)
+        question_ids: The values of the `QUESTION_IDX_COL` column of the pairs
+
+    Returns:
+        A generator of the predictions with the highest scores, one for each question.
+        Answers without a score (i.e. `NA`) are only selected if no passage has an answer
+    """
+    for _, question_predictions in groupby(zip(question_ids, predictions), key=lambda pair: pair[0]):
+        best_prediction: Optional[Tuple[Any, ...]] = None
+        for _, prediction in question_predictions:
+            score = prediction[3]["score"]
+            if best_prediction is None or score is not None and (
+                    best_prediction[3]["score"] is None or score > best_prediction[3]["score"]):
+                best_prediction = prediction
+        yield best_prediction
+
+
+def get_index_args() -> Namespace:
+    """Get command line arguments"""
+    parser = ArgumentParser(description="Build a BM25 index over a passage corpus")
+    parser.add_argument("corpus", help="Path to the jsonlines corpus file")
+    parser.add_argument("index_dir", help="The directory where the index is saved")
+    parser.add_argument("--text-col", dest="text_col", default=PASSAGE_TEXT_COL,
+                        help=f"The name of the column that contains the passages. Defaults to `{PASSAGE_TEXT_COL}`")
+    parser.add_argument("--id-col", dest="id_col", default="id",
+                        help="The name of the column that contains the passage IDs. If the corpus does "
+                             "not contain it, the positions of the passages are used. Defaults to `id`")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Main function"""
+    args = get_index_args()
+    corpus = load_dataset("json", data_files=args.corpus, split="train")
+    passage_ids = corpus[args.id_col] if args.id_col in corpus.column_names else range(len(corpus))
+    passages = Dataset.from_dict({PASSAGE_ID_COL: [str(passage_id) for passage_id in passage_ids],
+                                  PASSAGE_TEXT_COL: corpus[args.text_col]})
+    index = BM25Index.build(passages)
+    index.save(args.index_dir)
+    print(f"Indexed {len(index)} passages with {len(index.vocabulary)} terms")
+
+
+if __name__ == "__main__":
+    main()
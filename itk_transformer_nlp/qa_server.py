@@ -0,0 +1,215 @@
+"""A micro-batching QA server
+
+Loading the model takes much longer than answering a few questions, and a
+model that is called on single examples leaves most of the CPU unused. This
+server keeps the model in memory and collects concurrent requests into
+batches. A batch is run as soon as it has `max_batch_size` examples or
+`max_wait` seconds have passed since its first request arrived.
+
+The server speaks line-delimited JSON over TCP. Each request line is an
+object with the keys `question` and `context` and an optional `id`. Each
+response line is an object with the same `id` and either the key `answer`
+or the key `error`. Requests of a connection are answered as soon as their
+batch is done, so the responses might not follow the order of the requests.
+
+The server uses the tokenize - forward - extract path of `transformer_qa`,
+and it loads the tokenizer and the model with `load_model` from there. It
+can therefore only be started after the exercises in `transformer_qa.py` are
+solved, i.e. `python3 -m itk_transformer_nlp qa` also works.
+
+Usage:
+    python3 -m itk_transformer_nlp.qa_server --port 8765 --max-batch-size 16
+"""
+
+import asyncio
+import json
+import sys
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+import torch
+from datasets import Dataset
+from transformers import BartForQuestionAnswering, BartTokenizer
+
+from itk_transformer_nlp.cli_args import check_positive_int, add_qa_inference_args
+from itk_transformer_nlp.qa_batching import QUESTION_COL, CONTEXT_COL
+from itk_transformer_nlp.onnx_backend import OnnxQAModel
+from itk_transformer_nlp.transformer_qa import tokenize_dataset, get_predictions, load_model
+
+PredictBatch = Callable[[Sequence[Tuple[str, str]]], List[str]]
+
+
+class MicroBatcher:
+    """Collect concurrent requests into batches and answer them in a worker thread"""
+
+    def __init__(self, predict_batch: PredictBatch, max_batch_size: int, max_wait: float) -> None:
+        """Initialize the batcher
+
+        Args:
+            predict_batch: A function that takes a sequence of `(question, context)`
+                pairs and returns the answers in the same order
+            max_batch_size: The maximal number of requests in a batch
+            max_wait: The maximal time in seconds a request waits for further requests
+                before its batch is run
+        """
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        #  Counters instead of a list of the batch sizes, as the server may run indefinitely
+        self.num_batches = 0
+        self.num_examples = 0
+        self._queue: Optional[asyncio.Queue] = None
+        #  A single worker, as the model should not be called from several threads at once
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def submit(self, question: str, context: str) -> str:
+        """Queue a question and wait for its answer"""
+        future = asyncio.get_running_loop().create_future()
+        await self._get_queue().put((question, context, future))
+        return await future
+
+    async def run(self) -> None:
+        """Run batches until cancelled"""
+        loop = asyncio.get_running_loop()
+        queue = self._get_queue()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.num_batches += 1
+            self.num_examples += len(batch)
+            try:
+                answers = await loop.run_in_executor(
+                    self._executor, self.predict_batch, [(question, context) for question, context, _ in batch])
+            except Exception as error:  # pylint: disable=broad-except
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (*_, future), answer in zip(batch, answers):
+                if not future.done():
+                    future.set_result(answer)
+
+    def _get_queue(self) -> asyncio.Queue:
+        """Helper function to create the queue in the running event loop"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+
+async def _answer_line(line: bytes, batcher: MicroBatcher, writer: asyncio.StreamWriter, lock: asyncio.Lock) -> None:
+    """Helper function to answer a single request line"""
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get("id")
+        response = {"id": request_id, "answer": await batcher.submit(request["question"], request["context"])}
+    except Exception as error:  # pylint: disable=broad-except
+        response = {"id": request_id, "error": f"{type(error).__name__}: {error}"}
+    async with lock:
+        writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+        await writer.drain()
+
+
+async def handle_connection(batcher: MicroBatcher, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answer the requests of a connection until the client closes it"""
+    lock = asyncio.Lock()
+    tasks = set()
+    while line := await reader.readline():
+        if line.strip():
+            task = asyncio.create_task(_answer_line(line, batcher, writer, lock))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def serve(batcher: MicroBatcher, host: str, port: int) -> None:
+    """Run the batcher and serve requests until cancelled"""
+    batcher_task = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(lambda r, w: handle_connection(batcher, r, w), host, port)
+    print(f"Serving on {', '.join(str(sock.getsockname()) for sock in server.sockets)}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batcher_task.cancel()
+
+
+def get_predict_batch(
+        model: Union[BartForQuestionAnswering, OnnxQAModel],
+        tokenizer: BartTokenizer,
+        args: Namespace,
+        device: Optional[torch.device] = None
+) -> PredictBatch:
+    """Get a function that answers a batch of questions with the tokenize - forward - extract path
+    of `transformer_qa`. `args` are the options added by `add_qa_inference_args`
+    """
+
+    def predict_batch(examples: Sequence[Tuple[str, str]]) -> List[str]:
+        questions, contexts = zip(*examples)
+        dataset = Dataset.from_dict({QUESTION_COL: list(questions), CONTEXT_COL: list(contexts)})
+        data_loader = tokenize_dataset(
+            dataset=dataset,
+            text_col_names=(QUESTION_COL, CONTEXT_COL),
+            tokenizer=tokenizer,
+            batch_size=len(examples),
+            max_seq_length=args.max_seq_length,
+            dynamic_padding=args.dynamic_padding,
+            doc_stride=args.doc_stride,
+            return_offsets_mapping=args.offset_mapping
+        )
+        return [triplet[-1] for triplet in get_predictions(
+            model, data_loader, tokenizer, span_top_k=args.span_top_k, max_answer_length=args.max_answer_length,
+            device=device, use_bf16=args.bf16, prefetch_batches=args.prefetch or 0)]
+
+    return predict_batch
+
+
+def get_server_args() -> Namespace:
+    """Get command line arguments"""
+    parser = ArgumentParser(description="Arguments for the QA server")
+    parser.add_argument("--model-name", dest="model_name", default="a-ware/bart-squadv2",
+                        help="The model identifier. Defaults to `a-ware/bart-squadv2`")
+    parser.add_argument("--host", dest="host", default="127.0.0.1",
+                        help="The address to listen on. Defaults to `127.0.0.1`")
+    parser.add_argument("--port", dest="port", type=int, default=8765,
+                        help="The port to listen on. Defaults to 8765")
+    parser.add_argument("--max-batch-size", dest="max_batch_size", type=check_positive_int, default=16,
+                        help="The maximal number of requests in a batch. Defaults to 16")
+    parser.add_argument("--max-wait-ms", dest="max_wait_ms", type=float, default=10.,
+                        help="The maximal time in milliseconds a request waits for further requests "
+                             "before its batch is run. Defaults to 10")
+    add_qa_inference_args(parser)
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Main function"""
+    args = get_server_args()
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+    tokenizer, model, device = load_model(args, args.num_threads)
+    if tokenizer is None or model is None:
+        sys.exit("The tokenizer or the model is not loaded. Solve the exercises in `transformer_qa.py` first")
+    batcher = MicroBatcher(get_predict_batch(model, tokenizer, args, device), args.max_batch_size,
+                           args.max_wait_ms / 1000)
+    if args.warmup:
+        batcher.predict_batch([("What is this?", "This is a warmup example.")])
+    try:
+        asyncio.run(serve(batcher, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Multi-process sharded QA inference
+
+A single process does not make good use of many CPU cores, as intra-op
+threading scales poorly. `predict_sharded` splits the dataset into contiguous
+shards and runs a prediction function on them in several worker processes,
+each with an even share of the threads.
+
+The workers are forked after the model has been loaded, so the model weights
+are shared with the parent process copy-on-write instead of being loaded
+again. This requires the `fork` start method, which is available on Linux
+and macOS. Models on a CUDA device cannot be used in forked processes.
+The OpenMP thread pool of PyTorch cannot be used in forked processes either
+if it has already been started, so the parent process should run PyTorch
+with a single thread (see `torch.set_num_threads`) before forking.
+"""
+
+import multiprocessing
+from typing import Callable, Generator, Iterable, List, Optional, Tuple, TypeVar
+
+import torch
+from datasets import Dataset
+
+T = TypeVar("T")
+
+#  The state of the worker processes. It is set before forking, so that it does not need to be pickled
+_worker_state = {}
+
+
+def get_shard_ranges(num_examples: int, num_shards: int) -> List[Tuple[int, int]]:
+    """Split `range(num_examples)` into at most `num_shards` contiguous ranges of nearly equal size
+
+    Returns:
+        A list of `(start, end)` pairs, where `end` is exclusive. Empty ranges are omitted
+    """
+    shard_size, remainder = divmod(num_examples, num_shards)
+    ranges = []
+    start = 0
+    for i in range(num_shards):
+        end = start + shard_size + (i < remainder)
+        if end > start:
+            ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _predict_shard(shard_range: Tuple[int, int]) -> List[T]:
+    """Helper function to run the prediction function of a worker on a shard"""
+    start, end = shard_range
+    return list(_worker_state["predict"](_worker_state["dataset"].select(range(start, end))))
+
+
+def _init_worker(num_threads: int) -> None:
+    """Helper function to set the number of threads of a worker"""
+    torch.set_num_threads(num_threads)
+
+
+def predict_sharded(
+        predict: Callable[[Dataset], Iterable[T]],
+        dataset: Dataset,
+        num_workers: int,
+        num_threads: Optional[int] = None
+) -> Generator[T, None, None]:
+    """Run a prediction function on contiguous shards of a dataset in forked worker processes
+
+    Args:
+        predict: A function that takes a dataset and returns the predictions in the order
+            of the examples, e.g. a function that calls `tokenize_dataset` and `get_predictions`
+        dataset: The input data as a `datasets.Dataset` object
+        num_workers: The number of worker processes
+        num_threads: Optional. The total number of threads, which are split evenly between
+            the workers. Defaults to the number of threads of the current process
+
+    Returns:
+        A generator of the predictions in the order of the examples. The predictions of
+        a shard are yielded as soon as the shard and all the preceding ones are done
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise ValueError("Sharded inference requires the `fork` start method")
+    threads_per_worker = max((num_threads or torch.get_num_threads()) // num_workers, 1)
+    _worker_state.update(predict=predict, dataset=dataset)
+    try:
+        with multiprocessing.get_context("fork").Pool(
+                num_workers, initializer=_init_worker, initargs=(threads_per_worker,)) as pool:
+            for shard_predictions in pool.imap(_predict_shard, get_shard_ranges(len(dataset), num_workers)):
+                yield from shard_predictions
+    finally:
+        _worker_state.clear()
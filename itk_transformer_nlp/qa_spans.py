@@ -0,0 +1,107 @@
+"""Answer span search for extractive QA
+
+`extract_answer` selects the start and the end of the answer independently.
+The function `find_best_spans` scores the pairs of the top-k start and the
+top-k end positions jointly, so that only spans whose end does not precede
+their start and which are not too long are returned.
+
+The model `bart-squadv2` predicts the token before the answer start and the
+token before the answer end. This means that the answer tokens of a span
+`(start, end)` are `input_ids[start + 1:end + 2]`, see `get_span_token_ids`.
+"""
+
+from typing import Optional, Tuple
+
+import torch
+
+from itk_transformer_nlp.cli_args import DEFAULT_MAX_ANSWER_LENGTH
+
+DEFAULT_TOP_K = 20
+
+
+def find_best_spans(
+        start_scores: torch.Tensor,
+        end_scores: torch.Tensor,
+        top_k: int = DEFAULT_TOP_K,
+        max_answer_length: int = DEFAULT_MAX_ANSWER_LENGTH,
+        n_best: int = 1,
+        span_mask: Optional[torch.Tensor] = None
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Find the best answer spans by scoring top-k start and top-k end positions jointly
+
+    Args:
+        start_scores: Scores that indicate the answer start position. This is a tensor
+            of shape `(batch_size, sequence_length)`
+        end_scores: Scores that indicate the answer end position. This is a tensor
+            of shape `(batch_size, sequence_length)`
+        top_k: The number of start and end positions to consider. Defaults to `DEFAULT_TOP_K`
+        max_answer_length: The maximal number of tokens in an answer. Defaults to
+            `DEFAULT_MAX_ANSWER_LENGTH`
+        n_best: The number of spans to return for each sequence. Defaults to `1`
+        span_mask: Optional. A Boolean tensor of shape `(batch_size, sequence_length)`
+            or `(sequence_length,)`. If specified, only positions where it is `True`
+            can be span starts or ends
+
+    Returns:
+        The start positions, the end positions and the scores (the sum of the start
+        and end scores) of the spans, each as a tensor of shape `(batch_size, n_best)`.
+        The spans are sorted by score in descending order. Invalid spans, which are only
+        returned if there are fewer than `n_best` valid spans, have a score of `-inf`
+    """
+    if span_mask is not None:
+        start_scores = start_scores.masked_fill(~span_mask, float("-inf"))
+        end_scores = end_scores.masked_fill(~span_mask, float("-inf"))
+    top_k = min(top_k, start_scores.shape[-1])
+    top_start_scores, top_starts = torch.topk(start_scores, top_k, dim=-1)
+    top_end_scores, top_ends = torch.topk(end_scores, top_k, dim=-1)
+    #  Span lengths and scores of every start-end pair, tensors of shape `(batch_size, top_k, top_k)`
+    span_lengths = torch.unsqueeze(top_ends, 1) - torch.unsqueeze(top_starts, 2)
+    pair_scores = torch.unsqueeze(top_start_scores, 2) + torch.unsqueeze(top_end_scores, 1)
+    is_valid = (span_lengths >= 0) & (span_lengths < max_answer_length)
+    pair_scores = pair_scores.masked_fill(~is_valid, float("-inf"))
+    span_scores, best_pairs = torch.topk(torch.flatten(pair_scores, 1), min(n_best, top_k ** 2), dim=-1)
+    answer_starts = torch.gather(top_starts, 1, torch.div(best_pairs, top_k, rounding_mode="floor"))
+    answer_ends = torch.gather(top_ends, 1, best_pairs % top_k)
+    return answer_starts, answer_ends, span_scores
+
+
+def get_span_token_ids(input_ids: torch.Tensor, start: int, end: int) -> torch.Tensor:
+    """Get the answer token IDs that correspond to a predicted span
+
+    Args:
+        input_ids: An input token ID tensor of shape `(sequence_length,)`
+        start: The predicted start position
+        end: The predicted end position
+
+    Returns:
+        The answer token IDs
+    """
+    return input_ids[start + 1:end + 2]
+
+
+def get_span_char_offsets(context: str, offset_mapping: torch.Tensor, start: int, end: int) -> Tuple[int, int]:
+    """Get the character offsets of the answer that corresponds to a predicted span.
+    Whitespaces at the beginning and the end of the answer are not included
+
+    Args:
+        context: The original context
+        offset_mapping: The character offsets of the tokens in the context, a tensor
+            of shape `(sequence_length, 2)`
+        start: The predicted start position
+        end: The predicted end position
+
+    Returns:
+        The start and the (exclusive) end character offsets of the answer
+    """
+    char_start = offset_mapping[start + 1, 0].item()
+    char_end = offset_mapping[end + 1, 1].item()
+    answer = context[char_start:char_end]
+    return char_start + len(answer) - len(answer.lstrip()), char_end - len(answer) + len(answer.rstrip())
+
+
+def get_span_text(context: str, offset_mapping: torch.Tensor, start: int, end: int) -> str:
+    """Slice the answer that corresponds to a predicted span from the original context.
+    The arguments are the same as those of `get_span_char_offsets`
+    """
+    char_start, char_end = get_span_char_offsets(context, offset_mapping, start, end)
+    return context[char_start:char_end]
@@ -0,0 +1,89 @@
+"""Per-stage timing of QA inference
+
+A `StageTimer` collects the wall time spent in the stages of `get_predictions`
+(data loading, forward pass, answer extraction and decoding) and counts the
+processed examples and tokens. Padded and non-padded tokens are counted
+separately, so the cost of padding can be seen. The padding tokens that
+were trimmed before the forward pass are counted as `trimmed_tokens`. The summary can be exported
+as JSON or in the Prometheus text format.
+
+A disabled timer does not read the clock, so it can be left in the code
+without a measurable cost.
+"""
+
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+from typing import Any, ContextManager, Dict, Generator
+
+STAGES = ("data_loading", "forward", "extract", "decode")
+COUNTERS = ("examples", "tokens", "padded_tokens", "trimmed_tokens")
+
+
+class StageTimer:
+    """Collect the wall time of stages and event counters"""
+
+    def __init__(self, enabled: bool = True) -> None:
+        """Initialize the timer
+
+        Args:
+            enabled: If `False`, nothing is recorded. Defaults to `True`
+        """
+        self.enabled = enabled
+        self.seconds = {stage: 0. for stage in STAGES}
+        self.calls = {stage: 0 for stage in STAGES}
+        self.counts = {counter: 0 for counter in COUNTERS}
+
+    def stage(self, name: str) -> ContextManager[None]:
+        """Get a context manager that adds its wall time to a stage"""
+        if not self.enabled:
+            return nullcontext()
+        return self._time_stage(name)
+
+    @contextmanager
+    def _time_stage(self, name: str) -> Generator[None, None, None]:
+        """Helper function to time a stage"""
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.) + perf_counter() - start_time
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name: str, value: int) -> None:
+        """Add a value to a counter"""
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def summary(self) -> Dict[str, Any]:
+        """Get the stage times, the counters and the throughput
+
+        Returns:
+            A `dict` with the keys `stages` (the seconds and the number of calls of each stage),
+            `counts`, `total_seconds` (the sum of the stage times), `examples_per_second`,
+            `tokens_per_second` (non-padded tokens) and `padded_tokens_per_second`
+        """
+        total_seconds = sum(self.seconds.values())
+
+        def per_second(value: int) -> float:
+            return value / total_seconds if total_seconds > 0 else 0.
+
+        return {
+            "stages": {stage: {"seconds": seconds, "calls": self.calls[stage]}
+                       for stage, seconds in self.seconds.items()},
+            "counts": dict(self.counts),
+            "total_seconds": total_seconds,
+            "examples_per_second": per_second(self.counts["examples"]),
+            "tokens_per_second": per_second(self.counts["tokens"]),
+            "padded_tokens_per_second": per_second(self.counts["padded_tokens"])
+        }
+
+    def to_prometheus(self, prefix: str = "itk_qa") -> str:
+        """Export the summary in the Prometheus text format"""
+        lines = [f"# TYPE {prefix}_stage_seconds_total counter"]
+        lines += [f'{prefix}_stage_seconds_total{{stage="{stage}"}} {seconds}'
+                  for stage, seconds in self.seconds.items()]
+        lines.append(f"# TYPE {prefix}_stage_calls_total counter")
+        lines += [f'{prefix}_stage_calls_total{{stage="{stage}"}} {calls}' for stage, calls in self.calls.items()]
+        for counter, value in self.counts.items():
+            lines += [f"# TYPE {prefix}_{counter}_total counter", f"{prefix}_{counter}_total {value}"]
+        return "\n".join(lines) + "\n"
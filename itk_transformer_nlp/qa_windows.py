@@ -0,0 +1,195 @@
+"""Sliding-window QA over long contexts
+
+Instead of truncating a long context, it can be split into overlapping windows.
+Each window is fed to the model together with the question. The best answer
+span is chosen in every window, then the best span of all windows is
+selected for each example.
+
+Windows are stored as separate examples. The column `EXAMPLE_IDX_COL` contains
+the position of the original example, `NUM_WINDOWS_COL` indicates how many
+windows were created from it. `CONTEXT_START_COL` and `CONTEXT_END_COL`
+are the token positions where the context window starts and ends
+(the latter is exclusive). The original texts are kept in the columns
+`QUESTION_COL` and `CONTEXT_COL`.
+
+If a fast tokenizer is used, the character offsets of the context tokens can be
+stored in the column `OFFSET_MAPPING_COL`. The answers can then be sliced from the
+original contexts without detokenization. With a single window per example,
+this can also be used for truncated contexts.
+"""
+
+from typing import Dict, Any, Sequence, List, Tuple, Optional, Generator, Union
+
+import torch
+from datasets import Dataset, IterableDataset
+from transformers import PreTrainedTokenizerBase
+
+from itk_transformer_nlp.qa_batching import EXAMPLE_IDX_COL, LENGTH_COL, QUESTION_COL, CONTEXT_COL, get_column_names
+from itk_transformer_nlp.qa_spans import DEFAULT_TOP_K, DEFAULT_MAX_ANSWER_LENGTH, find_best_spans
+
+NUM_WINDOWS_COL = "num_windows"
+CONTEXT_START_COL = "context_start"
+CONTEXT_END_COL = "context_end"
+OFFSET_MAPPING_COL = "offset_mapping"
+WINDOW_COLS = (EXAMPLE_IDX_COL, NUM_WINDOWS_COL, CONTEXT_START_COL, CONTEXT_END_COL, QUESTION_COL, CONTEXT_COL)
+
+
+def tokenize_windowed(
+        dataset: Union[Dataset, IterableDataset],
+        text_col_names: Sequence[str],
+        tokenizer: PreTrainedTokenizerBase,
+        batch_size: int,
+        max_seq_length: int,
+        doc_stride: int,
+        max_num_windows: Optional[int] = None,
+        return_offsets_mapping: bool = False
+) -> Dataset:
+    """Tokenize a QA dataset by splitting the contexts into overlapping windows
+
+    Args:
+        dataset: The input data as a `datasets.Dataset` or a `datasets.IterableDataset` object
+        text_col_names: The names of the question and the context columns, in this order
+        tokenizer: A pre-trained tokenizer
+        batch_size: Batch size for tokenization
+        max_seq_length: The maximal number of tokens in a window, including the question
+            and the special tokens
+        doc_stride: The number of context tokens shared by two consecutive windows
+        max_num_windows: Optional. The maximal number of windows per example. The rest of
+            the context is cut off. If not specified, the whole context will be used
+        return_offsets_mapping: If `True`, the character offsets of the context tokens will be
+            stored in the column `OFFSET_MAPPING_COL`. The offsets of the other tokens are `(0, 0)`.
+            This requires a fast tokenizer. Defaults to `False`
+
+    Returns:
+        The windows as a dataset. The original columns are removed
+    """
+    if len(text_col_names) != 2:
+        raise ValueError(f"A question and a context column are expected, got {text_col_names}")
+    if return_offsets_mapping and not tokenizer.is_fast:
+        raise ValueError("Offset mappings can only be returned by fast tokenizers")
+    question_col, context_col = text_col_names
+    num_special_tokens = tokenizer.num_special_tokens_to_add(pair=True)
+    max_question_length = (max_seq_length - num_special_tokens) // 2
+
+    window_cols = ("input_ids", "attention_mask", LENGTH_COL, OFFSET_MAPPING_COL) + WINDOW_COLS
+
+    def window_func(example: Dict[str, Any], indices: List[int]) -> Dict[str, List[Any]]:
+        windows = {key: [] for key in window_cols}
+        questions, contexts = example[question_col], example[context_col]
+        question_encodings = tokenizer(questions, add_special_tokens=False)
+        context_encodings = tokenizer(contexts, add_special_tokens=False,
+                                      return_offsets_mapping=return_offsets_mapping)
+        for i, (example_idx, question, context) in enumerate(zip(indices, questions, contexts)):
+            question_ids = question_encodings["input_ids"][i][:max_question_length]
+            context_ids = context_encodings["input_ids"][i]
+            max_window_length = max_seq_length - len(question_ids) - num_special_tokens
+            if doc_stride >= max_window_length:
+                raise ValueError(f"The document stride ({doc_stride}) should be smaller than the "
+                                 f"context window length ({max_window_length}). Decrease the stride "
+                                 "or increase the maximal sequence length.")
+            #  The padding token never occurs in the question, so it can be used to find the context start
+            context_start = tokenizer.build_inputs_with_special_tokens(
+                question_ids, [tokenizer.pad_token_id]).index(tokenizer.pad_token_id)
+            window_starts = range(0, max(len(context_ids) - doc_stride, 1), max_window_length - doc_stride)
+            window_starts = window_starts[:max_num_windows]
+            for window_start in window_starts:
+                window_ids = context_ids[window_start:window_start + max_window_length]
+                input_ids = tokenizer.build_inputs_with_special_tokens(question_ids, window_ids)
+                if return_offsets_mapping:
+                    num_suffix_tokens = len(input_ids) - context_start - len(window_ids)
+                    windows[OFFSET_MAPPING_COL].append(
+                        [(0, 0)] * context_start
+                        + context_encodings["offset_mapping"][i][window_start:window_start + len(window_ids)]
+                        + [(0, 0)] * num_suffix_tokens)
+                windows["input_ids"].append(input_ids)
+                windows["attention_mask"].append([1] * len(input_ids))
+                windows[LENGTH_COL].append(len(input_ids))
+                windows[EXAMPLE_IDX_COL].append(example_idx)
+                windows[NUM_WINDOWS_COL].append(len(window_starts))
+                windows[CONTEXT_START_COL].append(context_start)
+                windows[CONTEXT_END_COL].append(context_start + len(window_ids))
+                windows[QUESTION_COL].append(question)
+                windows[CONTEXT_COL].append(context)
+
+        if not return_offsets_mapping:
+            del windows[OFFSET_MAPPING_COL]
+        return windows
+
+    #  The columns that `window_func` returns are overwritten, not removed, as iterable datasets
+    #  would remove them after the mapping
+    return dataset.map(window_func, batched=True, batch_size=batch_size, with_indices=True,
+                       remove_columns=[col for col in get_column_names(dataset) if col not in window_cols])
+
+
+def get_best_window_spans(
+        start_scores: torch.Tensor,
+        end_scores: torch.Tensor,
+        context_starts: torch.Tensor,
+        context_ends: torch.Tensor,
+        top_k: int = DEFAULT_TOP_K,
+        max_answer_length: int = DEFAULT_MAX_ANSWER_LENGTH
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Find the best answer span in each window. Only spans within the context are considered
+
+    As in the case of `extract_answer`, the answer is expected to consist of the tokens
+    after the predicted start position up to the token after the predicted end position.
+    Spans are searched for with `find_best_spans`.
+
+    Args:
+        start_scores: Answer start scores, a tensor of shape `(batch_size, sequence_length)`
+        end_scores: Answer end scores, a tensor of shape `(batch_size, sequence_length)`
+        context_starts: The first context token positions, a tensor of shape `(batch_size,)`
+        context_ends: The positions after the last context tokens, a tensor of shape `(batch_size,)`
+        top_k: The number of start and end positions to consider. Defaults to `DEFAULT_TOP_K`
+        max_answer_length: The maximal number of tokens in an answer. Defaults to
+            `DEFAULT_MAX_ANSWER_LENGTH`
+
+    Returns:
+        The start positions, the end positions and the span scores (the sum of the
+        start and end scores), each as a tensor of shape `(batch_size,)`.
+        The score of a window is `-inf` if it does not contain a valid span
+    """
+    positions = torch.arange(start_scores.shape[-1], device=start_scores.device)
+    in_context = (positions >= torch.unsqueeze(context_starts, -1) - 1) & \
+                 (positions <= torch.unsqueeze(context_ends, -1) - 2)
+    answer_starts, answer_ends, span_scores = find_best_spans(
+        start_scores, end_scores, top_k, max_answer_length, span_mask=in_context)
+    return answer_starts[:, 0], answer_ends[:, 0], span_scores[:, 0]
+
+
+class WindowSpanMerger:
+    """Collect the best spans of the windows and select the best one for each example"""
+
+    def __init__(self) -> None:
+        self._best_spans: Dict[int, Tuple[float, Any]] = {}
+        self._window_counts: Dict[int, int] = {}
+
+    def update(
+            self,
+            example_ids: Sequence[int],
+            num_windows: Sequence[int],
+            span_scores: Sequence[float],
+            answers: Sequence[Any]
+    ) -> Generator[Tuple[int, Any], None, None]:
+        """Add the best spans of a batch of windows
+
+        Args:
+            example_ids: The positions of the original examples
+            num_windows: The number of windows created from each original example
+            span_scores: The best span score in each window
+            answers: The answers (e.g. token IDs or texts) that correspond to the best spans,
+                or `None` if there is no valid span in a window
+
+        Returns:
+            A generator of `(example_idx, answer)` pairs for the examples whose windows
+            have all been seen. `answer` is `None` if no window contained a valid span
+        """
+        for example_idx, example_num_windows, span_score, span_answer in zip(
+                example_ids, num_windows, span_scores, answers):
+            best_score, _ = self._best_spans.setdefault(example_idx, (float("-inf"), None))
+            if span_answer is not None and span_score > best_score:
+                self._best_spans[example_idx] = (span_score, span_answer)
+            self._window_counts[example_idx] = self._window_counts.get(example_idx, 0) + 1
+            if self._window_counts[example_idx] == example_num_windows:
+                del self._window_counts[example_idx]
+                yield example_idx, self._best_spans.pop(example_idx)[1]
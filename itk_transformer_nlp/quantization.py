@@ -0,0 +1,69 @@
+"""Dynamic int8 quantization of the QA model
+
+The weights of the `nn.Linear` layers of `BartForQuestionAnswering` are
+quantized to 8-bit integers, the activations are quantized on the fly.
+This reduces the memory footprint of the model and speeds up inference
+on the CPU. The quantized weights are cached on disk, so that later loads
+do not need to read and quantize the full precision checkpoint.
+
+See `quantization_report.py` for comparing the quantized and the full
+precision models.
+"""
+
+from pathlib import Path
+from typing import Union
+
+import torch
+from transformers import AutoConfig, BartForQuestionAnswering
+
+from itk_transformer_nlp.cli_args import DEFAULT_CACHE_DIR
+from itk_transformer_nlp.model_loading import get_checkpoint_fingerprint
+
+
+def quantize_model(model: BartForQuestionAnswering) -> BartForQuestionAnswering:
+    """Apply dynamic int8 quantization to the `nn.Linear` layers of a model"""
+    return torch.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def get_quantized_model_path(model_name: str, cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR) -> Path:
+    """Get the path where the quantized weights of a model are cached.
+    The file name contains the PyTorch version, as the format of
+    the quantized weights is not guaranteed to be stable. If the model
+    is a local checkpoint, it also contains the fingerprint of the checkpoint
+    (see `get_checkpoint_fingerprint`), so that a re-saved checkpoint is quantized again
+    """
+    file_stem = model_name.replace("/", "--")
+    fingerprint = get_checkpoint_fingerprint(model_name)
+    if fingerprint is not None:
+        file_stem += f"-{fingerprint}"
+    return Path(cache_dir) / f"{file_stem}-int8-torch{torch.__version__}.pt"
+
+
+def load_quantized_model(
+        model_name: str,
+        cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR
+) -> BartForQuestionAnswering:
+    """Load a dynamically quantized QA model
+
+    If the quantized weights are cached, the model is built from its
+    configuration and the cached weights are loaded. Otherwise, the full
+    precision model is loaded, quantized and its weights are cached.
+
+    Args:
+        model_name: The model identifier or the path to the model directory
+        cache_dir: The directory where the quantized weights are cached.
+            Defaults to `DEFAULT_CACHE_DIR`
+
+    Returns:
+        The quantized model in evaluation mode
+    """
+    quantized_model_path = get_quantized_model_path(model_name, cache_dir)
+    if quantized_model_path.is_file():
+        model = quantize_model(BartForQuestionAnswering(AutoConfig.from_pretrained(model_name)))
+        #  The packed quantized weights are not plain tensors, and the cache is written by this function
+        model.load_state_dict(torch.load(quantized_model_path, weights_only=False))
+        return model
+    model = quantize_model(BartForQuestionAnswering.from_pretrained(model_name))
+    quantized_model_path.parent.mkdir(parents=True, exist_ok=True)
+    torch.save(model.state_dict(), quantized_model_path)
+    return model
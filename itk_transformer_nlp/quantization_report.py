@@ -0,0 +1,104 @@
+"""Compare the int8 quantized and the full precision QA models
+
+The script calculates the SQuAD exact match and F1 scores and the throughput
+of both models on a SQuAD sample (e.g. the one downloaded with
+`download_dataset.py`), then prints the scores and their differences
+in JSON format.
+"""
+
+import json
+from argparse import ArgumentParser, Namespace
+from time import perf_counter
+from typing import Dict, Optional
+
+from datasets import Dataset, load_metric
+from transformers import (
+    BartForQuestionAnswering,
+    BartTokenizer,
+    PreTrainedTokenizerBase
+)
+
+from itk_transformer_nlp.cli_args import DEFAULT_CACHE_DIR, check_positive_int
+from itk_transformer_nlp.transformer_qa import (
+    load_jsonl_dataset,
+    tokenize_dataset,
+    get_predictions
+)
+from itk_transformer_nlp.qa_cascade import ScreeningCascade
+from itk_transformer_nlp.qa_spans import DEFAULT_TOP_K
+from itk_transformer_nlp.quantization import load_quantized_model
+
+
+def evaluate_on_squad(
+        model: BartForQuestionAnswering,
+        dataset: Dataset,
+        tokenizer: PreTrainedTokenizerBase,
+        batch_size: int,
+        max_seq_length: Optional[int] = None,
+        cascade: Optional[ScreeningCascade] = None
+) -> Dict[str, float]:
+    """Calculate the SQuAD exact match and F1 scores and the throughput of a model
+
+    Args:
+        model: A BART model fine-tuned for QA
+        dataset: A SQuAD dataset with the columns `id`, `question`, `context` and `answers`
+        tokenizer: A pre-trained BART tokenizer
+        batch_size: Batch size used to process data
+        max_seq_length: Optional. The maximal sequence length in tokens
+        cascade: Optional. A cascade whose screening model is run before `model`, see `get_predictions`
+
+    Returns:
+        A `dict` with the keys `exact_match`, `f1` and `examples_per_second`
+    """
+    data_loader = tokenize_dataset(dataset, ("question", "context"), tokenizer, batch_size,
+                                   max_seq_length, remove_old_cols=False, dynamic_padding=True)
+    start_time = perf_counter()
+    answers = [triplet[-1] for triplet in get_predictions(
+        model, data_loader, tokenizer, span_top_k=DEFAULT_TOP_K, cascade=cascade)]
+    elapsed_time = perf_counter() - start_time
+    metric = load_metric("squad")
+    scores = metric.compute(
+        predictions=[{"id": example_id, "prediction_text": "" if answer == "NA" else answer}
+                     for example_id, answer in zip(dataset["id"], answers)],
+        references=[{"id": example_id, "answers": example_answers}
+                    for example_id, example_answers in zip(dataset["id"], dataset["answers"])]
+    )
+    scores["examples_per_second"] = len(answers) / elapsed_time
+    return scores
+
+
+def get_quantization_report_args() -> Namespace:
+    """Get command line arguments"""
+    parser = ArgumentParser(description="Compare the int8 quantized and the full precision QA models")
+    parser.add_argument("dataset", type=load_jsonl_dataset,
+                        help="Path to the jsonlines SQuAD dataset file")
+    parser.add_argument("--model-name", dest="model_name", default="a-ware/bart-squadv2",
+                        help="The model identifier. Defaults to `a-ware/bart-squadv2`")
+    parser.add_argument("--max-seq-length", dest="max_seq_length", type=check_positive_int, default=256,
+                        help="Maximal sequence length in tokens. Defaults to 256")
+    parser.add_argument("--batch-size", dest="batch_size", type=check_positive_int, default=2,
+                        help="Batch size used to process data. Defaults to 2")
+    parser.add_argument("--cache-dir", dest="cache_dir", default=DEFAULT_CACHE_DIR,
+                        help=f"Directory where the quantized weights are cached. Defaults to `{DEFAULT_CACHE_DIR}`")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Main function: print an accuracy-delta report in JSON format"""
+    args = get_quantization_report_args()
+    tokenizer = BartTokenizer.from_pretrained(args.model_name)
+    model_loaders = (
+        ("fp32", lambda: BartForQuestionAnswering.from_pretrained(args.model_name)),
+        ("int8", lambda: load_quantized_model(args.model_name, args.cache_dir))
+    )
+    report = {}
+    #  The models are loaded one by one so that only one of them is kept in memory
+    for model_type, load_model in model_loaders:
+        report[model_type] = evaluate_on_squad(
+            load_model(), args.dataset, tokenizer, args.batch_size, args.max_seq_length)
+    report["delta"] = {key: report["int8"][key] - report["fp32"][key] for key in report["fp32"]}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
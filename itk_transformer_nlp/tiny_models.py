@@ -0,0 +1,95 @@
+"""Tiny randomly initialized BART and BERT models
+
+The models have the same architectures as the QA and the CoLA models,
+but they are very small and they are built from configurations, so they
+can be used offline, e.g. in benchmarks and tests. Their predictions are
+meaningless.
+
+The BART tokenizer is a byte-level BPE tokenizer with a few merges, the
+BERT tokenizer has a vocabulary of characters and a few words.
+"""
+
+import json
+from pathlib import Path
+from typing import Tuple, Union
+
+import torch
+from transformers import (
+    BartConfig,
+    BartForQuestionAnswering,
+    BartTokenizer,
+    BertConfig,
+    BertForSequenceClassification,
+    BertTokenizer
+)
+from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+
+TINY_MAX_SEQ_LENGTH = 512
+_BART_MERGES = ("Ġ t", "h e", "Ġt he", "Ġ a", "i n", "Ġ i", "e r", "o n", "a n", "Ġ s")
+_BERT_WORDS = ("the", "is", "this", "sentence", "correct", "not", "##s", "##ed", "##ing")
+
+
+def create_tiny_bart(
+        model_dir: Union[str, Path],
+        seed: int = 42
+) -> Tuple[BartTokenizer, BartForQuestionAnswering]:
+    """Create a tiny BART QA model and its tokenizer and save them
+
+    Args:
+        model_dir: The directory where the tokenizer files and the model are saved.
+            `BartTokenizerFast` can also be loaded from here
+        seed: Random seed for weight initialization. Defaults to `42`
+
+    Returns:
+        The tokenizer and the model in evaluation mode
+    """
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    vocab = {"<s>": 0, "<pad>": 1, "</s>": 2, "<unk>": 3}
+    for char in bytes_to_unicode().values():
+        vocab[char] = len(vocab)
+    for merge in _BART_MERGES:
+        vocab["".join(merge.split())] = len(vocab)
+    vocab["<mask>"] = len(vocab)
+    (model_dir / "vocab.json").write_text(json.dumps(vocab), encoding="utf-8")
+    (model_dir / "merges.txt").write_text("\n".join(("#version: 0.2",) + _BART_MERGES) + "\n", encoding="utf-8")
+    tokenizer = BartTokenizer(str(model_dir / "vocab.json"), str(model_dir / "merges.txt"))
+    tokenizer.save_pretrained(str(model_dir))
+    torch.manual_seed(seed)
+    config = BartConfig(
+        vocab_size=len(vocab), d_model=32, encoder_layers=1, decoder_layers=1,
+        encoder_attention_heads=2, decoder_attention_heads=2, encoder_ffn_dim=64,
+        decoder_ffn_dim=64, max_position_embeddings=TINY_MAX_SEQ_LENGTH)
+    model = BartForQuestionAnswering(config)
+    model.save_pretrained(str(model_dir))
+    return tokenizer, model.eval()
+
+
+def create_tiny_bert(
+        model_dir: Union[str, Path],
+        seed: int = 42
+) -> Tuple[BertTokenizer, BertForSequenceClassification]:
+    """Create a tiny BERT classifier with two classes and its tokenizer and save them
+
+    Args:
+        model_dir: The directory where the tokenizer files and the model are saved.
+            `BertTokenizerFast` can also be loaded from here
+        seed: Random seed for weight initialization. Defaults to `42`
+
+    Returns:
+        The tokenizer and the model in evaluation mode
+    """
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    vocab += list("abcdefghijklmnopqrstuvwxyz0123456789.,?!-'") + list(_BERT_WORDS)
+    (model_dir / "vocab.txt").write_text("\n".join(vocab) + "\n", encoding="utf-8")
+    tokenizer = BertTokenizer(str(model_dir / "vocab.txt"))
+    tokenizer.save_pretrained(str(model_dir))
+    torch.manual_seed(seed)
+    config = BertConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=1, num_attention_heads=2,
+        intermediate_size=64, max_position_embeddings=TINY_MAX_SEQ_LENGTH, num_labels=2)
+    model = BertForSequenceClassification(config)
+    model.save_pretrained(str(model_dir))
+    return tokenizer, model.eval()
@@ -0,0 +1,113 @@
+"""An on-disk cache of tokenized datasets
+
+`Dataset.map` caches its results with a fingerprint of the mapped function,
+which changes whenever the tokenizer object changes (e.g. when it is
+loaded again or its attributes are set), so tokenization is often re-run although the
+data and the settings are the same. `TokenizationCache` uses an explicit key
+instead: the fingerprint of the dataset, a hash of the tokenizer vocabulary,
+merges and configuration, and the tokenization settings (e.g. the column names and
+the maximal sequence length).
+
+Tokenized datasets are saved as Arrow files. Later runs reopen them with
+`Dataset.load_from_disk`, which memory-maps the files instead of reading them.
+"""
+
+import json
+import shutil
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from datasets import Dataset
+from transformers import PreTrainedTokenizerBase, PreTrainedTokenizerFast
+
+from itk_transformer_nlp.cli_args import DEFAULT_CACHE_DIR
+
+DEFAULT_TOKENIZATION_CACHE_DIR = DEFAULT_CACHE_DIR / "tokenized"
+
+
+def _get_tokenization_model(
+        tokenizer: PreTrainedTokenizerBase
+) -> Optional[Union[Dict[str, Any], List[Tuple[str, str]]]]:
+    """Helper function to get the state of the tokenizer that the vocabulary does not contain, e.g. the
+    BPE merges. This is the state of the backend of fast tokenizers and the merges of slow BPE tokenizers
+    """
+    if isinstance(tokenizer, PreTrainedTokenizerFast):
+        backend_state = json.loads(tokenizer.backend_tokenizer.to_str())
+        #  The truncation and padding settings of the backend are changed by the calls of the tokenizer
+        return {key: value for key, value in backend_state.items() if key not in ("truncation", "padding")}
+    bpe_ranks = getattr(tokenizer, "bpe_ranks", None)
+    return sorted(bpe_ranks, key=bpe_ranks.__getitem__) if bpe_ranks is not None else None
+
+
+def get_tokenizer_fingerprint(tokenizer: PreTrainedTokenizerBase) -> str:
+    """Get a hash of the tokenizer class, vocabulary, merges, special tokens and configuration"""
+    init_kwargs = {key: value for key, value in tokenizer.init_kwargs.items()
+                   if isinstance(value, (str, int, float, bool, type(None))) and not key.endswith("_file")}
+    tokenizer_data = {
+        "class": type(tokenizer).__name__,
+        "vocab": sorted(tokenizer.get_vocab().items()),
+        "tokenization_model": _get_tokenization_model(tokenizer),
+        "special_tokens": tokenizer.special_tokens_map,
+        "init_kwargs": init_kwargs,
+        "padding_side": tokenizer.padding_side,
+        "truncation_side": tokenizer.truncation_side
+    }
+    return sha256(json.dumps(tokenizer_data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class TokenizationCache:
+    """A directory of tokenized datasets whose names are the cache keys"""
+
+    def __init__(self, cache_dir: Union[str, Path] = DEFAULT_TOKENIZATION_CACHE_DIR) -> None:
+        """Initialize the cache
+
+        Args:
+            cache_dir: The directory where the tokenized datasets are saved.
+                Defaults to `DEFAULT_TOKENIZATION_CACHE_DIR`
+        """
+        self.cache_dir = Path(cache_dir)
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, dataset: Dataset, tokenizer: PreTrainedTokenizerBase, **settings: Any) -> str:
+        """Get the cache key of a dataset tokenized with the specified tokenizer and settings"""
+        key_data = {
+            "dataset": dataset._fingerprint,  # pylint: disable=protected-access
+            "tokenizer": get_tokenizer_fingerprint(tokenizer),
+            "settings": settings
+        }
+        return sha256(json.dumps(key_data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get_or_tokenize(
+            self,
+            dataset: Dataset,
+            tokenizer: PreTrainedTokenizerBase,
+            tokenize_func: Callable[[Dataset], Dataset],
+            **settings: Any
+    ) -> Dataset:
+        """Load a tokenized dataset from the cache or tokenize and save it
+
+        Args:
+            dataset: The input data as a `datasets.Dataset` object
+            tokenizer: The tokenizer that `tokenize_func` uses
+            tokenize_func: A function that takes `dataset` and returns the tokenized dataset
+            **settings: Every further setting that affects the output of `tokenize_func`,
+                e.g. the column names and the maximal sequence length. The values should
+                be JSON serializable
+
+        Returns:
+            The tokenized dataset, memory-mapped from the cache directory
+        """
+        dataset_path = self.cache_dir / self.get_key(dataset, tokenizer, **settings)
+        if dataset_path.is_dir():
+            self.hits += 1
+        else:
+            self.misses += 1
+            #  The dataset is saved to a temporary directory first, so that an interrupted
+            #  run does not leave an incomplete dataset in the cache
+            temp_path = dataset_path.with_name(dataset_path.name + ".tmp")
+            shutil.rmtree(temp_path, ignore_errors=True)
+            tokenize_func(dataset).save_to_disk(str(temp_path))
+            temp_path.rename(dataset_path)
+        return Dataset.load_from_disk(str(dataset_path))
@@ -19,23 +19,82 @@ Task:
     with your own code unless instructed otherwise in the comments
 """
 
-from argparse import ArgumentParser, Namespace
+from argparse import Namespace
+from functools import partial
+from itertools import chain, count
 from typing import (
-    Tuple, Dict, Any, Sequence, Generator, Optional, Union)
+    Tuple, Dict, Any, Callable, Sequence, Generator, Iterable, Iterator, Optional, Union, List)
+import json
 import re
+import sys
 
 import torch
 from torch.utils.data import DataLoader
-from datasets import Dataset, load_dataset
+from datasets import Dataset, IterableDataset, load_dataset
 from transformers import (
+    AutoModelForQuestionAnswering,
     BartForQuestionAnswering,
     BartTokenizer,
-    PreTrainedTokenizer,
+    BartTokenizerFast,
+    PreTrainedTokenizerBase,
     BatchEncoding
 )
 
+from itk_transformer_nlp.cli_args import get_qa_args
+from itk_transformer_nlp.qa_batching import (
+    EXAMPLE_IDX_COL,
+    QUESTION_COL,
+    CONTEXT_COL,
+    get_column_names,
+    tokenize_without_padding,
+    get_dynamic_padding_loader,
+    trim_padding,
+    restore_padding,
+    restore_order
+)
+from itk_transformer_nlp.qa_windows import (
+    NUM_WINDOWS_COL,
+    CONTEXT_START_COL,
+    CONTEXT_END_COL,
+    OFFSET_MAPPING_COL,
+    WINDOW_COLS,
+    tokenize_windowed,
+    get_best_window_spans,
+    WindowSpanMerger
+)
+from itk_transformer_nlp.qa_grouped import (
+    CONTEXT_IDS_COL,
+    GROUP_IDX_COL,
+    tokenize_contexts,
+    tokenize_questions,
+    GroupBatchSampler,
+    SharedContextCollator
+)
+from itk_transformer_nlp.qa_cache import AnswerCache
+from itk_transformer_nlp.qa_cascade import ScreeningCascade
+from itk_transformer_nlp.qa_retrieval import BM25Index, QUESTION_IDX_COL, retrieve_passages, select_best_answers
+from itk_transformer_nlp.onnx_backend import OnnxQAModel
+from itk_transformer_nlp.model_loading import get_checkpoint_fingerprint, load_mmap_model, report_peak_rss
+from itk_transformer_nlp.qa_output import ResultWriter, get_record
+from itk_transformer_nlp.qa_pipeline import prefetch, map_in_background
+from itk_transformer_nlp.qa_sharding import predict_sharded
+from itk_transformer_nlp.tokenization_cache import TokenizationCache
+from itk_transformer_nlp.qa_timing import StageTimer
+from itk_transformer_nlp.quantization import load_quantized_model
+from itk_transformer_nlp.qa_spans import (
+    DEFAULT_TOP_K,
+    DEFAULT_MAX_ANSWER_LENGTH,
+    find_best_spans,
+    get_span_token_ids,
+    get_span_char_offsets
+)
+
 
-def load_jsonl_dataset(dataset_path: str, cache_dir: Optional[str] = None) -> Dataset:
+def load_jsonl_dataset(
+        dataset_path: str,
+        cache_dir: Optional[str] = None,
+        streaming: bool = False
+) -> Union[Dataset, IterableDataset]:
     """Load a dataset from a jsonlines file
 
     Args:
@@ -43,62 +102,73 @@ def load_jsonl_dataset(dataset_path: str, cache_dir: Optional[str] = None) -> Da
         cache_dir: Optional. Cache directory to read/write data.
             This can also be set by setting the `HF_DATASETS_CACHE` environment variable.
             By default, the `~/.cache/huggingface/datasets` will be used
+        streaming: If `True`, the file is not converted to an Arrow cache. Instead, an
+            `IterableDataset` is returned that reads the lines lazily. Defaults to `False`
     """
     #  It is expected that the locally stored dataset is not divided to splits.
     #  In this case, simply specify `"train"` as the value of the `split` argument of `load_dataset`
-    return load_dataset("json", data_files=dataset_path, split="train", cache_dir=cache_dir)
-
-
-def check_positive_int(input_int: Union[str, int]) -> int:
-    """Check if `input_int` is a positive integer.
-    If it is, return it as an `int`. Raise `TypeError` otherwise
-    """
-    input_int = int(input_int)
-    if input_int <= 0:
-        raise ValueError(f"A positive integer is expected, got {input_int}")
-    return input_int
-
-
-def get_qa_args() -> Namespace:
-    """Get command line arguments"""
-    parser = ArgumentParser(description="Arguments for QA inference")
-    parser.add_argument("dataset", type=load_jsonl_dataset,
-                        help="Path to the jsonlines dataset file")
-    parser.add_argument("--text-col-names", dest="text_col_names", nargs="+",
-                        default=["question", "context"],
-                        help="Names of the dataset columns that contain the text data. "
-                             "Defaults to `['question', 'context']`")
-    parser.add_argument("--max-seq-length", dest="max_seq_length", type=check_positive_int, default=256,
-                        help="Maximal sequence length in tokens. If a sequence is longer, "
-                             "it will be truncated. Defaults to 256")
-    parser.add_argument("--batch-size", dest="batch_size", type=check_positive_int, default=2,
-                        help="Batch size used to process data. Defaults to 2")
-    return parser.parse_args()
+    return load_dataset("json", data_files=dataset_path, split="train", cache_dir=cache_dir, streaming=streaming)
 
 
 def tokenize_dataset(
-        dataset: Dataset,
+        dataset: Union[Dataset, IterableDataset],
         text_col_names: Sequence[str],
-        tokenizer: PreTrainedTokenizer,
+        tokenizer: PreTrainedTokenizerBase,
         batch_size: int,
         max_seq_length: Optional[int] = None,
-        remove_old_cols: bool = True
+        remove_old_cols: bool = True,
+        dynamic_padding: bool = False,
+        doc_stride: Optional[int] = None,
+        return_offsets_mapping: bool = False,
+        tokenization_cache: Optional[TokenizationCache] = None,
+        max_tokens: Optional[int] = None,
+        grouped: bool = False
 ) -> DataLoader:
     """Tokenize a dataset
 
     Args:
-        dataset: The input data as a `datasets.Dataset` object
+        dataset: The input data as a `datasets.Dataset` object. If it is a `datasets.IterableDataset`,
+            it is tokenized lazily and each batch is padded to its longest sequence, as in the case of
+            `dynamic_padding`, but the examples are not grouped by length
         text_col_names: The dataset columns (which can also be called keys) that contain the text data.
             None of them should be `"input_ids"`, `"attention_mask"` or `"token_type_ids"` as those are
             the columns returned by the tokenizer. Text data will be fed to the tokenizer in the order
             the elements are specified in `text_col_names`
-        tokenizer: A pre-trained tokenizer
+        tokenizer: A pre-trained tokenizer. Both slow and fast tokenizers are supported
         batch_size: Batch size for tokenization
         max_seq_length: Optional. If the number of tokens in a sequence is `n` and
             `n` > `max_seq_length`, the sequence will be truncated. This means cutting off
             the last `n - max_seq_length` tokens. If not specified, truncation will not be used
         remove_old_cols: If `True`, the original dataset columns (that can be also called keys)
             will be removed, leaving only the columns created after tokenization. Defaults to `True`
+        dynamic_padding: If `True`, sequences will not be padded during tokenization. Instead,
+            examples of similar length will be grouped into the same batch and each batch
+            will be padded to its longest sequence. The original position of each example
+            is stored in the `EXAMPLE_IDX_COL` column of the batches. Defaults to `False`
+        doc_stride: Optional. If specified, the contexts will be split into overlapping windows
+            instead of being truncated, and `doc_stride` is the number of context tokens shared by
+            two consecutive windows. `text_col_names` should then contain a question and a context
+            column and `max_seq_length` is required. The original columns are always removed in this case
+        return_offsets_mapping: If `True`, the original texts and the character offsets of the
+            context tokens will be kept in the batches, so that answers can be sliced from the
+            contexts. This requires a fast tokenizer, a question and a context column and
+            `max_seq_length`. If the context is too long, it is truncated. The original columns
+            are always removed in this case. Defaults to `False`
+        tokenization_cache: Optional. If specified, the tokenized dataset is loaded from this cache
+            or saved to it. This is only used with `dynamic_padding`, `doc_stride` or
+            `return_offsets_mapping`, as the padded datasets are created by `tok_func`
+            below, and it is not used for a `datasets.IterableDataset`
+        max_tokens: Optional. If specified, the sequences are not padded during tokenization, and
+            the batches are limited by this number of tokens after padding instead of `batch_size`
+            (see `TokenBudgetBatchSampler`). Examples of similar length are packed into the same
+            batch if `dynamic_padding` is `True`
+        grouped: If `True`, each example is expected to contain a context and a list of questions
+            about it, in the columns of `text_col_names` (the question column first). Each context
+            is tokenized only once, and the questions of a context are put into the same batch if
+            possible (see `qa_grouped.py`). The outputs are in the order of the flattened questions.
+            The batches are always padded to their longest sequence. This cannot be used with
+            `doc_stride`, `return_offsets_mapping`, `max_tokens` or a `datasets.IterableDataset`.
+            Defaults to `False`
 
     Returns:
          The tokenized dataset as a `DataLoader`
@@ -106,13 +176,58 @@ def tokenize_dataset(
     tokenizer_cols = tokenizer("Dummy text").keys()
     if set(text_col_names) & tokenizer_cols:
         raise ValueError(f"Invalid text column names: {text_col_names}")
+
+    def get_tokenized(tokenize_func: Callable[[Dataset], Dataset], **settings: Any) -> Dataset:
+        if tokenization_cache is None or isinstance(dataset, IterableDataset):
+            return tokenize_func(dataset)
+        return tokenization_cache.get_or_tokenize(
+            dataset, tokenizer, tokenize_func, text_col_names=list(text_col_names),
+            max_seq_length=max_seq_length, **settings)
+
+    if grouped:
+        if doc_stride is not None or return_offsets_mapping or max_tokens is not None \
+                or isinstance(dataset, IterableDataset):
+            raise ValueError("Grouped questions cannot be split into windows, sliced with offset mappings, "
+                             "batched by a token budget or streamed")
+        if len(text_col_names) != 2:
+            raise ValueError(f"A question and a context column are expected, got {text_col_names}")
+        question_col, context_col = text_col_names
+        contexts = get_tokenized(lambda data: tokenize_contexts(data, context_col, tokenizer, batch_size),
+                                 mode="grouped_contexts")
+        questions = get_tokenized(lambda data: tokenize_questions(data, question_col, tokenizer, batch_size),
+                                  mode="grouped_questions")
+        return DataLoader(questions, batch_sampler=GroupBatchSampler(questions[GROUP_IDX_COL], batch_size),
+                          collate_fn=SharedContextCollator(contexts[CONTEXT_IDS_COL], tokenizer, max_seq_length))
+    if doc_stride is not None or return_offsets_mapping:
+        if max_seq_length is None:
+            raise ValueError("The maximal sequence length is required to find the context tokens")
+        #  Without a stride, only a single window (i.e. the truncated context) is used
+        dataset = get_tokenized(
+            lambda data: tokenize_windowed(
+                data, text_col_names, tokenizer, batch_size, max_seq_length, doc_stride or 0,
+                max_num_windows=None if doc_stride is not None else 1,
+                return_offsets_mapping=return_offsets_mapping),
+            mode="windows", doc_stride=doc_stride, return_offsets_mapping=return_offsets_mapping)
+        extra_cols = WINDOW_COLS + (OFFSET_MAPPING_COL,) if return_offsets_mapping else WINDOW_COLS
+        return get_dynamic_padding_loader(dataset, tokenizer_cols, tokenizer.pad_token_id, batch_size,
+                                          extra_cols=extra_cols, bucket_by_length=dynamic_padding,
+                                          max_tokens=max_tokens)
+    if dynamic_padding or max_tokens is not None or isinstance(dataset, IterableDataset):
+        remove_columns = get_column_names(dataset) if remove_old_cols else None
+        dataset = get_tokenized(
+            lambda data: tokenize_without_padding(
+                data, text_col_names, tokenizer, batch_size, max_seq_length, remove_columns=remove_columns),
+            mode="without_padding", remove_columns=remove_columns)
+        return get_dynamic_padding_loader(dataset, tokenizer_cols, tokenizer.pad_token_id, batch_size,
+                                          bucket_by_length=dynamic_padding, max_tokens=max_tokens)
+
     #  Do not edit `None` in the next line
     cols_to_remove = list(dataset.features.keys()) if remove_old_cols else None
-    tokenizer.model_max_length = max_seq_length
 
     def tok_func(example: Dict[str, Any]) -> BatchEncoding:
         text_cols = [example[text_col_name] for text_col_name in text_col_names]
         #  Call the tokenizer on the text data, turn on padding and truncation.
+        #  Sequences should be truncated to `max_seq_length` tokens (if it is specified).
         #  Feel free to browse the documentation:
         #  https://huggingface.co/docs/transformers/v4.17.0/en/main_classes/tokenizer
         return None
@@ -196,60 +311,501 @@ def clean_decoded_batch(
 
 
 def get_predictions(
-        model: BartForQuestionAnswering,
+        model: Union[BartForQuestionAnswering, OnnxQAModel],
         data_loader: DataLoader,
         tokenizer: BartTokenizer,
-        input_ids_name: str = "input_ids"
-) -> Generator[Tuple[str, str, str], None, None]:
+        input_ids_name: str = "input_ids",
+        span_top_k: Optional[int] = None,
+        max_answer_length: int = DEFAULT_MAX_ANSWER_LENGTH,
+        device: Optional[torch.device] = None,
+        use_bf16: bool = False,
+        warmup: bool = False,
+        return_details: bool = False,
+        timer: Optional[StageTimer] = None,
+        prefetch_batches: int = 0,
+        cascade: Optional[ScreeningCascade] = None
+) -> Generator[Union[Tuple[str, str, str], Tuple[str, str, str, Dict[str, Any]]], None, None]:
     """Use the model for inference
 
+    The model is run in inference mode, i.e. without autograd bookkeeping.
+    The trailing padding columns of each batch are removed before the forward pass
+    (see `trim_padding`), and the logits are padded back to the width of the batch.
+
     Args:
-        model: A BART model fine-tuned for QA
+        model: A BART model fine-tuned for QA or a backend that runs it, i.e. a callable
+            that takes the model inputs and returns the start and end logits as `float32`
+            tensors on the CPU (e.g. `OnnxQAModel`). `device` and `use_bf16` do not affect backends
         data_loader: A `DataLoader` that outputs dicts whose keys are strings
-            and the values are PyTorch tensors of shape `(batch_size, sequence_length)`
+            and the values are PyTorch tensors of shape `(batch_size, sequence_length)`.
+            If the dicts contain the key `EXAMPLE_IDX_COL`, its values are not passed to the
+            model but used to yield the outputs in the original order of the examples.
+            If the dicts contain context windows (see `tokenize_dataset`), the best answer
+            of all windows is selected for each example. If they also contain offset mappings,
+            the answers are sliced from the original contexts
         tokenizer: A pre-trained BART tokenizer for decoding
         input_ids_name: The key in the data loader outputs that indicates input token IDs.
             Defaults to `input_ids`
+        span_top_k: Optional. If specified, answers will be found by scoring the `span_top_k`
+            best start and end positions jointly (see `find_best_spans`) instead of using
+            `extract_answer`. Context windows are always processed this way, with
+            `DEFAULT_TOP_K` positions if `span_top_k` is not specified
+        max_answer_length: The maximal number of tokens in an answer if answers are found
+            by joint span search. Defaults to `DEFAULT_MAX_ANSWER_LENGTH`
+        device: Optional. The device where the model and the input batches will be put.
+            If not specified, the model is not moved and batches are put on its device
+        use_bf16: If `True`, the forward pass runs with `bfloat16` autocast. Defaults to `False`
+        warmup: If `True`, the model is called on the first batch once before the
+            actual inference. Defaults to `False`
+        return_details: If `True`, a `dict` is added to each triplet with the keys `score`
+            (the sum of the answer start and end scores), `answer_start` and `answer_end`
+            (the character offsets of the answer in the context, only available if the
+            answers are sliced with offset mappings). The values are `None` if they are
+            not available or the answer is `NA`. Defaults to `False`
+        timer: Optional. A `StageTimer` that records the time of data loading, the forward
+            pass, answer extraction and decoding, and counts the examples and tokens,
+            including the padding tokens that were trimmed before the forward pass
+        prefetch_batches: If positive, this many batches are loaded ahead in a background thread
+            while the model runs, and the answers are decoded in another background thread
+            with at most this many batches waiting (see `qa_pipeline.py`). The stage times of
+            `timer` overlap in this case. Defaults to `0`, i.e. the stages run one after the other
+        cascade: Optional. If specified, its screening model is run on every batch first, and
+            `model` is only run on the examples that the cascade routes to it (see `qa_cascade.py`).
+            The routed examples are counted as `routed_examples` by `timer`. Context windows
+            cannot be screened
 
     Returns:
         A generator of `question - context - answer` triplets
     """
-    pad_id = tokenizer.pad_token_id
-    cleaning_pattern = re.compile(
-        "|".join([tokenizer.cls_token, tokenizer.pad_token, tokenizer.sep_token]))
-    for batch in data_loader:
+    for module in (model, cascade.screening_model if cascade is not None else None):
+        if isinstance(module, torch.nn.Module):
+            if device is not None:
+                module.to(device)
+            module.eval()
+    predictions = restore_order(_get_indexed_predictions(
+        model, data_loader, tokenizer, input_ids_name, span_top_k, max_answer_length,
+        use_bf16=use_bf16, warmup=warmup, timer=timer, prefetch_batches=prefetch_batches, cascade=cascade))
+    if return_details:
+        return (triplet + (details,) for triplet, details in predictions)
+    return (triplet for triplet, _ in predictions)
+
+
+def _run_model(
+        model: Union[BartForQuestionAnswering, OnnxQAModel],
+        model_inputs: Dict[str, torch.Tensor],
+        use_bf16: bool
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Helper function to call the model on the device where it is and return
+    the start and end logits as `float32` tensors on the CPU
+    """
+    if not isinstance(model, torch.nn.Module):
+        return model(model_inputs)
+    device = next(model.parameters()).device
+    model_inputs = {key: value.to(device) for key, value in model_inputs.items()}
+    with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_bf16):
         start_logits, end_logits = model(
-            **batch, output_attentions=False, return_dict=False)[:2]
+            **model_inputs, output_attentions=False, return_dict=False)[:2]
+    return start_logits.float().cpu(), end_logits.float().cpu()
+
+
+def _run_cascade(
+        model: Union[BartForQuestionAnswering, OnnxQAModel],
+        cascade: ScreeningCascade,
+        model_inputs: Dict[str, torch.Tensor],
+        use_bf16: bool
+) -> Tuple[torch.Tensor, torch.Tensor, int]:
+    """Helper function to run the screening model of a cascade on a batch and the model on the
+    routed examples. The aligned logits of the screening model (see `ScreeningCascade.align_logits`)
+    are replaced by those of the model for the routed examples, and the number of routed examples
+    is also returned
+    """
+    screening_logits = _run_model(cascade.screening_model, model_inputs, use_bf16)
+    is_routed = cascade.route(*screening_logits)
+    start_logits, end_logits = (cascade.align_logits(logits) for logits in screening_logits)
+    num_routed = int(is_routed.sum())
+    if num_routed > 0:
+        routed_inputs, _ = trim_padding({key: value[is_routed] for key, value in model_inputs.items()})
+        for logits, routed_logits in zip((start_logits, end_logits), _run_model(model, routed_inputs, use_bf16)):
+            logits[is_routed] = restore_padding(routed_logits, logits.shape[1])
+    return start_logits, end_logits, num_routed
+
+
+@torch.inference_mode()
+def _get_indexed_predictions(
+        model: Union[BartForQuestionAnswering, OnnxQAModel],
+        data_loader: DataLoader,
+        tokenizer: BartTokenizer,
+        input_ids_name: str,
+        span_top_k: Optional[int],
+        max_answer_length: int,
+        use_bf16: bool = False,
+        warmup: bool = False,
+        timer: Optional[StageTimer] = None,
+        prefetch_batches: int = 0,
+        cascade: Optional[ScreeningCascade] = None
+) -> Generator[Tuple[int, Tuple[Tuple[str, str, str], Dict[str, Any]]], None, None]:
+    """Helper function to get predictions and their details (see `get_predictions`)
+    together with the example indices. The arguments are the same as those of `get_predictions`
+    """
+    timer = timer or StageTimer(enabled=False)
+    batches = prefetch(data_loader, prefetch_batches) if prefetch_batches else iter(data_loader)
+    extracted_batches = _get_extracted_batches(
+        model, batches, tokenizer, input_ids_name, span_top_k, max_answer_length, use_bf16, warmup, timer, cascade)
+    decode_batch = partial(
+        _decode_batch, tokenizer=tokenizer, input_ids_name=input_ids_name, span_top_k=span_top_k, timer=timer,
+        window_merger=WindowSpanMerger(), window_texts={}, cleaning_pattern=re.compile(
+            "|".join([tokenizer.cls_token, tokenizer.pad_token, tokenizer.sep_token])))
+    if prefetch_batches:
+        decoded_batches = map_in_background(decode_batch, extracted_batches, prefetch_batches)
+    else:
+        decoded_batches = map(decode_batch, extracted_batches)
+    for outputs in decoded_batches:
+        yield from outputs
+
+
+def _get_extracted_batches(
+        model: Union[BartForQuestionAnswering, OnnxQAModel],
+        batches: Iterator[Dict[str, Any]],
+        tokenizer: BartTokenizer,
+        input_ids_name: str,
+        span_top_k: Optional[int],
+        max_answer_length: int,
+        use_bf16: bool,
+        warmup: bool,
+        timer: StageTimer,
+        cascade: Optional[ScreeningCascade] = None
+) -> Generator[Tuple[torch.Tensor, Dict[str, Any], Tuple[Any, ...]], None, None]:
+    """Helper function to run the model on the batches and find the answers
+
+    Returns:
+        A generator of `(example_ids, batch, extracted)` tuples. `extracted` is `(answer_starts,
+        answer_ends, span_scores)` if the answers are found by joint span search, `(span_scores,
+        answers)` (see `_get_window_answers`) if the batch contains context windows and
+        `(answers, scores)` (see `extract_answer`) otherwise
+    """
+    num_examples = 0
+    while True:
+        with timer.stage("data_loading"):
+            batch = next(batches, None)
+        if batch is None:
+            break
+        example_ids = batch.pop(EXAMPLE_IDX_COL, None)
+        if example_ids is None:
+            example_ids = torch.arange(num_examples, num_examples + batch[input_ids_name].shape[0])
+        num_examples += example_ids.shape[0]
+        model_inputs, num_trimmed = trim_padding(
+            {key: value for key, value in batch.items() if key in tokenizer.model_input_names})
+        if cascade is not None and CONTEXT_START_COL in batch:
+            raise ValueError("Context windows cannot be screened by a cascade")
+        if warmup:
+            _run_model(model, model_inputs, use_bf16)
+            if cascade is not None:
+                _run_model(cascade.screening_model, model_inputs, use_bf16)
+            warmup = False
         input_ids = batch[input_ids_name]
-        answers = extract_answer(input_ids, start_logits, end_logits, pad_id)
+        with timer.stage("forward"):
+            if cascade is None:
+                logits = _run_model(model, model_inputs, use_bf16)
+            else:
+                *logits, num_routed = _run_cascade(model, cascade, model_inputs, use_bf16)
+                timer.count("routed_examples", num_routed)
+            start_logits, end_logits = (restore_padding(outputs, input_ids.shape[1]) for outputs in logits)
+        if timer.enabled:
+            timer.count("examples", example_ids.shape[0])
+            timer.count("padded_tokens", input_ids.numel() - num_trimmed)
+            timer.count("trimmed_tokens", num_trimmed)
+            timer.count("tokens", int(batch["attention_mask"].sum()) if "attention_mask" in batch
+                        else input_ids.numel())
+        with timer.stage("extract"):
+            if CONTEXT_START_COL in batch:
+                answer_starts, answer_ends, span_scores = get_best_window_spans(
+                    start_logits, end_logits, batch[CONTEXT_START_COL], batch[CONTEXT_END_COL],
+                    top_k=span_top_k or DEFAULT_TOP_K, max_answer_length=max_answer_length)
+                extracted = (span_scores, _get_window_answers(
+                    batch, input_ids, answer_starts, answer_ends, span_scores))
+            elif span_top_k is not None:
+                extracted = find_best_spans(start_logits, end_logits, span_top_k, max_answer_length)
+            else:
+                extracted = (extract_answer(input_ids, start_logits, end_logits, tokenizer.pad_token_id),
+                             (torch.amax(start_logits, dim=-1) + torch.amax(end_logits, dim=-1)).tolist())
+        #  The batches are yielded after the stages, so that the time of the consumer is not measured
+        yield example_ids, batch, extracted
+
+
+def _decode_batch(
+        extracted_batch: Tuple[torch.Tensor, Dict[str, Any], Tuple[Any, ...]],
+        tokenizer: BartTokenizer,
+        input_ids_name: str,
+        span_top_k: Optional[int],
+        timer: StageTimer,
+        window_merger: WindowSpanMerger,
+        window_texts: Dict[int, Tuple[str, str]],
+        cleaning_pattern: re.Pattern
+) -> List[Tuple[int, Tuple[Tuple[str, str, str], Dict[str, Any]]]]:
+    """Helper function to decode the answers of a batch returned by `_get_extracted_batches`.
+    The windows of an example might be in several batches, so `window_merger` and `window_texts`
+    keep the best answers and the texts of the unfinished examples between the calls
+
+    Returns:
+        A list of the example indices and the outputs of the examples that are finished
+    """
+    example_ids, batch, extracted = extracted_batch
+    input_ids = batch[input_ids_name]
+    outputs = []
+    with timer.stage("decode"):
+        if CONTEXT_START_COL in batch:
+            span_scores, answers = extracted
+            window_texts.update(zip(example_ids.tolist(), zip(batch[QUESTION_COL], batch[CONTEXT_COL])))
+            for example_idx, scored_answer in window_merger.update(
+                    example_ids.tolist(), batch[NUM_WINDOWS_COL].tolist(), span_scores.tolist(), answers):
+                details = _get_details()
+                answer = None
+                if scored_answer is not None:
+                    details["score"], answer = scored_answer
+                    if isinstance(answer, tuple):
+                        answer, details["answer_start"], details["answer_end"] = answer
+                    else:
+                        answer = tokenizer.decode(answer, skip_special_tokens=True).strip()
+                if not answer:
+                    answer, details = "NA", _get_details()
+                outputs.append((example_idx, (window_texts.pop(example_idx) + (answer,), details)))
+            return outputs
         decoded_inputs = clean_decoded_batch(decode_bart_input(input_ids, tokenizer), cleaning_pattern)
-        decoded_answers = clean_decoded_batch(decode_bart_input(answers, tokenizer), cleaning_pattern)
-        for decoded_input, decoded_answer in zip(decoded_inputs, decoded_answers):
-            #  The length of `decoded_answer` might not be `1`. This can occur when the model predicts an answer
-            #  that contains tokens from both the question and the answer or only padding tokens.
-            #  Note that this behavior is normal, especially if truncation was used during tokenization.
-            if len(decoded_answer) != 1:
-                decoded_answer = ("NA",)
-            yield decoded_input + decoded_answer
-
-
-def main() -> None:
-    """Main function"""
-    args = get_qa_args()
-    model_name = "a-ware/bart-squadv2"
-    #  Load the `BartTokenizer` whose identifier is `model_name`
+        if span_top_k is not None:
+            decoded_answers, scores = _decode_best_spans(input_ids, *extracted, tokenizer)
+        else:
+            answers, scores = extracted
+            decoded_answers = clean_decoded_batch(decode_bart_input(answers, tokenizer), cleaning_pattern)
+    for example_idx, decoded_input, decoded_answer, score in zip(
+            example_ids.tolist(), decoded_inputs, decoded_answers, scores):
+        #  The length of `decoded_answer` might not be `1`. This can occur when the model predicts an answer
+        #  that contains tokens from both the question and the answer or only padding tokens.
+        #  Note that this behavior is normal, especially if truncation was used during tokenization.
+        if len(decoded_answer) != 1:
+            decoded_answer = ("NA",)
+            score = None
+        outputs.append((example_idx, (decoded_input + decoded_answer, _get_details(score))))
+    return outputs
+
+
+def _get_details(
+        score: Optional[float] = None,
+        answer_start: Optional[int] = None,
+        answer_end: Optional[int] = None
+) -> Dict[str, Any]:
+    """Helper function to create the details of a prediction"""
+    return {"score": score, "answer_start": answer_start, "answer_end": answer_end}
+
+
+def _get_window_answers(
+        batch: Dict[str, Any],
+        input_ids: torch.Tensor,
+        answer_starts: torch.Tensor,
+        answer_ends: torch.Tensor,
+        span_scores: torch.Tensor
+) -> List[Optional[Tuple[float, Union[Tuple[str, int, int], List[int]]]]]:
+    """Helper function to get the answers that correspond to the best spans of context windows
+    together with the span scores. If the batch contains offset mappings, the answers are sliced
+    from the contexts and returned with their character offsets. Otherwise, the answer token IDs
+    are returned. The answer is `None` if a window has no valid span
+    """
+    answers = []
+    for i, (answer_start, answer_end, span_score) in enumerate(
+            zip(answer_starts.tolist(), answer_ends.tolist(), span_scores.tolist())):
+        if span_score == float("-inf"):
+            answers.append(None)
+        elif OFFSET_MAPPING_COL in batch:
+            context = batch[CONTEXT_COL][i]
+            char_start, char_end = get_span_char_offsets(
+                context, batch[OFFSET_MAPPING_COL][i], answer_start, answer_end)
+            answers.append((span_score, (context[char_start:char_end], char_start, char_end)))
+        else:
+            answers.append((span_score, get_span_token_ids(input_ids[i], answer_start, answer_end).tolist()))
+    return answers
+
+
+def _decode_best_spans(
+        input_ids: torch.Tensor,
+        answer_starts: torch.Tensor,
+        answer_ends: torch.Tensor,
+        span_scores: torch.Tensor,
+        tokenizer: BartTokenizer
+) -> Tuple[Tuple[Tuple[str, ...], ...], List[float]]:
+    """Helper function to decode only the answer tokens of the best spans found by
+    `find_best_spans`. The decoded answers have the same structure as the output of
+    `clean_decoded_batch`: each answer is split at the separator tokens and only the
+    non-empty parts are kept. The span scores are also returned
+    """
+    decoded_answers = []
+    for seq_ids, answer_start, answer_end, span_score in zip(
+            input_ids, answer_starts[:, 0].tolist(), answer_ends[:, 0].tolist(), span_scores[:, 0].tolist()):
+        if span_score == float("-inf"):
+            decoded_answers.append(())
+            continue
+        answer_parts = [[]]
+        for token_id in get_span_token_ids(seq_ids, answer_start, answer_end).tolist():
+            if token_id == tokenizer.sep_token_id:
+                answer_parts.append([])
+            else:
+                answer_parts[-1].append(token_id)
+        decoded_answers.append(tuple(
+            decoded_part for answer_part in answer_parts
+            if (decoded_part := tokenizer.decode(answer_part, skip_special_tokens=True).strip())))
+    return tuple(decoded_answers), span_scores[:, 0].tolist()
+
+
+def load_model(
+        args: Namespace,
+        num_threads: Optional[int] = None
+) -> Tuple[BartTokenizer, Union[BartForQuestionAnswering, OnnxQAModel], torch.device]:
+    """Load the tokenizer and the QA model
+
+    Args:
+        args: The arguments returned by `get_qa_args`, or any arguments that contain
+            `--model-name` and the options added by `add_qa_inference_args`
+        num_threads: Optional. The number of threads used by the ONNX backend
+
+    Returns:
+        The tokenizer, the model and the device where the model should be run
+    """
+    device = torch.device(args.device) if args.device is not None else \
+        torch.device("cuda:0") if torch.cuda.is_available() else torch.device("cpu")
+    model_name = args.model_name
+    tokenizer_class = BartTokenizerFast if args.fast_tokenizer else BartTokenizer
+    #  Load the tokenizer whose identifier is `model_name`. Use the `tokenizer_class` class
     tokenizer = None
-    data_loader = tokenize_dataset(
-        dataset=args.dataset,
-        text_col_names=args.text_col_names,
-        tokenizer=tokenizer,
-        batch_size=args.batch_size,
-        max_seq_length=args.max_seq_length
-    )
-    #  Load the `BartForQuestionAnswering` model whose identifier is `model_name`
-    model = None
-    for triplet in get_predictions(model, data_loader, tokenizer):
-        print("\t".join(triplet), end="\n\n")
+    with report_peak_rss():
+        if args.onnx_model is not None:
+            model = OnnxQAModel(args.onnx_model, num_threads)
+            device = torch.device("cpu")
+        elif args.quantize == "int8":
+            model = load_quantized_model(model_name, args.quantized_model_dir)
+            #  Dynamically quantized models can only be run on the CPU
+            device = torch.device("cpu")
+        elif args.mmap_model:
+            model = load_mmap_model(BartForQuestionAnswering, model_name)
+        else:
+            #  Load the `BartForQuestionAnswering` model whose identifier is `model_name`
+            model = None
+    return tokenizer, model, device
+
+
+def get_answer_cache_model_id(args: Namespace) -> str:
+    """Get the model ID of the answer cache (see `AnswerCache`) from the QA arguments
+
+    Args:
+        args: The arguments returned by `get_qa_args`
+
+    Returns:
+        A string that contains the model identifier and every other setting that affects the answers.
+        Local checkpoints are identified by their path and their fingerprint (see `get_checkpoint_fingerprint`)
+    """
+    model_id = (f"{args.model_name} checkpoint={get_checkpoint_fingerprint(args.model_name)} "
+                f"quantize={args.quantize} onnx_model={args.onnx_model} bf16={args.bf16} "
+                f"fast_tokenizer={args.fast_tokenizer} doc_stride={args.doc_stride} "
+                f"offset_mapping={args.offset_mapping} span_top_k={args.span_top_k} "
+                f"max_answer_length={args.max_answer_length}")
+    if args.onnx_model is not None:
+        model_id += f" onnx_checkpoint={get_checkpoint_fingerprint(args.onnx_model)}"
+    if args.screening_model is not None:
+        model_id += (f" screening_model={args.screening_model}"
+                     f" screening_checkpoint={get_checkpoint_fingerprint(args.screening_model)}"
+                     f" screening_threshold={args.screening_threshold}"
+                     f" screening_position_offset={args.screening_position_offset}")
+    return model_id
+
+
+def _output_predictions(
+        predictions: Iterable[Tuple[Any, ...]],
+        dataset: Union[Dataset, IterableDataset],
+        args: Namespace
+) -> None:
+    """Helper function to print the predicted triplets or write them with a `ResultWriter`"""
+    if args.output is None:
+        for prediction in predictions:
+            print("\t".join(prediction[:3]), end="\n\n")
+        return
+    if args.id_col in get_column_names(dataset):
+        example_ids = (example[args.id_col] for example in dataset.select_columns([args.id_col]))
+        if args.grouped:
+            #  The ID column of grouped data contains the IDs of the questions
+            example_ids = chain.from_iterable(example_ids)
+    else:
+        example_ids = count()
+    with ResultWriter(args.output, args.output_format, args.output_compression) as writer:
+        for example_id, (_, _, answer, *details) in zip(example_ids, predictions):
+            #  Cached answers have no details
+            writer.write(get_record(example_id, answer, details[0] if details else None))
+
+
+def main(args: Optional[Namespace] = None) -> None:
+    """Main function
+
+    Args:
+        args: Optional. The arguments returned by `get_qa_args`. If not specified,
+            the command line arguments are parsed
+    """
+    if args is None:
+        args = get_qa_args()
+    dataset = load_jsonl_dataset(args.dataset, streaming=args.streaming)
+    num_threads = args.num_threads or torch.get_num_threads()
+    #  OpenMP thread pools do not survive forking, so the model of the workers is loaded with a single thread
+    torch.set_num_threads(1 if args.workers > 1 else num_threads)
+    tokenizer, model, device = load_model(args, num_threads)
+    cascade = None
+    if args.screening_model is not None:
+        cascade = ScreeningCascade(AutoModelForQuestionAnswering.from_pretrained(args.screening_model),
+                                   args.screening_threshold, position_offset=args.screening_position_offset)
+    tokenization_cache = TokenizationCache(args.tokenization_cache) if args.tokenization_cache else None
+    timer = StageTimer(enabled=args.timing is not None)
+
+    def predict(dataset: Dataset) -> Generator[Tuple[str, str, str], None, None]:
+        data_loader = tokenize_dataset(
+            dataset=dataset,
+            text_col_names=args.text_col_names,
+            tokenizer=tokenizer,
+            batch_size=args.batch_size,
+            max_seq_length=args.max_seq_length,
+            dynamic_padding=args.dynamic_padding,
+            doc_stride=args.doc_stride,
+            return_offsets_mapping=args.offset_mapping,
+            tokenization_cache=tokenization_cache,
+            max_tokens=args.max_tokens,
+            grouped=args.grouped
+        )
+        return get_predictions(model, data_loader, tokenizer, span_top_k=args.span_top_k,
+                               max_answer_length=args.max_answer_length, device=device,
+                               use_bf16=args.bf16, warmup=args.warmup,
+                               return_details=args.output is not None or args.retrieval_index is not None,
+                               timer=timer, prefetch_batches=args.prefetch or 0, cascade=cascade)
+
+    if args.workers > 1:
+        if device.type != "cpu":
+            raise ValueError("Sharded inference with several workers is only supported on the CPU")
+        #  The workers are forked after loading the model, so they share its weights
+        predict = partial(predict_sharded, predict, num_workers=args.workers, num_threads=num_threads)
+    if args.retrieval_index is not None:
+        #  The reader is only run on the best passages of each question
+        question_col, context_col = args.text_col_names
+        pairs = retrieve_passages(dataset, BM25Index.load(args.retrieval_index), question_col, context_col,
+                                  top_k=args.retrieval_top_k)
+        _output_predictions(select_best_answers(predict(pairs), pairs[QUESTION_IDX_COL]), dataset, args)
+    elif args.answer_cache is None:
+        _output_predictions(predict(dataset), dataset, args)
+    else:
+        with AnswerCache(args.answer_cache, get_answer_cache_model_id(args), tokenizer.name_or_path,
+                         args.max_seq_length, max_entries=args.answer_cache_size) as answer_cache:
+            _output_predictions(answer_cache.get_predictions(dataset, args.text_col_names, predict), dataset, args)
+            print(f"Answer cache statistics: {answer_cache.stats()}", file=sys.stderr)
+    if cascade is not None:
+        print(f"Cascade statistics: {cascade.stats()}", file=sys.stderr)
+    if args.timing is not None:
+        timing_report = json.dumps(timer.summary(), indent=2) + "\n" if args.timing == "json" \
+            else timer.to_prometheus()
+        if args.timing_output is None:
+            print(timing_report, end="", file=sys.stderr)
+        else:
+            with open(args.timing_output, "w", encoding="utf-8") as timing_file:
+                timing_file.write(timing_report)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+"""Vocabulary trimming of the BART QA model
+
+The token embedding table of `bart-squadv2` has about 50k rows, but a corpus
+of a given domain only uses a fraction of the vocabulary. `trim_vocabulary`
+scans a corpus with the tokenizer, keeps only the tokens that it uses, and
+saves a model whose embedding table only contains the rows of these tokens,
+together with a tokenizer whose vocabulary is remapped to the new token IDs.
+
+The tokenizer is a byte-level BPE tokenizer, so the tokens that the merges
+create on the way to a kept token (and the merges themselves) are also kept,
+as well as the single-byte tokens and the special tokens. The corpus is
+therefore tokenized into the same tokens as before, only their IDs are
+different, and the predicted answers are the same. Text outside the corpus
+can still be tokenized, but words whose tokens were removed are split into
+smaller tokens, which may change the answers.
+
+Usage:
+    python3 -m itk_transformer_nlp.vocab_trimming data/squad_sample.jsonl outputs/bart_trimmed
+"""
+
+import json
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from typing import Dict, List, Sequence, Set, Tuple, Union
+
+import torch
+from datasets import Dataset
+from transformers import BartForQuestionAnswering, BartTokenizer, BartTokenizerFast
+from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+
+from itk_transformer_nlp.cli_args import check_positive_int
+from itk_transformer_nlp.transformer_qa import load_jsonl_dataset
+
+#  The configuration values that are token IDs, so they are remapped as well
+TOKEN_ID_CONFIG_KEYS = ("pad_token_id", "bos_token_id", "eos_token_id", "decoder_start_token_id",
+                        "forced_bos_token_id", "forced_eos_token_id")
+
+
+def get_used_token_ids(
+        dataset: Dataset,
+        text_col_names: Sequence[str],
+        tokenizer: BartTokenizer,
+        batch_size: int = 1000
+) -> Set[int]:
+    """Get the IDs of the tokens that occur in a corpus
+
+    Args:
+        dataset: The corpus
+        text_col_names: The columns that contain the texts
+        tokenizer: A pre-trained BART tokenizer
+        batch_size: The number of texts that are tokenized together. Defaults to `1000`
+
+    Returns:
+        The set of the token IDs
+    """
+    used_token_ids = set()
+    for text_col_name in text_col_names:
+        texts = dataset[text_col_name]
+        for i in range(0, len(texts), batch_size):
+            for input_ids in tokenizer(texts[i:i + batch_size], add_special_tokens=False)["input_ids"]:
+                used_token_ids.update(input_ids)
+    return used_token_ids
+
+
+def get_trimmed_vocabulary(
+        vocab: Dict[str, int],
+        merges: List[Tuple[str, str]],
+        used_tokens: Set[str],
+        special_tokens: Sequence[str]
+) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Select the tokens and the merges of a byte-level BPE tokenizer that are kept
+
+    Args:
+        vocab: The vocabulary of the tokenizer
+        merges: The merges of the tokenizer in order of priority
+        used_tokens: The tokens that occur in the corpus
+        special_tokens: The special tokens of the tokenizer
+
+    Returns:
+        The kept tokens in the order of their original IDs and the kept merges in their original order
+    """
+    token_merges = {first + second: (first, second) for first, second in merges}
+    kept_tokens = set(special_tokens) | set(bytes_to_unicode().values())
+    tokens_to_add = list(used_tokens)
+    while tokens_to_add:
+        token = tokens_to_add.pop()
+        if token not in kept_tokens:
+            kept_tokens.add(token)
+            tokens_to_add.extend(token_merges.get(token, ()))
+    kept_merges = [merge for merge in merges if merge[0] + merge[1] in kept_tokens]
+    return sorted((token for token in kept_tokens if token in vocab), key=vocab.__getitem__), kept_merges
+
+
+def trim_embeddings(model: BartForQuestionAnswering, kept_token_ids: Sequence[int]) -> BartForQuestionAnswering:
+    """Keep only the rows of the token embedding table that belong to the kept tokens
+
+    Args:
+        model: A BART QA model
+        kept_token_ids: The original IDs of the kept tokens. The new ID of a token is its position here
+
+    Returns:
+        The model with the new embedding table, which is shared by the encoder and the decoder
+    """
+    old_embeddings = model.get_input_embeddings()
+    new_embeddings = torch.nn.Embedding(len(kept_token_ids), old_embeddings.embedding_dim,
+                                        padding_idx=model.config.pad_token_id)
+    with torch.no_grad():
+        new_embeddings.weight.copy_(old_embeddings.weight[torch.tensor(kept_token_ids)])
+    new_ids = {old_id: new_id for new_id, old_id in enumerate(kept_token_ids)}
+    for key in TOKEN_ID_CONFIG_KEYS:
+        token_id = getattr(model.config, key, None)
+        if token_id is not None:
+            setattr(model.config, key, new_ids[token_id])
+    new_embeddings.padding_idx = model.config.pad_token_id
+    model.set_input_embeddings(new_embeddings)
+    model.config.vocab_size = len(kept_token_ids)
+    return model
+
+
+def trim_vocabulary(
+        model: BartForQuestionAnswering,
+        tokenizer: BartTokenizer,
+        corpus: Dataset,
+        text_col_names: Sequence[str],
+        output_dir: Union[str, Path],
+        batch_size: int = 1000
+) -> Tuple[BartTokenizer, BartForQuestionAnswering]:
+    """Trim the vocabulary of a model and its tokenizer to the tokens of a corpus and save them
+
+    Args:
+        model: A BART QA model
+        tokenizer: Its tokenizer (the slow one, as the vocabulary and the merges are read from it)
+        corpus: The corpus that the model will be used on
+        text_col_names: The columns of the corpus that contain the texts
+        output_dir: The directory where the model and the tokenizer are saved. `BartTokenizerFast`
+            can also be loaded from here
+        batch_size: The number of texts that are tokenized together. Defaults to `1000`
+
+    Returns:
+        The trimmed tokenizer and model
+    """
+    output_dir = Path(output_dir)
+    used_tokens = set(tokenizer.convert_ids_to_tokens(sorted(
+        get_used_token_ids(corpus, text_col_names, tokenizer, batch_size))))
+    merges = sorted(tokenizer.bpe_ranks, key=tokenizer.bpe_ranks.__getitem__)
+    kept_tokens, kept_merges = get_trimmed_vocabulary(
+        tokenizer.encoder, merges, used_tokens, tokenizer.all_special_tokens)
+    model = trim_embeddings(model, [tokenizer.encoder[token] for token in kept_tokens])
+    model.save_pretrained(str(output_dir))
+    tokenizer.save_pretrained(str(output_dir))
+    #  The files of the original vocabulary are overwritten
+    (output_dir / "vocab.json").write_text(
+        json.dumps({token: i for i, token in enumerate(kept_tokens)}, ensure_ascii=False), encoding="utf-8")
+    (output_dir / "merges.txt").write_text(
+        "\n".join(["#version: 0.2"] + [" ".join(merge) for merge in kept_merges]) + "\n", encoding="utf-8")
+    (output_dir / "tokenizer.json").unlink(missing_ok=True)
+    #  The fast tokenizer is converted from the new files once, so that it is not converted at every load
+    BartTokenizerFast.from_pretrained(str(output_dir)).save_pretrained(str(output_dir))
+    return BartTokenizer.from_pretrained(str(output_dir)), model
+
+
+def get_embedding_size_mib(model: BartForQuestionAnswering) -> float:
+    """Get the size of the token embedding table in MiB"""
+    weight = model.get_input_embeddings().weight
+    return weight.numel() * weight.element_size() / 1024 ** 2
+
+
+def get_trimming_args() -> Namespace:
+    """Get command line arguments"""
+    parser = ArgumentParser(description="Trim the vocabulary of the QA model to the tokens of a corpus")
+    parser.add_argument("corpus", help="Path to the jsonlines corpus file")
+    parser.add_argument("output_dir", help="The directory where the trimmed model and tokenizer are saved. "
+                                           "Use it with the `--model-name` argument of the QA script")
+    parser.add_argument("--text-col-names", dest="text_col_names", nargs="+", default=["question", "context"],
+                        help="Names of the corpus columns that contain the texts. "
+                             "Defaults to `['question', 'context']`")
+    parser.add_argument("--model-name", dest="model_name", default="a-ware/bart-squadv2",
+                        help="The model identifier. Defaults to `a-ware/bart-squadv2`")
+    parser.add_argument("--batch-size", dest="batch_size", type=check_positive_int, default=1000,
+                        help="The number of texts that are tokenized together. Defaults to 1000")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Main function"""
+    args = get_trimming_args()
+    tokenizer = BartTokenizer.from_pretrained(args.model_name)
+    model = BartForQuestionAnswering.from_pretrained(args.model_name)
+    old_vocab_size, old_size = model.config.vocab_size, get_embedding_size_mib(model)
+    tokenizer, model = trim_vocabulary(model, tokenizer, load_jsonl_dataset(args.corpus), args.text_col_names,
+                                       args.output_dir, batch_size=args.batch_size)
+    print(f"Vocabulary size: {old_vocab_size} -> {model.config.vocab_size}, "
+          f"token embeddings: {old_size:.1f} MiB -> {get_embedding_size_mib(model):.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,15 @@ from setuptools import setup
 
 packages = ['itk_transformer_nlp']
 package_data = {'': ['*']}
-install_requires = ['datasets>=1.18.4,<2.0.0',
-                    'torch>=1.10.2,<2.0.0',
-                    'transformers>=4.17.0,<5.0.0']
+install_requires = ['datasets>=2.14.0,<3.0.0',
+                    'safetensors>=0.4.0',
+                    'scikit-learn>=1.0,<2.0',
+                    'torch>=2.1.0,<3.0.0',
+                    'transformers>=4.36.0,<5.0.0']
+
+extras_require = \
+{'onnx': ['onnx>=1.14.0,<2.0.0', 'onnxruntime>=1.16.0,<2.0.0'],
+ 'output': ['zstandard>=0.21.0', 'pyarrow>=12.0.0']}
 
 with open('README.md', 'r', encoding='utf-8') as readme:
     long_description = readme.read()
@@ -23,6 +29,7 @@ setup_kwargs = {
     'packages': packages,
     'package_data': package_data,
     'install_requires': install_requires,
+    'extras_require': extras_require,
     'python_requires': '>=3.9,<4.0',
 }
 
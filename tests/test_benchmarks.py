@@ -0,0 +1,24 @@
+"""A module for testing the offline micro-benchmarks"""
+
+import unittest
+from tempfile import TemporaryDirectory
+
+from itk_transformer_nlp.benchmarks import run_benchmarks
+
+
+class BenchmarksTest(unittest.TestCase):
+    """Test class for the offline micro-benchmarks"""
+
+    def test_run_benchmarks(self) -> None:
+        """Test that every benchmark is run with every setting without downloads"""
+        with TemporaryDirectory() as model_dir:
+            results = run_benchmarks([1, 2], [16], num_examples=4, repeats=1, model_dir=model_dir)
+        self.assertEqual(14, len(results))
+        results = {(result["name"], result["batch_size"]): result for result in results}
+        for name in ("tokenize_dataset[dynamic_padding]", "get_predictions", "fine_tune_for_classification[step]"):
+            self.assertNotIn("error", results[(name, 2)])
+            self.assertGreater(results[(name, 2)]["examples_per_second"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
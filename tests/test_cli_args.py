@@ -0,0 +1,54 @@
+"""A module for testing the command line arguments of the scripts"""
+
+import unittest
+from contextlib import redirect_stderr
+from io import StringIO
+
+from itk_transformer_nlp.cli_args import check_positive_int, get_qa_args, get_hucola_training_args
+from itk_transformer_nlp.import_benchmark import get_imported_heavy_modules
+
+
+class CliArgsTest(unittest.TestCase):
+    """Test class for parsing and validating command line arguments without heavy imports"""
+
+    def test_no_heavy_imports(self) -> None:
+        """Test that the arguments can be parsed without importing PyTorch, `transformers` or `datasets`"""
+        for module_name in ("itk_transformer_nlp.cli_args", "itk_transformer_nlp.__main__",
+                            "itk_transformer_nlp.download_dataset"):
+            with self.subTest(module_name=module_name):
+                self.assertEqual([], get_imported_heavy_modules(module_name))
+
+    def test_check_positive_int(self) -> None:
+        """Test the validation of positive integers"""
+        self.assertEqual(3, check_positive_int("3"))
+        with self.assertRaises(ValueError):
+            check_positive_int(0)
+
+    def test_get_qa_args(self) -> None:
+        """Test parsing and validating the QA arguments"""
+        args = get_qa_args(["data.jsonl", "--batch-size", "4", "--device", "cpu"])
+        self.assertEqual(("data.jsonl", 4, "cpu", 30), (args.dataset, args.batch_size, args.device,
+                                                        args.max_answer_length))
+        for invalid_args in (["data.jsonl", "--streaming", "--workers", "2"],
+                             ["data.jsonl", "--timing", "json", "--workers", "2"],
+                             ["data.jsonl", "--onnx-model", "model.onnx", "--quantize", "int8"],
+                             ["data.jsonl", "--mmap-model", "--quantize", "int8"],
+                             ["data.jsonl", "--grouped", "--doc-stride", "16"],
+                             ["data.jsonl", "--retrieval-index", "index", "--answer-cache", "cache.db"],
+                             ["data.jsonl", "--screening-model", "small", "--screening-threshold", "2"],
+                             ["data.jsonl", "--screening-model", "small", "--offset-mapping"],
+                             ["data.jsonl", "--screening-model", "small", "--screening-position-offset", "2"],
+                             ["data.jsonl", "--batch-size", "0"]):
+            with self.subTest(invalid_args=invalid_args), redirect_stderr(StringIO()), \
+                    self.assertRaises(SystemExit):
+                get_qa_args(invalid_args)
+
+    def test_get_hucola_training_args(self) -> None:
+        """Test parsing the CoLA arguments"""
+        self.assertEqual(1e-5, get_hucola_training_args(["--lr", "1e-5"]).lr)
+        with redirect_stderr(StringIO()), self.assertRaises(SystemExit):
+            get_hucola_training_args(["--lr", "1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
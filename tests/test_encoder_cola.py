@@ -43,6 +43,21 @@ class ColaTest(unittest.TestCase):
         self.assertEqual(len(data_point.keys()), 3)
         self.assertIsInstance(data_point["input_ids"], torch.Tensor)
 
+    def test_tokenize_single_sent_dataset_max_tokens(self) -> None:
+        """Test batching by the number of tokens"""
+        data_loader = tokenize_single_sent_dataset(
+            dataset=self._dataset,
+            text_col_name="sentence",
+            label_col_name="label",
+            tokenizer=self._tokenizer,
+            batch_size=2,
+            max_tokens=10
+        )
+        batches = list(data_loader)
+        self.assertEqual(2, len(batches))
+        self.assertTrue(torch.equal(torch.tensor([1]), batches[0]["label"]))
+        self.assertLessEqual(batches[0]["input_ids"].numel(), 10)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,56 @@
+"""A module for testing writing the solutions of a lab into its current file"""
+
+import unittest
+
+from itk_transformer_nlp.lab_solutions import get_changes, apply_changes
+
+EXERCISES = """def main():
+    #  Load the model
+    model = None
+    for _ in range(2):
+        #  Evaluate the model
+        score = None
+        print(score)
+    #  Evaluate the model
+    score = None
+    print(score)
+"""
+SOLUTIONS = EXERCISES.replace("model = None", "model = load()").replace("score = None", "score = evaluate(model)")
+
+
+class LabSolutionsTest(unittest.TestCase):
+    """Test class for replacing the changed lines of a lab file"""
+
+    def test_apply_changes(self) -> None:
+        """Test that moved, re-indented and repeated blanks are solved and restored"""
+        current = """def load_model():
+    #  Load the model
+    with context():
+        model = None
+    return model
+
+
+def main():
+    model = load_model()
+    for _ in range(2):
+        #  Evaluate the model
+        score = None
+        print(score)
+    #  Evaluate the model
+    score = None
+    print(score)
+"""
+        solved = apply_changes(current, get_changes(EXERCISES, SOLUTIONS))
+        self.assertIn("        model = load()\n", solved)
+        self.assertEqual(2, solved.count("score = evaluate(model)"))
+        self.assertNotIn("= None", solved)
+        self.assertEqual(current, apply_changes(solved, get_changes(SOLUTIONS, EXERCISES)))
+
+    def test_apply_changes_not_found(self) -> None:
+        """Test that an error is raised if a blank is not in the current file"""
+        with self.assertRaises(ValueError):
+            apply_changes("def main():\n    pass\n", get_changes(EXERCISES, SOLUTIONS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+"""A module for testing memory-mapped model loading"""
+
+import unittest
+from tempfile import TemporaryDirectory
+
+import torch
+from transformers import BartForQuestionAnswering, BertForSequenceClassification
+
+from itk_transformer_nlp.model_loading import get_safetensors_dir, load_mmap_model, SAFETENSORS_FILE_NAME
+from itk_transformer_nlp.tiny_models import create_tiny_bart, create_tiny_bert
+
+
+class ModelLoadingTest(unittest.TestCase):
+    """Test class for loading tiny, randomly initialized models memory-mapped"""
+
+    def test_load_mmap_model(self) -> None:
+        """Test that the memory-mapped model gives the same outputs as the original model"""
+        input_ids = torch.tensor([[0, 5, 6, 2, 2, 7, 8, 9, 2]])
+        with TemporaryDirectory() as model_dir, TemporaryDirectory() as cache_dir:
+            _, model = create_tiny_bart(model_dir)
+            mmap_model = load_mmap_model(BartForQuestionAnswering, model_dir, cache_dir)
+            self.assertTrue((get_safetensors_dir(model_dir, cache_dir) / SAFETENSORS_FILE_NAME).is_file())
+            self.assertFalse(any(param.is_meta for param in mmap_model.parameters()))
+            self.assertIs(mmap_model.model.shared.weight, mmap_model.model.encoder.embed_tokens.weight)
+            with torch.inference_mode():
+                self.assertTrue(torch.equal(model(input_ids=input_ids).start_logits,
+                                            mmap_model(input_ids=input_ids).start_logits))
+
+    def test_load_mmap_model_new_head(self) -> None:
+        """Test that a classifier head with a different number of classes is initialized"""
+        with TemporaryDirectory() as model_dir, TemporaryDirectory() as cache_dir:
+            _, model = create_tiny_bert(model_dir)
+            mmap_model = load_mmap_model(BertForSequenceClassification, model_dir, cache_dir, num_labels=3)
+        self.assertEqual((3, model.config.hidden_size), mmap_model.classifier.weight.shape)
+        self.assertFalse(mmap_model.classifier.weight.is_meta)
+        self.assertTrue(torch.equal(model.bert.pooler.dense.weight, mmap_model.bert.pooler.dense.weight))
+        self.assertTrue(torch.equal(model.bert.embeddings.position_ids, mmap_model.bert.embeddings.position_ids))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""A module for testing the ONNX Runtime backend of the QA model"""
+
+import importlib.util
+import unittest
+from tempfile import TemporaryDirectory
+
+import torch
+from datasets import Dataset
+
+from itk_transformer_nlp.onnx_backend import OnnxQAModel, export_onnx_model
+from itk_transformer_nlp.tiny_models import create_tiny_bart
+from itk_transformer_nlp.transformer_qa import tokenize_dataset, get_predictions
+
+
+@unittest.skipIf(importlib.util.find_spec("onnxruntime") is None or importlib.util.find_spec("onnx") is None,
+                 "`onnx` and `onnxruntime` are not installed")
+class OnnxBackendTest(unittest.TestCase):
+    """Test class for comparing the ONNX backend with PyTorch on a tiny, randomly initialized model"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Fixture setup: create a tiny model, export it and create a dummy dataset"""
+        cls._temp_dir = TemporaryDirectory()
+        cls._tokenizer, cls._model = create_tiny_bart(cls._temp_dir.name)
+        onnx_path = f"{cls._temp_dir.name}/model.onnx"
+        export_onnx_model(cls._model, onnx_path)
+        cls._onnx_model = OnnxQAModel(onnx_path, num_threads=1)
+        cls._dataset = Dataset.from_dict({
+            "question": ["Where is the river?", "How many days are there in a year?", "What is this?"],
+            "context": ["The river flows through the city in the north of the country.",
+                        "There are 365 days in a year.", "This is a sentence."]
+        })
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Fixture teardown: delete the model files"""
+        cls._temp_dir.cleanup()
+
+    def test_logits(self) -> None:
+        """Test that the logits are the same with dynamic batch and sequence sizes"""
+        for batch_size in (1, 3):
+            batch = self._tokenizer(self._dataset["question"][:batch_size], self._dataset["context"][:batch_size],
+                                    padding=True, return_tensors="pt")
+            model_inputs = {"input_ids": batch["input_ids"], "attention_mask": batch["attention_mask"]}
+            with torch.inference_mode():
+                expected_logits = self._model(**model_inputs, return_dict=False)[:2]
+            for expected, onnx_logits in zip(expected_logits, self._onnx_model(model_inputs)):
+                self.assertEqual(expected.shape, onnx_logits.shape)
+                self.assertTrue(torch.allclose(expected, onnx_logits, atol=1e-4))
+
+    def test_get_predictions(self) -> None:
+        """Test that the backend gives the same answers and scores as PyTorch"""
+        predictions = []
+        for model in (self._model, self._onnx_model):
+            data_loader = tokenize_dataset(self._dataset, ("question", "context"), self._tokenizer,
+                                           batch_size=2, max_seq_length=64, dynamic_padding=True)
+            predictions.append(list(get_predictions(model, data_loader, self._tokenizer, span_top_k=5,
+                                                    return_details=True)))
+        self.assertEqual(3, len(predictions[1]))
+        for expected, prediction in zip(*predictions):
+            self.assertEqual(expected[:3], prediction[:3])
+            if expected[3]["score"] is not None:
+                self.assertAlmostEqual(expected[3]["score"], prediction[3]["score"], places=4)
+
+
+if __name__ == "__main__":
+    unittest.main()
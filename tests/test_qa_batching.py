@@ -0,0 +1,82 @@
+"""A module for testing the QA batching utilities"""
+
+import unittest
+
+import torch
+
+from itk_transformer_nlp.qa_batching import (
+    LengthBucketBatchSampler,
+    TokenBudgetBatchSampler,
+    DynamicPaddingCollator,
+    pack_by_token_budget,
+    trim_padding,
+    restore_padding,
+    restore_order
+)
+
+
+class QABatchingTest(unittest.TestCase):
+    """Test class for length bucketing and dynamic padding"""
+
+    def test_length_bucket_batch_sampler(self) -> None:
+        """Test grouping examples of similar length"""
+        lengths = [10, 3, 7, 2, 9, 4]
+        batches = list(LengthBucketBatchSampler(lengths, batch_size=2))
+        self.assertEqual([[3, 1], [5, 2], [4, 0]], batches)
+        self.assertEqual(3, len(LengthBucketBatchSampler(lengths, batch_size=2)))
+
+    def test_pack_by_token_budget(self) -> None:
+        """Test packing items so that the padded batches fit the token budget"""
+        lengths = [3, 4, 2, 9, 1, 1, 1]
+        batches = list(pack_by_token_budget(range(len(lengths)), lengths.__getitem__, max_tokens=8))
+        self.assertEqual([[0, 1], [2], [3], [4, 5, 6]], batches)
+        batches = list(pack_by_token_budget(range(len(lengths)), lengths.__getitem__, max_tokens=8,
+                                            max_batch_size=2))
+        self.assertEqual([[0, 1], [2], [3], [4, 5], [6]], batches)
+
+    def test_token_budget_batch_sampler(self) -> None:
+        """Test packing examples of similar length"""
+        lengths = [10, 3, 7, 2, 9, 4]
+        batches = list(TokenBudgetBatchSampler(lengths, max_tokens=12))
+        self.assertEqual([[3, 1, 5], [2], [4], [0]], batches)
+        self.assertEqual(4, len(TokenBudgetBatchSampler(lengths, max_tokens=12)))
+        self.assertEqual([[0], [1, 2], [3, 4], [5]],
+                         list(TokenBudgetBatchSampler(lengths, max_tokens=18, sort_by_length=False)))
+
+    def test_dynamic_padding_collator(self) -> None:
+        """Test padding a batch to its longest sequence"""
+        features = [
+            {"input_ids": torch.tensor([0, 5, 2]), "attention_mask": torch.tensor([1, 1, 1]),
+             "example_idx": torch.tensor(1)},
+            {"input_ids": torch.tensor([0, 2]), "attention_mask": torch.tensor([1, 1]),
+             "example_idx": torch.tensor(0)}
+        ]
+        batch = DynamicPaddingCollator(pad_token_id=1)(features)
+        self.assertTrue(torch.equal(torch.tensor([[0, 5, 2], [0, 2, 1]]), batch["input_ids"]))
+        self.assertTrue(torch.equal(torch.tensor([[1, 1, 1], [1, 1, 0]]), batch["attention_mask"]))
+        self.assertTrue(torch.equal(torch.tensor([1, 0]), batch["example_idx"]))
+
+    def test_trim_padding(self) -> None:
+        """Test removing the padding columns and restoring the original width of the outputs"""
+        batch = {"input_ids": torch.tensor([[0, 5, 2, 1, 1], [0, 2, 1, 1, 1]]),
+                 "attention_mask": torch.tensor([[1, 1, 1, 0, 0], [1, 1, 0, 0, 0]]),
+                 "example_idx": torch.tensor([1, 0])}
+        trimmed_batch, num_trimmed = trim_padding(batch)
+        self.assertEqual(4, num_trimmed)
+        self.assertTrue(torch.equal(torch.tensor([[0, 5, 2], [0, 2, 1]]), trimmed_batch["input_ids"]))
+        self.assertTrue(torch.equal(batch["example_idx"], trimmed_batch["example_idx"]))
+        self.assertEqual(0, trim_padding(trimmed_batch)[1])
+        restored = restore_padding(torch.ones(2, 3), 5)
+        self.assertEqual((2, 5), restored.shape)
+        self.assertTrue(torch.equal(torch.argmax(torch.tensor([[1., 2., 3.]]), dim=-1),
+                                    torch.argmax(restore_padding(torch.tensor([[1., 2., 3.]]), 5), dim=-1)))
+        self.assertTrue(torch.isinf(restored[:, 3:]).all())
+
+    def test_restore_order(self) -> None:
+        """Test yielding items in the original order"""
+        indexed_items = [(2, "c"), (0, "a"), (3, "d"), (1, "b")]
+        self.assertEqual(["a", "b", "c", "d"], list(restore_order(indexed_items)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""A module for testing the QA answer cache"""
+
+import os
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from datasets import Dataset
+
+from itk_transformer_nlp.cli_args import get_qa_args
+from itk_transformer_nlp.qa_cache import AnswerCache
+from itk_transformer_nlp.transformer_qa import get_answer_cache_model_id
+
+
+class AnswerCacheTest(unittest.TestCase):
+    """Test class for the persistent answer cache"""
+
+    def setUp(self) -> None:
+        """Fixture setup: create a temporary directory for the cache"""
+        self._temp_dir = TemporaryDirectory()
+        self._cache_path = Path(self._temp_dir.name) / "answers.db"
+
+    def tearDown(self) -> None:
+        """Remove the temporary directory"""
+        self._temp_dir.cleanup()
+
+    def test_get_put(self) -> None:
+        """Test caching answers and counting hits and misses"""
+        with AnswerCache(self._cache_path, "model", "tokenizer", 64) as cache:
+            self.assertIsNone(cache.get("Why?", "Because."))
+            cache.put("Why?", "Because.", "Because.")
+            self.assertEqual("Because.", cache.get(" Why? ", "Because."))
+        with AnswerCache(self._cache_path, "model", "tokenizer", 64) as cache:
+            self.assertEqual("Because.", cache.get("Why?", "Because."))
+            self.assertEqual({"hits": 1, "misses": 0, "entries": 1}, cache.stats())
+        with AnswerCache(self._cache_path, "model", "tokenizer", 128) as cache:
+            self.assertIsNone(cache.get("Why?", "Because."))
+
+    def test_lru_eviction(self) -> None:
+        """Test that the least recently used answer is evicted"""
+        with AnswerCache(self._cache_path, "model", "tokenizer", 64, max_entries=2) as cache:
+            cache.put("q1", "c", "a1")
+            cache.put("q2", "c", "a2")
+            cache.get("q1", "c")
+            cache.put("q3", "c", "a3")
+            self.assertEqual(2, cache.stats()["entries"])
+            self.assertIsNone(cache.get("q2", "c"))
+            self.assertEqual("a1", cache.get("q1", "c"))
+
+    def test_get_predictions(self) -> None:
+        """Test that only the examples whose answers are not cached are predicted"""
+        dataset = Dataset.from_dict({"question": ["q1", "q2", "q3"], "context": ["c1", "c2", "c3"]})
+        predicted_questions = []
+
+        def predict(misses: Dataset):
+            predicted_questions.extend(misses["question"])
+            return ((question, context, "a") for question, context in zip(misses["question"], misses["context"]))
+
+        with AnswerCache(self._cache_path, "model", "tokenizer", 64) as cache:
+            cache.put("q2", "c2", "cached")
+            triplets = list(cache.get_predictions(dataset, ("question", "context"), predict))
+        self.assertEqual(["q1", "q3"], predicted_questions)
+        self.assertEqual([("q1", "c1", "a"), ("q2", "c2", "cached"), ("q3", "c3", "a")], triplets)
+
+    def test_get_answer_cache_model_id(self) -> None:
+        """Test that the options that affect the answers change the model ID"""
+        default_model_id = get_answer_cache_model_id(get_qa_args(["data.jsonl"]))
+        self.assertEqual(default_model_id, get_answer_cache_model_id(get_qa_args(["data.jsonl", "--prefetch", "2"])))
+        option_args = (["--fast-tokenizer"], ["--fast-tokenizer", "--offset-mapping"], ["--bf16"],
+                       ["--quantize", "int8"], ["--span-top-k", "5"], ["--max-answer-length", "10"],
+                       ["--model-name", "outputs/bart_trimmed"], ["--screening-model", "small"],
+                       ["--screening-model", "small", "--screening-position-offset", "1"])
+        model_ids = {default_model_id} | {get_answer_cache_model_id(get_qa_args(["data.jsonl"] + args))
+                                          for args in option_args}
+        self.assertEqual(len(option_args) + 1, len(model_ids))
+
+    def test_get_answer_cache_model_id_checkpoint(self) -> None:
+        """Test that the model ID of a local checkpoint changes if the checkpoint is saved again"""
+        model_dir = Path(self._temp_dir.name) / "model"
+        model_dir.mkdir()
+        (model_dir / "config.json").write_text('{"model_type": "bart"}', encoding="utf-8")
+        weight_path = model_dir / "model.safetensors"
+        weight_path.write_bytes(b"weights")
+        args = get_qa_args(["data.jsonl", "--model-name", str(model_dir)])
+        model_id = get_answer_cache_model_id(args)
+        self.assertEqual(model_id, get_answer_cache_model_id(args))
+        os.utime(weight_path, ns=(0, 0))
+        self.assertNotEqual(model_id, get_answer_cache_model_id(args))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""A module for testing cascade QA inference with a screening model"""
+
+import unittest
+from tempfile import TemporaryDirectory
+from typing import Any, List, Optional, Tuple
+
+import torch
+from datasets import Dataset
+from transformers import BartForQuestionAnswering, RobertaConfig, RobertaForQuestionAnswering
+
+from itk_transformer_nlp.qa_cascade import (
+    ScreeningCascade,
+    get_position_offset,
+    get_screening_confidence,
+    is_possibly_unanswerable
+)
+from itk_transformer_nlp.tiny_models import create_tiny_bart
+from itk_transformer_nlp.transformer_qa import tokenize_dataset, get_predictions
+
+
+class _SpanPointerModel(torch.nn.Module):
+    """A screening model that predicts the exact positions of a given token sequence, as
+    standard extractive models do. Examples that do not contain it get uniform logits
+    """
+
+    def __init__(self, answer_ids: List[int]) -> None:
+        super().__init__()
+        self.answer_ids = answer_ids
+        self.scale = torch.nn.Parameter(torch.tensor(20.))
+
+    def forward(self, input_ids: torch.Tensor, **_: Any) -> Tuple[torch.Tensor, torch.Tensor]:
+        start_logits, end_logits = torch.zeros(input_ids.shape), torch.zeros(input_ids.shape)
+        num_answer_tokens = len(self.answer_ids)
+        for i, seq_ids in enumerate(input_ids.tolist()):
+            for position in range(len(seq_ids) - num_answer_tokens + 1):
+                if seq_ids[position:position + num_answer_tokens] == self.answer_ids:
+                    start_logits[i, position] = 1.
+                    end_logits[i, position + num_answer_tokens - 1] = 1.
+        return start_logits * self.scale, end_logits * self.scale
+
+
+class CascadeTest(unittest.TestCase):
+    """Test class for routing examples from the screening model to the large model"""
+
+    def test_route(self) -> None:
+        """Test routing unconfident and possibly unanswerable examples"""
+        start_logits = torch.tensor([[0., 10., 0., 0.], [0., 10., 0., 0.], [10., 0., 0., 0.], [0., 1., 1., 1.]])
+        end_logits = torch.tensor([[0., 0., 10., 0.], [0., 10., 0., 0.], [10., 0., 0., 0.], [0., 1., 1., 1.]])
+        self.assertTrue(torch.equal(torch.tensor([False, False, True, False]),
+                                    is_possibly_unanswerable(start_logits, end_logits)))
+        self.assertLess(float(get_screening_confidence(start_logits, end_logits)[3]), 0.5)
+        cascade = ScreeningCascade(screening_model=None, threshold=0.5)
+        self.assertTrue(torch.equal(torch.tensor([False, False, True, True]), cascade.route(start_logits, end_logits)))
+        self.assertEqual({"examples": 4, "routed": 2, "routing_rate": 0.5}, cascade.stats())
+
+    def test_get_predictions(self) -> None:
+        """Test that only the routed examples get the answers of the large model"""
+        dataset = Dataset.from_dict({
+            "question": ["Where is the river?", "How many days are there in a year?", "What is this?"],
+            "context": ["The river flows through the city in the north of the country.",
+                        "There are 365 days in a year.", "This is a sentence."]
+        })
+        with TemporaryDirectory() as model_dir, TemporaryDirectory() as screening_model_dir:
+            tokenizer, model = create_tiny_bart(model_dir)
+            _, screening_model = create_tiny_bart(screening_model_dir, seed=0)
+
+        def predict(predict_model: BartForQuestionAnswering,
+                    cascade: Optional[ScreeningCascade] = None) -> List[Tuple[str, str, str]]:
+            data_loader = tokenize_dataset(dataset, ("question", "context"), tokenizer, batch_size=1,
+                                           max_seq_length=32, dynamic_padding=True)
+            return list(get_predictions(predict_model, data_loader, tokenizer, span_top_k=5, cascade=cascade))
+
+        large_predictions, screening_predictions = predict(model), predict(screening_model)
+        for threshold in (0., 1.):
+            with self.subTest(threshold=threshold):
+                cascade = ScreeningCascade(screening_model, threshold)
+                predictions = predict(model, cascade)
+                routed = [large_prediction == prediction != screening_prediction for prediction, large_prediction,
+                          screening_prediction in zip(predictions, large_predictions, screening_predictions)]
+                self.assertEqual(3, cascade.stats()["examples"])
+                self.assertGreaterEqual(cascade.stats()["routed"], sum(routed))
+                self.assertTrue(all(prediction in pair for prediction, pair in zip(
+                    predictions, zip(large_predictions, screening_predictions))))
+        self.assertEqual(large_predictions, predictions)
+
+    def test_get_position_offset(self) -> None:
+        """Test that only BART screening models are expected to follow the convention of `bart-squadv2`"""
+        with TemporaryDirectory() as model_dir:
+            _, model = create_tiny_bart(model_dir)
+        self.assertEqual(0, get_position_offset(model))
+        self.assertEqual(1, get_position_offset(RobertaForQuestionAnswering(RobertaConfig(
+            vocab_size=model.config.vocab_size, hidden_size=16, num_hidden_layers=1, num_attention_heads=2,
+            intermediate_size=32))))
+        self.assertEqual(1, ScreeningCascade(_SpanPointerModel([0])).position_offset)
+
+    def test_screened_answers(self) -> None:
+        """Test that the exact positions of a non-BART screening model are decoded correctly"""
+        dataset = Dataset.from_dict({
+            "question": ["How many days are there in a year?", "Where is the river?"],
+            "context": ["There are 365 days in a year.",
+                        "The river flows through the city in the north of the country."]
+        })
+        with TemporaryDirectory() as model_dir:
+            tokenizer, model = create_tiny_bart(model_dir)
+        cascade = ScreeningCascade(_SpanPointerModel(tokenizer("365", add_special_tokens=False)["input_ids"]))
+
+        def predict(predict_cascade: Optional[ScreeningCascade] = None) -> List[Tuple[str, str, str]]:
+            data_loader = tokenize_dataset(dataset, ("question", "context"), tokenizer, batch_size=2,
+                                           max_seq_length=32, dynamic_padding=True)
+            return list(get_predictions(model, data_loader, tokenizer, span_top_k=5, cascade=predict_cascade))
+
+        large_predictions, predictions = predict(), predict(cascade)
+        self.assertEqual({"examples": 2, "routed": 1, "routing_rate": 0.5}, cascade.stats())
+        self.assertEqual("365", predictions[0][2])
+        self.assertEqual(large_predictions[1], predictions[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""A module for testing shared-context tokenization of grouped questions"""
+
+import unittest
+from tempfile import TemporaryDirectory
+
+from datasets import Dataset
+from transformers import BartTokenizerFast
+
+from itk_transformer_nlp.qa_grouped import GroupBatchSampler
+from itk_transformer_nlp.tiny_models import create_tiny_bart
+from itk_transformer_nlp.transformer_qa import tokenize_dataset, get_predictions
+
+
+class GroupedQATest(unittest.TestCase):
+    """Test class for the grouped input format"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Fixture setup: create a tiny model and a grouped dataset with its flattened version"""
+        with TemporaryDirectory() as model_dir:
+            cls._tokenizer, cls._model = create_tiny_bart(model_dir)
+            cls._fast_tokenizer = BartTokenizerFast.from_pretrained(model_dir)
+        contexts = ["The river flows through the city in the north of the country.", "This is a sentence."]
+        questions = [["Where is the river?", "What flows through the city?", "Where is the city?"],
+                     ["What is this?"]]
+        cls._grouped_dataset = Dataset.from_dict({"question": questions, "context": contexts})
+        cls._dataset = Dataset.from_dict({
+            "question": [question for group in questions for question in group],
+            "context": [context for context, group in zip(contexts, questions) for _ in group]
+        })
+
+    def test_group_batch_sampler(self) -> None:
+        """Test that groups are not split unless they have more questions than the batch size"""
+        group_ids = [0, 0, 1, 1, 1, 2, 3, 3, 3, 3, 3]
+        self.assertEqual([[0, 1], [2, 3, 4, 5], [6, 7, 8, 9], [10]], list(GroupBatchSampler(group_ids, 4)))
+
+    def test_tokenize_grouped(self) -> None:
+        """Test that the grouped batches contain the same sequences as the flattened dataset"""
+        for max_seq_length in (64, 16):
+            with self.subTest(max_seq_length=max_seq_length):
+                batches = list(tokenize_dataset(self._grouped_dataset, ("question", "context"), self._tokenizer,
+                                                batch_size=3, max_seq_length=max_seq_length, grouped=True))
+                self.assertEqual([3, 1], [batch["input_ids"].shape[0] for batch in batches])
+                flat_batches = tokenize_dataset(self._dataset, ("question", "context"), self._tokenizer,
+                                                batch_size=3, max_seq_length=max_seq_length, dynamic_padding=True)
+                grouped_ids = [ids[mask.bool()].tolist() for batch in batches
+                               for ids, mask in zip(batch["input_ids"], batch["attention_mask"])]
+                flat_ids = {idx: ids[mask.bool()].tolist() for batch in flat_batches for idx, ids, mask
+                            in zip(batch["example_idx"].tolist(), batch["input_ids"], batch["attention_mask"])}
+                self.assertEqual([flat_ids[idx] for idx in range(len(flat_ids))], grouped_ids)
+
+    def test_truncation(self) -> None:
+        """Test that truncated grouped sequences are the same as those of the slow and the fast tokenizer"""
+        for tokenizer in (self._tokenizer, self._fast_tokenizer):
+            for max_seq_length in range(8, 24):
+                with self.subTest(tokenizer=type(tokenizer).__name__, max_seq_length=max_seq_length):
+                    batches = tokenize_dataset(self._grouped_dataset, ("question", "context"), tokenizer,
+                                               batch_size=3, max_seq_length=max_seq_length, grouped=True)
+                    grouped_ids = [ids[mask.bool()].tolist() for batch in batches
+                                   for ids, mask in zip(batch["input_ids"], batch["attention_mask"])]
+                    self.assertEqual(tokenizer(self._dataset["question"], self._dataset["context"],
+                                               truncation=True, max_length=max_seq_length)["input_ids"], grouped_ids)
+
+    def test_get_predictions(self) -> None:
+        """Test that the predictions of grouped questions are in the flattened order"""
+        data_loader = tokenize_dataset(self._grouped_dataset, ("question", "context"), self._tokenizer,
+                                       batch_size=1, max_seq_length=24, grouped=True)
+        flat_data_loader = tokenize_dataset(self._dataset, ("question", "context"), self._tokenizer,
+                                            batch_size=1, max_seq_length=24, dynamic_padding=True)
+        self.assertEqual(list(get_predictions(self._model, flat_data_loader, self._tokenizer, span_top_k=5)),
+                         list(get_predictions(self._model, data_loader, self._tokenizer, span_top_k=5)))
+
+    def test_invalid_options(self) -> None:
+        """Test that grouped questions cannot be split into windows"""
+        with self.assertRaises(ValueError):
+            tokenize_dataset(self._grouped_dataset, ("question", "context"), self._tokenizer, batch_size=2,
+                             max_seq_length=16, doc_stride=4, grouped=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""A module for testing the structured QA output"""
+
+import gzip
+import json
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pyarrow.parquet as pq
+
+from itk_transformer_nlp.qa_output import ResultWriter, get_record
+
+
+class ResultWriterTest(unittest.TestCase):
+    """Test class for the buffered result writer"""
+
+    def setUp(self) -> None:
+        """Fixture setup: create a temporary directory and some records"""
+        self._temp_dir = TemporaryDirectory()
+        self._records = [
+            get_record(1, "London", {"score": 3.5, "answer_start": 0, "answer_end": 6}),
+            get_record("b", "NA")
+        ]
+
+    def tearDown(self) -> None:
+        """Remove the temporary directory"""
+        self._temp_dir.cleanup()
+
+    def test_write_jsonl(self) -> None:
+        """Test writing gzip compressed JSON lines"""
+        path = Path(self._temp_dir.name) / "results.jsonl.gz"
+        with ResultWriter(path, compression="gzip", buffer_size=1) as writer:
+            for record in self._records:
+                writer.write(record)
+        with gzip.open(path, "rt", encoding="utf-8") as results:
+            self.assertEqual(self._records, [json.loads(line) for line in results])
+        self.assertEqual({"id": "1", "answer": "London", "answer_start": 0, "answer_end": 6, "score": 3.5},
+                         self._records[0])
+
+    def test_write_parquet(self) -> None:
+        """Test writing a Parquet file in several row groups"""
+        path = Path(self._temp_dir.name) / "results.parquet"
+        with ResultWriter(path, output_format="parquet", buffer_size=1) as writer:
+            for record in reversed(self._records):
+                writer.write(record)
+        parquet_file = pq.ParquetFile(path)
+        self.assertEqual(2, parquet_file.num_row_groups)
+        self.assertEqual(list(reversed(self._records)), parquet_file.read().to_pylist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""A module for testing the pipelined execution of the QA inference stages"""
+
+import threading
+import unittest
+from tempfile import TemporaryDirectory
+from typing import Generator
+
+from datasets import Dataset
+
+from itk_transformer_nlp.qa_pipeline import prefetch, map_in_background
+from itk_transformer_nlp.tiny_models import create_tiny_bart
+from itk_transformer_nlp.transformer_qa import tokenize_dataset, get_predictions
+
+
+def _failing_items() -> Generator[int, None, None]:
+    """Yield two items, then raise an error"""
+    yield from range(2)
+    raise RuntimeError("Failed to load")
+
+
+class PipelineTest(unittest.TestCase):
+    """Test class for the prefetching and background decoding"""
+
+    def test_prefetch(self) -> None:
+        """Test that the items are read in order in another thread and errors are re-raised"""
+        thread_ids = []
+
+        def items() -> Generator[int, None, None]:
+            for i in range(10):
+                thread_ids.append(threading.get_ident())
+                yield i
+
+        self.assertEqual(list(range(10)), list(prefetch(items(), buffer_size=3)))
+        self.assertNotIn(threading.get_ident(), thread_ids)
+        prefetched = prefetch(_failing_items(), buffer_size=1)
+        self.assertEqual([0, 1], [next(prefetched), next(prefetched)])
+        with self.assertRaises(RuntimeError):
+            next(prefetched)
+
+    def test_prefetch_close(self) -> None:
+        """Test that closing the generator stops the background thread"""
+        num_threads = threading.active_count()
+        prefetched = prefetch(iter(range(1000)), buffer_size=2)
+        self.assertEqual(0, next(prefetched))
+        prefetched.close()
+        self.assertEqual(num_threads, threading.active_count())
+
+    def test_map_in_background(self) -> None:
+        """Test that the results are returned in order and the function runs in another thread"""
+        results = list(map_in_background(lambda i: (i * 2, threading.get_ident()), range(10), buffer_size=2))
+        self.assertEqual([i * 2 for i in range(10)], [result for result, _ in results])
+        self.assertNotIn(threading.get_ident(), {thread_id for _, thread_id in results})
+
+    def test_get_predictions(self) -> None:
+        """Test that the pipelined predictions are the same as the sequential ones"""
+        dataset = Dataset.from_dict({
+            "question": ["Where is the river?", "How many days are there in a year?", "What is this?"],
+            "context": ["The river flows through the city in the north of the country.",
+                        "There are 365 days in a year.", "This is a sentence."]
+        })
+        predictions = []
+        with TemporaryDirectory() as model_dir:
+            tokenizer, model = create_tiny_bart(model_dir)
+        for prefetch_batches, doc_stride in ((0, None), (2, None), (0, 4), (2, 4)):
+            data_loader = tokenize_dataset(dataset, ("question", "context"), tokenizer, batch_size=1,
+                                           max_seq_length=24, dynamic_padding=True, doc_stride=doc_stride)
+            predictions.append(list(get_predictions(model, data_loader, tokenizer, span_top_k=5,
+                                                    return_details=True, prefetch_batches=prefetch_batches)))
+        self.assertEqual(3, len(predictions[0]))
+        self.assertEqual(predictions[0], predictions[1])
+        self.assertEqual(predictions[2], predictions[3])
+
+
+if __name__ == "__main__":
+    unittest.main()
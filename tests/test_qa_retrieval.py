@@ -0,0 +1,61 @@
+"""A module for testing BM25 passage retrieval"""
+
+import unittest
+from tempfile import TemporaryDirectory
+
+from datasets import Dataset
+
+from itk_transformer_nlp.qa_retrieval import (
+    BM25Index,
+    PASSAGE_ID_COL,
+    PASSAGE_TEXT_COL,
+    QUESTION_IDX_COL,
+    retrieve_passages,
+    select_best_answers
+)
+
+
+class RetrievalTest(unittest.TestCase):
+    """Test class for the BM25 index and the retrieval stage"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Fixture setup: index a small corpus"""
+        cls._index = BM25Index.build(Dataset.from_dict({
+            PASSAGE_ID_COL: ["a", "b", "c"],
+            PASSAGE_TEXT_COL: ["Budapest is the capital of Hungary.",
+                               "The Danube flows through Budapest and Vienna.",
+                               "Cats and dogs are pets."]
+        }))
+
+    def test_search(self) -> None:
+        """Test that the passages are ranked by BM25 and the saved index gives the same scores"""
+        results = self._index.search("Which river flows through Budapest?", top_k=3)
+        self.assertEqual([1, 0], [passage_idx for passage_idx, _ in results])
+        self.assertGreater(results[0][1], results[1][1])
+        self.assertEqual([], self._index.search("unknown words"))
+        with TemporaryDirectory() as index_dir:
+            self._index.save(index_dir)
+            self.assertEqual(results, BM25Index.load(index_dir).search("Which river flows through Budapest?", 3))
+
+    def test_retrieve_passages(self) -> None:
+        """Test creating the question-passage pairs"""
+        questions = Dataset.from_dict({"question": ["What is the capital of Hungary?", "What are pets?"]})
+        pairs = retrieve_passages(questions, self._index, top_k=2)
+        self.assertEqual([0, 0, 1], pairs[QUESTION_IDX_COL])
+        self.assertEqual(["a", "b", "c"], pairs[PASSAGE_ID_COL])
+        self.assertEqual("Budapest is the capital of Hungary.", pairs["context"][0])
+        empty_index = BM25Index.build(Dataset.from_dict({PASSAGE_ID_COL: [], PASSAGE_TEXT_COL: []}))
+        with self.assertRaises(ValueError):
+            retrieve_passages(questions, empty_index)
+
+    def test_select_best_answers(self) -> None:
+        """Test selecting the answer with the highest score for each question"""
+        predictions = [("q1", "c1", "NA", {"score": None}), ("q1", "c2", "a2", {"score": 0.5}),
+                       ("q1", "c3", "a3", {"score": 0.7}), ("q2", "c1", "NA", {"score": None})]
+        self.assertEqual(["a3", "NA"], [prediction[2] for prediction in
+                                        select_best_answers(predictions, [0, 0, 0, 1])])
+
+
+if __name__ == "__main__":
+    unittest.main()
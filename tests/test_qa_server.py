@@ -0,0 +1,73 @@
+"""A module for testing the micro-batching QA server"""
+
+import asyncio
+import json
+import unittest
+from typing import List, Sequence, Tuple
+
+from itk_transformer_nlp.qa_server import MicroBatcher, handle_connection
+
+
+def _predict_batch(examples: Sequence[Tuple[str, str]]) -> List[str]:
+    """Answer each question with the first word of its context"""
+    return [context.split()[0] for _, context in examples]
+
+
+class MicroBatcherTest(unittest.TestCase):
+    """Test class for the micro-batching QA server"""
+
+    def test_coalesce_requests(self) -> None:
+        """Test that concurrent requests are answered in batches of the maximal size"""
+
+        async def run_requests() -> List[str]:
+            batcher_task = asyncio.create_task(batcher.run())
+            answers = await asyncio.gather(*(batcher.submit("Q?", f"a{i} b") for i in range(5)))
+            batcher_task.cancel()
+            return answers
+
+        batcher = MicroBatcher(_predict_batch, max_batch_size=2, max_wait=1.)
+        self.assertEqual([f"a{i}" for i in range(5)], asyncio.run(run_requests()))
+        self.assertEqual((3, 5), (batcher.num_batches, batcher.num_examples))
+
+    def test_prediction_error(self) -> None:
+        """Test that prediction errors are passed to the requests"""
+
+        def fail(_: Sequence[Tuple[str, str]]) -> List[str]:
+            raise RuntimeError("Model error")
+
+        async def run_request() -> None:
+            batcher_task = asyncio.create_task(batcher.run())
+            try:
+                await batcher.submit("Q?", "C.")
+            finally:
+                batcher_task.cancel()
+
+        batcher = MicroBatcher(fail, max_batch_size=2, max_wait=0.)
+        with self.assertRaises(RuntimeError):
+            asyncio.run(run_request())
+
+    def test_handle_connection(self) -> None:
+        """Test answering line-delimited JSON requests over TCP"""
+
+        async def run_client() -> List[dict]:
+            batcher_task = asyncio.create_task(batcher.run())
+            server = await asyncio.start_server(lambda r, w: handle_connection(batcher, r, w), "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            requests = [{"id": 1, "question": "Q?", "context": "Yes it is."}, {"id": 2, "question": "Q?"}]
+            writer.write(b"".join(json.dumps(request).encode() + b"\n" for request in requests))
+            writer.write_eof()
+            responses = [json.loads(line) async for line in reader]
+            writer.close()
+            server.close()
+            batcher_task.cancel()
+            return responses
+
+        batcher = MicroBatcher(_predict_batch, max_batch_size=4, max_wait=0.01)
+        responses = sorted(asyncio.run(run_client()), key=lambda response: response["id"])
+        self.assertEqual({"id": 1, "answer": "Yes"}, responses[0])
+        self.assertIn("error", responses[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+"""A module for testing sharded QA inference"""
+
+import os
+import unittest
+from typing import List, Tuple
+
+from datasets import Dataset
+
+from itk_transformer_nlp.qa_sharding import get_shard_ranges, predict_sharded
+
+
+def _predict(dataset: Dataset) -> List[Tuple[str, int]]:
+    """Return the texts in upper case together with the process ID"""
+    return [(text.upper(), os.getpid()) for text in dataset["text"]]
+
+
+class ShardingTest(unittest.TestCase):
+    """Test class for sharded QA inference"""
+
+    def test_get_shard_ranges(self) -> None:
+        """Test splitting examples into contiguous shards"""
+        self.assertEqual([(0, 3), (3, 5), (5, 7)], get_shard_ranges(7, 3))
+        self.assertEqual([(0, 1), (1, 2)], get_shard_ranges(2, 4))
+        self.assertEqual([], get_shard_ranges(0, 2))
+
+    def test_predict_sharded(self) -> None:
+        """Test that predictions are made in worker processes and merged in input order"""
+        texts = [f"text {i}" for i in range(9)]
+        predictions = list(predict_sharded(_predict, Dataset.from_dict({"text": texts}), num_workers=3))
+        self.assertEqual([text.upper() for text in texts], [text for text, _ in predictions])
+        self.assertNotIn(os.getpid(), {pid for _, pid in predictions})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+"""A module for testing the answer span search"""
+
+import unittest
+
+import torch
+
+from itk_transformer_nlp.qa_spans import (
+    find_best_spans,
+    get_span_token_ids,
+    get_span_char_offsets,
+    get_span_text
+)
+
+
+class QASpansTest(unittest.TestCase):
+    """Test class for joint top-k span search"""
+
+    def test_find_best_spans(self) -> None:
+        """Test that the end of a span cannot precede its start"""
+        start_scores = torch.tensor([[0., 1., 0., 0., 5.], [0., 3., 0., 2., 0.]])
+        end_scores = torch.tensor([[0., 0., 4., 1., 0.], [0., 0., .5, 0., 2.]])
+        answer_starts, answer_ends, span_scores = find_best_spans(
+            start_scores, end_scores, top_k=3, n_best=2)
+        self.assertEqual((2, 2), tuple(span_scores.shape))
+        self.assertEqual([1, 2], answer_starts[0].tolist())
+        self.assertEqual([2, 2], answer_ends[0].tolist())
+        self.assertEqual([5., 4.], span_scores[0].tolist())
+        self.assertEqual([1, 3], answer_starts[1].tolist())
+        self.assertEqual([4, 4], answer_ends[1].tolist())
+
+    def test_find_best_spans_max_answer_length(self) -> None:
+        """Test that too long spans are not returned"""
+        start_scores = torch.tensor([[5., 0., 0., 1., 0.]])
+        end_scores = torch.tensor([[0., 0., 0., 0., 5.]])
+        answer_starts, answer_ends, _ = find_best_spans(
+            start_scores, end_scores, max_answer_length=2)
+        self.assertEqual((3, 4), (answer_starts.item(), answer_ends.item()))
+
+    def test_get_span_token_ids(self) -> None:
+        """Test that the answer tokens follow the predicted positions"""
+        input_ids = torch.tensor([0, 10, 11, 12, 2])
+        self.assertEqual([11, 12], get_span_token_ids(input_ids, 1, 2).tolist())
+
+    def test_get_span_text(self) -> None:
+        """Test slicing the answer from the context"""
+        context = "London is the capital."
+        offset_mapping = torch.tensor([[0, 0], [0, 6], [7, 9], [10, 13], [14, 22], [0, 0]])
+        self.assertEqual("London is", get_span_text(context, offset_mapping, 0, 1))
+
+    def test_get_span_char_offsets(self) -> None:
+        """Test that the character offsets do not include surrounding whitespaces"""
+        context = "London  is the capital."
+        offset_mapping = torch.tensor([[0, 0], [0, 6], [6, 10], [10, 14], [0, 0]])
+        self.assertEqual((8, 14), get_span_char_offsets(context, offset_mapping, 1, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+"""A module for testing the per-stage timing of QA inference"""
+
+import unittest
+
+from itk_transformer_nlp.qa_timing import StageTimer
+
+
+class StageTimerTest(unittest.TestCase):
+    """Test class for the stage timer"""
+
+    def test_summary(self) -> None:
+        """Test recording stage times and counters"""
+        timer = StageTimer()
+        with timer.stage("forward"):
+            sum(range(1000))
+        timer.count("examples", 2)
+        timer.count("tokens", 10)
+        timer.count("padded_tokens", 16)
+        summary = timer.summary()
+        self.assertEqual(1, summary["stages"]["forward"]["calls"])
+        self.assertGreater(summary["stages"]["forward"]["seconds"], 0)
+        self.assertEqual({"examples": 2, "tokens": 10, "padded_tokens": 16, "trimmed_tokens": 0}, summary["counts"])
+        self.assertAlmostEqual(1.6, summary["padded_tokens_per_second"] / summary["tokens_per_second"])
+        self.assertIn('itk_qa_stage_calls_total{stage="forward"} 1', timer.to_prometheus())
+        self.assertIn("itk_qa_examples_total 2", timer.to_prometheus())
+
+    def test_disabled(self) -> None:
+        """Test that a disabled timer does not record anything"""
+        timer = StageTimer(enabled=False)
+        with timer.stage("forward"):
+            pass
+        timer.count("examples", 2)
+        self.assertEqual(0, timer.summary()["stages"]["forward"]["calls"])
+        self.assertEqual(0, timer.summary()["counts"]["examples"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""A module for testing sliding-window QA"""
+
+import unittest
+
+import torch
+from transformers import BartTokenizer, BartTokenizerFast
+from datasets import Dataset
+
+from itk_transformer_nlp.qa_batching import EXAMPLE_IDX_COL
+from itk_transformer_nlp.qa_windows import (
+    NUM_WINDOWS_COL,
+    CONTEXT_START_COL,
+    CONTEXT_END_COL,
+    OFFSET_MAPPING_COL,
+    tokenize_windowed,
+    get_best_window_spans,
+    WindowSpanMerger
+)
+
+
+class QAWindowsTest(unittest.TestCase):
+    """Test class for functions related to sliding-window QA"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Fixture setup: get a tokenizer"""
+        cls.tokenizer = BartTokenizer.from_pretrained("a-ware/bart-squadv2")
+
+    def test_tokenize_windowed(self) -> None:
+        """Test splitting contexts into overlapping windows"""
+        dataset = Dataset.from_dict({
+            "question": ["What is the capital of England?", "Why?"],
+            "context": ["London is the capital of England. " * 10, "Because."]
+        })
+        max_seq_length, doc_stride = 32, 4
+        windows = tokenize_windowed(dataset, ("question", "context"), self.tokenizer,
+                                    batch_size=2, max_seq_length=max_seq_length, doc_stride=doc_stride)
+        self.assertEqual(windows[EXAMPLE_IDX_COL][-1], 1)
+        first_example_windows = windows.filter(lambda window: window[EXAMPLE_IDX_COL] == 0)
+        self.assertGreater(len(first_example_windows), 1)
+        self.assertEqual(len(first_example_windows), first_example_windows[NUM_WINDOWS_COL][0])
+        first_window, second_window = first_example_windows[0], first_example_windows[1]
+        self.assertLessEqual(len(first_window["input_ids"]), max_seq_length)
+        context_start, context_end = first_window[CONTEXT_START_COL], first_window[CONTEXT_END_COL]
+        self.assertEqual(first_window["input_ids"][context_end - doc_stride:context_end],
+                         second_window["input_ids"][context_start:context_start + doc_stride])
+
+    def test_tokenize_windowed_offsets(self) -> None:
+        """Test that the offset mappings point to the context tokens"""
+        tokenizer = BartTokenizerFast.from_pretrained("a-ware/bart-squadv2")
+        context = "London is the capital of England."
+        dataset = Dataset.from_dict({"question": ["What is the capital of England?"], "context": [context]})
+        window = tokenize_windowed(dataset, ("question", "context"), tokenizer, batch_size=1,
+                                   max_seq_length=64, doc_stride=0, return_offsets_mapping=True)[0]
+        context_start, context_end = window[CONTEXT_START_COL], window[CONTEXT_END_COL]
+        for token_id, (char_start, char_end) in zip(window["input_ids"][context_start:context_end],
+                                                    window[OFFSET_MAPPING_COL][context_start:context_end]):
+            self.assertEqual(tokenizer.decode(token_id).strip(), context[char_start:char_end])
+
+    def test_get_best_window_spans(self) -> None:
+        """Test finding the best spans within the context windows"""
+        start_scores = torch.tensor([[9., 0., 1., 3., 0., 0.], [0., 0., 0., 0., 1., 0.]])
+        end_scores = torch.tensor([[0., 0., 0., 2., 1., 9.], [0., 0., 5., 0., 0., 0.]])
+        answer_starts, answer_ends, span_scores = get_best_window_spans(
+            start_scores, end_scores, context_starts=torch.tensor([3, 3]), context_ends=torch.tensor([6, 6]))
+        self.assertEqual([3, 2], answer_starts.tolist())
+        self.assertEqual([3, 2], answer_ends.tolist())
+        self.assertEqual([5., 5.], span_scores.tolist())
+
+    def test_window_span_merger(self) -> None:
+        """Test selecting the best span of all windows"""
+        merger = WindowSpanMerger()
+        finished = list(merger.update([0, 0, 1], [3, 3, 1], [1., 2., float("-inf")], [[5], [6], None]))
+        self.assertEqual([(1, None)], finished)
+        finished = list(merger.update([0], [3], [1.5], [[7]]))
+        self.assertEqual([(0, [6])], finished)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+"""A module for testing the dynamic quantization of the QA model"""
+
+import os
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import torch
+from transformers import BartConfig, BartForQuestionAnswering
+
+from itk_transformer_nlp.quantization import get_quantized_model_path, load_quantized_model
+
+TINY_CONFIG = BartConfig(vocab_size=64, d_model=16, encoder_layers=1, decoder_layers=1,
+                         encoder_attention_heads=2, decoder_attention_heads=2,
+                         encoder_ffn_dim=32, decoder_ffn_dim=32, max_position_embeddings=32)
+
+
+class QuantizationTest(unittest.TestCase):
+    """Test class for quantizing and caching a tiny, randomly initialized model"""
+
+    def test_load_quantized_model(self) -> None:
+        """Test that the cached quantized weights give the same outputs"""
+        input_ids = torch.tensor([[0, 5, 6, 2, 2, 7, 8, 9, 2]])
+        with TemporaryDirectory() as model_dir, TemporaryDirectory() as cache_dir:
+            BartForQuestionAnswering(TINY_CONFIG).save_pretrained(model_dir)
+            model = load_quantized_model(model_dir, cache_dir)
+            self.assertTrue(get_quantized_model_path(model_dir, cache_dir).is_file())
+            self.assertNotIsInstance(model.model.encoder.layers[0].fc1, torch.nn.Linear)
+            cached_model = load_quantized_model(model_dir, cache_dir)
+            with torch.inference_mode():
+                self.assertTrue(torch.equal(model(input_ids=input_ids).start_logits,
+                                            cached_model(input_ids=input_ids).start_logits))
+
+    def test_get_quantized_model_path(self) -> None:
+        """Test that the cache path of a local checkpoint changes if the checkpoint is saved again"""
+        self.assertEqual("org--bart-qa-int8", get_quantized_model_path(
+            "org/bart-qa", "cache").name.split("-torch")[0])
+        with TemporaryDirectory() as model_dir:
+            BartForQuestionAnswering(TINY_CONFIG).save_pretrained(model_dir)
+            quantized_model_path = get_quantized_model_path(model_dir, "cache")
+            self.assertEqual(quantized_model_path, get_quantized_model_path(model_dir, "cache"))
+            for weight_path in Path(model_dir).glob("*.safetensors"):
+                os.utime(weight_path, ns=(0, 0))
+            self.assertNotEqual(quantized_model_path, get_quantized_model_path(model_dir, "cache"))
+
+
+if __name__ == "__main__":
+    unittest.main()
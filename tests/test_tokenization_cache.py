@@ -0,0 +1,85 @@
+"""A module for testing the tokenization cache"""
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List
+
+from datasets import Dataset
+from transformers import BartTokenizer, BartTokenizerFast, BertTokenizer
+
+from itk_transformer_nlp.tiny_models import create_tiny_bart
+from itk_transformer_nlp.tokenization_cache import TokenizationCache, get_tokenizer_fingerprint
+
+
+class TokenizationCacheTest(unittest.TestCase):
+    """Test class for the tokenization cache"""
+
+    def setUp(self) -> None:
+        """Fixture setup: create a temporary directory, a small tokenizer and a dataset"""
+        self._temp_dir = TemporaryDirectory()
+        vocab_path = Path(self._temp_dir.name) / "vocab.txt"
+        vocab_path.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "this", "is", "a", "test"]))
+        self._tokenizer = BertTokenizer(str(vocab_path))
+        self._dataset = Dataset.from_dict({"sentence": ["This is a test", "a test"]})
+        self._num_calls = 0
+
+    def tearDown(self) -> None:
+        """Remove the temporary directory"""
+        self._temp_dir.cleanup()
+
+    def _tokenize(self, dataset: Dataset, max_length: int) -> Dataset:
+        """Tokenize a dataset and count the calls"""
+        self._num_calls += 1
+
+        def tok_func(example: dict) -> dict:
+            return self._tokenizer(example["sentence"], truncation=True, max_length=max_length)
+
+        return dataset.map(tok_func, batched=True)
+
+    def _get_input_ids(self, cache: TokenizationCache, max_length: int) -> List[List[int]]:
+        """Get the input IDs of the dataset through the cache"""
+        return cache.get_or_tokenize(
+            self._dataset, self._tokenizer, lambda dataset: self._tokenize(dataset, max_length),
+            max_seq_length=max_length)["input_ids"]
+
+    def test_get_or_tokenize(self) -> None:
+        """Test that a tokenized dataset is only created once for the same settings"""
+        cache = TokenizationCache(Path(self._temp_dir.name) / "cache")
+        input_ids = self._get_input_ids(cache, 8)
+        self.assertEqual([[2, 5, 6, 7, 8, 3], [2, 7, 8, 3]], input_ids)
+        self.assertEqual(input_ids, self._get_input_ids(TokenizationCache(cache.cache_dir), 8))
+        self.assertEqual(1, self._num_calls)
+        self.assertEqual([[2, 5, 6, 3], [2, 7, 8, 3]], self._get_input_ids(cache, 4))
+        self.assertEqual(2, self._num_calls)
+        self.assertEqual((0, 2), (cache.hits, cache.misses))
+
+    def test_get_tokenizer_fingerprint(self) -> None:
+        """Test that the fingerprint does not depend on the maximal length but on the vocabulary"""
+        fingerprint = get_tokenizer_fingerprint(self._tokenizer)
+        self._tokenizer.model_max_length = 16
+        self.assertEqual(fingerprint, get_tokenizer_fingerprint(self._tokenizer))
+        self._tokenizer.add_tokens(["new"])
+        self.assertNotEqual(fingerprint, get_tokenizer_fingerprint(self._tokenizer))
+
+    def test_get_tokenizer_fingerprint_merges(self) -> None:
+        """Test that the fingerprint depends on the BPE merges if the vocabulary is the same"""
+        model_dir = Path(self._temp_dir.name) / "bart"
+        create_tiny_bart(model_dir)
+        merges_path = Path(self._temp_dir.name) / "merges.txt"
+        merges_path.write_text("\n".join((model_dir / "merges.txt").read_text(
+            encoding="utf-8").splitlines()[:-1]) + "\n", encoding="utf-8")
+        for tokenizer_class in (BartTokenizer, BartTokenizerFast):
+            with self.subTest(tokenizer_class=tokenizer_class.__name__):
+                tokenizer, trimmed_tokenizer = (
+                    tokenizer_class(vocab_file=str(model_dir / "vocab.json"), merges_file=str(path))
+                    for path in (model_dir / "merges.txt", merges_path))
+                fingerprint = get_tokenizer_fingerprint(tokenizer)
+                tokenizer("A test", truncation=True, max_length=4)
+                self.assertEqual(fingerprint, get_tokenizer_fingerprint(tokenizer))
+                self.assertEqual(tokenizer.get_vocab(), trimmed_tokenizer.get_vocab())
+                self.assertNotEqual(fingerprint, get_tokenizer_fingerprint(trimmed_tokenizer))
+
+
+if __name__ == "__main__":
+    unittest.main()
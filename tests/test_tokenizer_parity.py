@@ -0,0 +1,85 @@
+"""A module for testing that slow and fast tokenizers produce the same outputs"""
+
+import unittest
+from typing import Dict, List
+
+import torch
+from torch.utils.data import DataLoader
+from datasets import Dataset
+from transformers import (
+    BartTokenizer,
+    BartTokenizerFast,
+    BertTokenizer,
+    BertTokenizerFast
+)
+
+from itk_transformer_nlp.transformer_qa import tokenize_dataset
+from itk_transformer_nlp.encoder_cola import tokenize_single_sent_dataset
+
+
+def _collect_batches(data_loader: DataLoader) -> Dict[str, List[torch.Tensor]]:
+    """Helper function to collect the input IDs and attention masks of all batches"""
+    batches = list(data_loader)
+    return {key: [batch[key] for batch in batches] for key in ("input_ids", "attention_mask")}
+
+
+class TokenizerParityTest(unittest.TestCase):
+    """Test class for comparing slow and fast tokenizers"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Fixture setup: load slow and fast tokenizers and create dummy datasets"""
+        cls._bart_tokenizers = (BartTokenizer.from_pretrained("a-ware/bart-squadv2"),
+                                BartTokenizerFast.from_pretrained("a-ware/bart-squadv2"))
+        cls._bert_tokenizers = (BertTokenizer.from_pretrained("bert-base-uncased"),
+                                BertTokenizerFast.from_pretrained("bert-base-uncased"))
+        cls._qa_dataset = Dataset.from_dict({
+            "question": ["How old is the US president?", "How many days are there in a year?"],
+            "context": ["The US president is 79 years old.", "There are 365 days in a year."]
+        })
+        cls._cola_dataset = Dataset.from_dict({
+            "sentence": [
+                "This is a correct sentence.",
+                "This sentence correct is not."
+            ],
+            "id": [1, 2],
+            "label": [1, 0]
+        })
+
+    def _assert_same_batches(self, slow_loader: DataLoader, fast_loader: DataLoader) -> None:
+        """Helper method to check that two data loaders output the same tensors"""
+        slow_batches, fast_batches = _collect_batches(slow_loader), _collect_batches(fast_loader)
+        for key, slow_tensors in slow_batches.items():
+            self.assertEqual(len(slow_tensors), len(fast_batches[key]))
+            for slow_tensor, fast_tensor in zip(slow_tensors, fast_batches[key]):
+                self.assertTrue(torch.equal(slow_tensor, fast_tensor))
+
+    def test_tokenize_dataset_parity(self) -> None:
+        """Test QA dataset tokenization with slow and fast tokenizers"""
+        for kwargs in ({}, {"dynamic_padding": True}, {"doc_stride": 4}):
+            with self.subTest(**kwargs):
+                slow_loader, fast_loader = (tokenize_dataset(
+                    dataset=self._qa_dataset,
+                    text_col_names=("question", "context"),
+                    tokenizer=tokenizer,
+                    batch_size=2,
+                    max_seq_length=64,
+                    **kwargs
+                ) for tokenizer in self._bart_tokenizers)
+                self._assert_same_batches(slow_loader, fast_loader)
+
+    def test_tokenize_single_sent_dataset_parity(self) -> None:
+        """Test single sentence dataset tokenization with slow and fast tokenizers"""
+        slow_loader, fast_loader = (tokenize_single_sent_dataset(
+            dataset=self._cola_dataset,
+            text_col_name="sentence",
+            label_col_name="label",
+            tokenizer=tokenizer,
+            batch_size=2,
+            max_seq_length=16
+        ) for tokenizer in self._bert_tokenizers)
+        self._assert_same_batches(slow_loader, fast_loader)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,20 @@
 """A module for testing the question answering module"""
 
+import json
+import os
 import unittest
+from tempfile import TemporaryDirectory
 
 import torch
 from transformers import BartTokenizer
 from datasets import Dataset
 
 from itk_transformer_nlp.transformer_qa import (
+    load_jsonl_dataset,
     tokenize_dataset,
     extract_answer,
 )
+from itk_transformer_nlp.qa_batching import EXAMPLE_IDX_COL
 
 
 class QATest(unittest.TestCase):
@@ -41,6 +46,57 @@ class QATest(unittest.TestCase):
         self.assertIsInstance(data_point[self._input_ids_name], torch.Tensor)
         self.assertEqual(data_point[self._attn_mask_name].shape[0], 2)
 
+    def test_tokenize_dataset_dynamic_padding(self) -> None:
+        """Test dataset tokenization with length bucketing and dynamic padding"""
+        dataset = Dataset.from_dict({
+            "question": ["How old is the US president?", "Why?", "How many days are there in a year?"],
+            "context": ["The US president is 79 years old.", "Because.", "There are 365 days in a year."]
+        })
+        data_loader = tokenize_dataset(
+            dataset=dataset,
+            text_col_names=("question", "context"),
+            tokenizer=self.tokenizer,
+            batch_size=2,
+            max_seq_length=64,
+            dynamic_padding=True
+        )
+        data_points = list(data_loader)
+        self.assertEqual(2, len(data_points))
+        self.assertEqual([1, 0], data_points[0][EXAMPLE_IDX_COL].tolist())
+        for data_point in data_points:
+            attn_mask = data_point[self._attn_mask_name]
+            self.assertEqual(attn_mask.shape[1], torch.max(torch.sum(attn_mask, dim=-1)).item())
+
+    def test_tokenize_dataset_streaming(self) -> None:
+        """Test lazy tokenization of a streamed jsonlines file"""
+        examples = [
+            {"id": "a", "question": "How old is the US president?", "context": "The US president is 79 years old."},
+            {"id": "b", "question": "Why?", "context": "Because."},
+            {"id": "c", "question": "How many days are there in a year?", "context": "There are 365 days in a year."}
+        ]
+        with TemporaryDirectory() as data_dir:
+            dataset_path = os.path.join(data_dir, "dataset.jsonl")
+            with open(dataset_path, "w", encoding="utf-8") as dataset_file:
+                dataset_file.writelines(json.dumps(example) + "\n" for example in examples)
+            dataset = load_jsonl_dataset(dataset_path, streaming=True)
+            for settings in ({}, {"doc_stride": 4}, {"max_tokens": 64}):
+                with self.subTest(**settings):
+                    data_loader = tokenize_dataset(
+                        dataset=dataset,
+                        text_col_names=("question", "context"),
+                        tokenizer=self.tokenizer,
+                        batch_size=2,
+                        max_seq_length=64,
+                        **settings
+                    )
+                    data_points = list(data_loader)
+                    self.assertEqual([0, 1, 2], [example_idx for data_point in data_points
+                                                 for example_idx in data_point[EXAMPLE_IDX_COL].tolist()])
+                    for data_point in data_points:
+                        self.assertNotIn("id", data_point)
+                        attn_mask = data_point[self._attn_mask_name]
+                        self.assertEqual(attn_mask.shape[1], torch.max(torch.sum(attn_mask, dim=-1)).item())
+
     def test_extract_answers(self) -> None:
         """Test extracting an answer from input token IDs"""
         text = ("What is the capital of England?", "London is the capital of England.")
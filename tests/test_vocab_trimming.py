@@ -0,0 +1,57 @@
+"""A module for testing the vocabulary trimming of the QA model"""
+
+import unittest
+from tempfile import TemporaryDirectory
+
+from datasets import Dataset
+from transformers import BartForQuestionAnswering, BartTokenizer, BartTokenizerFast
+
+from itk_transformer_nlp.tiny_models import create_tiny_bart
+from itk_transformer_nlp.transformer_qa import tokenize_dataset, get_predictions
+from itk_transformer_nlp.vocab_trimming import get_trimmed_vocabulary, trim_vocabulary
+
+
+class VocabTrimmingTest(unittest.TestCase):
+    """Test class for trimming the vocabulary"""
+
+    def test_get_trimmed_vocabulary(self) -> None:
+        """Test that the tokens created by the merges of a used token are kept"""
+        vocab = {"<s>": 0, "a": 1, "b": 2, "c": 3, "ab": 4, "abc": 5, "bc": 6}
+        merges = [("a", "b"), ("ab", "c"), ("b", "c")]
+        kept_tokens, kept_merges = get_trimmed_vocabulary(vocab, merges, {"abc"}, ["<s>"])
+        self.assertEqual(["<s>", "a", "b", "c", "ab", "abc"], kept_tokens)
+        self.assertEqual([("a", "b"), ("ab", "c")], kept_merges)
+
+    def test_trim_vocabulary(self) -> None:
+        """Test that the trimmed model gives the same answers on the corpus"""
+        dataset = Dataset.from_dict({
+            "question": ["Where is the river?", "How many days are there in a year?", "What is this?"],
+            "context": ["The river flows through the city in the north of the country.",
+                        "There are 365 days in a year.", "This is a sentence."]
+        })
+        with TemporaryDirectory() as model_dir, TemporaryDirectory() as trimmed_model_dir:
+            tokenizer, model = create_tiny_bart(model_dir)
+            old_vocab_size = model.config.vocab_size
+            trimmed_tokenizer, trimmed_model = trim_vocabulary(
+                model, tokenizer, dataset, ("question", "context"), trimmed_model_dir)
+            self.assertLess(trimmed_model.config.vocab_size, old_vocab_size)
+            self.assertEqual(len(trimmed_tokenizer), trimmed_model.config.vocab_size)
+            for tokenizer_class in (BartTokenizer, BartTokenizerFast):
+                with self.subTest(tokenizer_class=tokenizer_class.__name__):
+                    old_tokenizer = tokenizer_class.from_pretrained(model_dir)
+                    new_tokenizer = tokenizer_class.from_pretrained(trimmed_model_dir)
+                    old_model = BartForQuestionAnswering.from_pretrained(model_dir).eval()
+                    new_model = BartForQuestionAnswering.from_pretrained(trimmed_model_dir).eval()
+                    self.assertEqual(old_tokenizer.tokenize(dataset["context"][0]),
+                                     new_tokenizer.tokenize(dataset["context"][0]))
+                    predictions = []
+                    for predict_tokenizer, predict_model in ((old_tokenizer, old_model), (new_tokenizer, new_model)):
+                        data_loader = tokenize_dataset(dataset, ("question", "context"), predict_tokenizer,
+                                                       batch_size=2, max_seq_length=32, dynamic_padding=True)
+                        predictions.append(list(get_predictions(predict_model, data_loader, predict_tokenizer,
+                                                                span_top_k=5)))
+                    self.assertEqual(predictions[0], predictions[1])
+
+
+if __name__ == "__main__":
+    unittest.main()